@@ -1,11 +1,23 @@
 """NiceLabel API Server"""
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+import argparse
+import gzip
+import hashlib
 import logging
 import os
 import json
+import math
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import asdict, is_dataclass
 from pathlib import Path
 
+# Gör projektroten importerbar när skriptet körs direkt (python api/...)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
 app = Flask(__name__)
 
 # Konfigurera loggning
@@ -53,26 +65,315 @@ def load_mock_data():
 # Ladda mock-data
 MOCK_DATA = load_mock_data()
 
+# Etikettdata ändras sällan, klienter får cacha och validera med ETag
+CACHE_MAX_AGE = int(os.getenv('LABEL_API_CACHE_MAX_AGE', '300'))
+
+# Mindre svar än så komprimeras inte
+GZIP_MIN_SIZE = 512
+
+# Max antal etiketter i ett bulkanrop
+MAX_BULK_IDS = 1000
+
+class CachedBody:
+    """Färdigserialiserat svar med ETag och gzip-version"""
+    
+    def __init__(self, data):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+        self.gzipped = gzip.compress(self.body, 6) if len(self.body) >= GZIP_MIN_SIZE else None
+
+class LabelIndex:
+    """Uppslagstabeller som byggs en gång när datan laddas
+    
+    Varje svar serialiseras, hashas och komprimeras i förväg, så en
+    förfrågan kostar bara ett dict-uppslag.
+    """
+    
+    def __init__(self, data):
+        self.labels = {}
+        self.customer_of = {}
+        for customer_id, labels in data.get("labels", {}).items():
+            for label in labels:
+                self.labels[str(label["id"])] = label
+                self.customer_of[str(label["id"])] = customer_id
+                
+        self.customers_body = CachedBody(data.get("customers", []))
+        self.customer_label_bodies = {
+            customer_id: CachedBody(labels)
+            for customer_id, labels in data.get("labels", {}).items()
+        }
+        self.label_bodies = {label_id: CachedBody(label) for label_id, label in self.labels.items()}
+        self.all_labels_body = CachedBody({
+            "labels": self.labels, "customer_ids": self.customer_of, "missing": []
+        })
+        self.empty_list_body = CachedBody([])
+
+LABEL_INDEX = LabelIndex(MOCK_DATA)
+
+def reload_data():
+    """Läs om datan och byt ut indexet i ett steg"""
+    global MOCK_DATA, LABEL_INDEX
+    data = load_mock_data()
+    index = LabelIndex(data)
+    MOCK_DATA, LABEL_INDEX = data, index
+    logger.info(f"Etikettindex laddat: {len(index.labels)} etiketter")
+
+def accepts_gzip() -> bool:
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+def cached_response(cached: CachedBody) -> Response:
+    """Svara med ETag, Cache-Control och gzip, eller 304 om klienten har aktuell version"""
+    if cached.etag in request.if_none_match:
+        response = Response(status=304)
+    elif cached.gzipped is not None and accepts_gzip():
+        response = Response(cached.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(cached.body, mimetype='application/json')
+    response.set_etag(cached.etag)
+    response.headers['Cache-Control'] = f'public, max-age={CACHE_MAX_AGE}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def json_response(data) -> Response:
+    """Svara med JSON som komprimeras om det lönar sig"""
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    response = Response(body, mimetype='application/json')
+    if len(body) >= GZIP_MIN_SIZE and accepts_gzip():
+        response.set_data(gzip.compress(body, 6))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
     """Hämta alla kunder"""
-    return jsonify(MOCK_DATA["customers"])
+    return cached_response(LABEL_INDEX.customers_body)
 
 @app.route('/api/customers/<customer_id>/labels', methods=['GET'])
 def get_customer_labels(customer_id):
     """Hämta etiketter för en specifik kund"""
-    if customer_id in MOCK_DATA["labels"]:
-        return jsonify(MOCK_DATA["labels"][customer_id])
-    return jsonify([])
+    index = LABEL_INDEX
+    return cached_response(index.customer_label_bodies.get(customer_id, index.empty_list_body))
 
 @app.route('/api/labels/<label_id>', methods=['GET'])
 def get_label_data(label_id):
     """Hämta data för en specifik etikett"""
-    for labels in MOCK_DATA["labels"].values():
-        for label in labels:
-            if label["id"] == label_id:
-                return jsonify(label)
-    return jsonify({"error": "Label not found"}), 404
+    cached = LABEL_INDEX.label_bodies.get(label_id)
+    if cached is None:
+        return jsonify({"error": "Label not found"}), 404
+    return cached_response(cached)
+
+@app.route('/api/labels', methods=['GET'])
+@app.route('/api/labels/batch', methods=['POST'])
+def get_labels():
+    """Hämta flera etiketter i ett anrop
+    
+    GET /api/labels?ids=101,102 eller POST /api/labels/batch med {"ids": [...]}.
+    Saknade id:n listas i "missing" i stället för att ge 404, och
+    "customer_ids" anger kund per etikett. GET utan ids ger hela katalogen.
+    """
+    if request.method == 'POST':
+        ids = (request.get_json(silent=True) or {}).get("ids", [])
+    elif "ids" not in request.args:
+        return cached_response(LABEL_INDEX.all_labels_body)
+    else:
+        ids = [i for i in request.args.get("ids", "").split(",") if i]
+        
+    if len(ids) > MAX_BULK_IDS:
+        return jsonify({"error": f"Max {MAX_BULK_IDS} ids per request"}), 400
+        
+    index = LABEL_INDEX
+    found = {}
+    customer_ids = {}
+    missing = []
+    for label_id in map(str, ids):
+        if label_id in index.labels:
+            found[label_id] = index.labels[label_id]
+            customer_ids[label_id] = index.customer_of[label_id]
+        else:
+            missing.append(label_id)
+    return json_response({"labels": found, "customer_ids": customer_ids, "missing": missing})
+
+# Max antal inspektioner och idempotensnycklar som hålls i minnet, de äldsta släpps först
+MAX_STORED_INSPECTIONS = int(os.getenv('LABEL_API_MAX_INSPECTIONS', '10000'))
+MAX_SEEN_INSPECTION_KEYS = int(os.getenv('LABEL_API_MAX_INSPECTION_KEYS', '100000'))
+
+# Mottagna inspektioner och deras idempotensnycklar
+INSPECTIONS = deque(maxlen=MAX_STORED_INSPECTIONS)
+SEEN_INSPECTION_KEYS = OrderedDict()
+INSPECTIONS_LOCK = threading.Lock()
+
+def store_inspection(inspection):
+    """Spara en inspektion om dess idempotensnyckel inte setts tidigare
+    
+    Nycklarna minns bara för de senaste MAX_SEEN_INSPECTION_KEYS
+    inspektionerna, vilket räcker för klienternas omsändningar.
+    """
+    key = inspection.get("idempotency_key")
+    with INSPECTIONS_LOCK:
+        if key is not None and key in SEEN_INSPECTION_KEYS:
+            SEEN_INSPECTION_KEYS.move_to_end(key)
+            return False
+        if key is not None:
+            SEEN_INSPECTION_KEYS[key] = True
+            while len(SEEN_INSPECTION_KEYS) > MAX_SEEN_INSPECTION_KEYS:
+                SEEN_INSPECTION_KEYS.popitem(last=False)
+        INSPECTIONS.append(inspection)
+        return True
+
+@app.route('/api/inspections', methods=['POST'])
+def report_inspection():
+    """Ta emot en inspektionsrapport"""
+    inspection = request.get_json(silent=True) or {}
+    stored = store_inspection(inspection)
+    return jsonify({"accepted": 1 if stored else 0, "duplicates": 0 if stored else 1})
+
+@app.route('/api/inspections/batch', methods=['POST'])
+def report_inspections():
+    """Ta emot flera inspektionsrapporter, dubbletter ignoreras"""
+    payload = request.get_json(silent=True) or {}
+    accepted = sum(1 for inspection in payload.get("inspections", []) if store_inspection(inspection))
+    duplicates = len(payload.get("inspections", [])) - accepted
+    return jsonify({"accepted": accepted, "duplicates": duplicates})
+
+# Inspektionstjänsten startas bara när servern körs som inferensserver
+INSPECTION_SERVICE = None
+
+# Standarddeadline för /inspect om klienten inte anger någon
+DEFAULT_INSPECT_TIMEOUT_MS = 2000
+
+def set_inspection_service(service):
+    """Ange tjänsten som hanterar /inspect"""
+    global INSPECTION_SERVICE
+    INSPECTION_SERVICE = service
+
+def decode_image(req) -> "np.ndarray":
+    """Avkoda bilden i en förfrågan
+    
+    Stöder JPEG/PNG som request body eller multipart-fältet 'image', samt
+    råa pixlar (application/octet-stream) med formen i X-Image-Shape,
+    t.ex. "480,640,3", och valfri X-Image-Dtype (standard uint8).
+    """
+    # Bildbiblioteken behövs bara för /inspect, inte för etikett-API:t
+    import cv2
+    import numpy as np
+    
+    if 'image' in req.files:
+        data = req.files['image'].read()
+    else:
+        data = req.get_data()
+    if not data:
+        raise ValueError("Ingen bild i förfrågan")
+        
+    if req.mimetype == 'application/octet-stream':
+        shape_header = req.headers.get('X-Image-Shape')
+        if not shape_header:
+            raise ValueError("X-Image-Shape krävs för råa bilder")
+        try:
+            shape = tuple(int(v) for v in shape_header.split(','))
+            dtype = np.dtype(req.headers.get('X-Image-Dtype', 'uint8'))
+        except (TypeError, ValueError):
+            raise ValueError("Ogiltig X-Image-Shape eller X-Image-Dtype")
+        if dtype.hasobject:
+            raise ValueError("Ogiltig X-Image-Dtype")
+        # frombuffer ger en skrivskyddad vy av förfrågans byte
+        return np.frombuffer(data, dtype=dtype).reshape(shape).copy()
+        
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Kunde inte avkoda bilden")
+    return image
+
+@app.route('/inspect', methods=['POST'])
+@app.route('/api/inspect', methods=['POST'])
+def inspect():
+    """Inspektera en bild
+    
+    Deadline i millisekunder anges med X-Deadline-Ms eller ?timeout_ms=.
+    """
+    service = INSPECTION_SERVICE
+    if service is None:
+        return jsonify({"error": "Inspection service not running"}), 503
+    from api.inspection_service import DeadlineExceeded, QueueFull
+        
+    try:
+        image = decode_image(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+        
+    try:
+        timeout_ms = float(request.headers.get('X-Deadline-Ms',
+                                               request.args.get('timeout_ms', DEFAULT_INSPECT_TIMEOUT_MS)))
+    except ValueError:
+        timeout_ms = float('nan')
+    if not math.isfinite(timeout_ms) or timeout_ms <= 0:
+        return jsonify({"error": "Ogiltig X-Deadline-Ms"}), 400
+        
+    try:
+        result = service.inspect_sync(image, timeout_ms)
+    except QueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    except (DeadlineExceeded, FutureTimeout) as e:
+        return jsonify({"error": str(e) or "Deadline exceeded"}), 504
+    except Exception as e:
+        logger.error(f"Fel vid inspektion: {e}")
+        return jsonify({"error": str(e)}), 500
+        
+    return json_response(asdict(result) if is_dataclass(result) else result)
+
+@app.route('/inspect/metrics', methods=['GET'])
+@app.route('/api/inspect/metrics', methods=['GET'])
+def inspect_metrics():
+    """Ködjup och batchstatistik för inspektionstjänsten"""
+    if INSPECTION_SERVICE is None:
+        return jsonify({"error": "Inspection service not running"}), 503
+    return jsonify(INSPECTION_SERVICE.metrics())
+
+def serve(host: str = '0.0.0.0', port: int = 5000, threads: int = 16, dev: bool = False,
+          inspect_workers: int = 0, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+    """Starta servern
+    
+    Med inspect_workers > 0 laddas VisionSystem och /inspect aktiveras,
+    med ett eget VisionSystem för batchtråden och för varje arbetstråd.
+    
+    Använder waitress (flertrådad WSGI-server) om den finns installerad,
+    annars Flasks utvecklingsserver med trådar. För flera processer kan
+    appen köras med gunicorn: gunicorn -w 4 -b 0.0.0.0:5000 api.api_server:app
+    Notera att mottagna inspektioner och idempotensnycklar hålls i minnet
+    per process.
+    """
+    if inspect_workers > 0:
+        from api.inspection_service import InspectionService
+        from vision.vision_system import VisionSystem
+        # Bilderna kommer via HTTP, servern ska inte öppna någon kamera
+        set_inspection_service(InspectionService.from_vision_system(
+            lambda: VisionSystem(use_test_image=True), workers=inspect_workers,
+            max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+        ))
+        
+    if not dev:
+        try:
+            from waitress import serve as waitress_serve
+            logger.info(f"Startar waitress på {host}:{port} med {threads} trådar")
+            waitress_serve(app, host=host, port=port, threads=threads)
+            return
+        except ImportError:
+            logger.warning("waitress är inte installerat, använder Flasks utvecklingsserver")
+    app.run(host=host, port=port, threaded=True)
 
 if __name__ == '__main__':
-    app.run(port=5000)
+    parser = argparse.ArgumentParser(description="NiceLabel API Server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--dev', action='store_true', help="Använd Flasks utvecklingsserver")
+    parser.add_argument('--inspect-workers', type=int, default=0,
+                        help="Aktivera /inspect med så många efterbehandlingstrådar")
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.threads, args.dev,
+          args.inspect_workers, args.max_batch_size, args.max_wait_ms)
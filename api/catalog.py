@@ -0,0 +1,387 @@
+"""Lokal katalog över kunder, etiketter och referenstexter"""
+
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, asdict, field, fields
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from api.label_api import APIError, LabelAPI
+from vision.inspection_policy import normalize_gtin
+from vision.reference_index import ReferenceIndex
+
+logger = logging.getLogger(__name__)
+
+# Artikelnummer i början av etikettnamn, t.ex. "226580 YD Kanelbulle"
+# eller "2.76880.822 Vanilla Donut Label"
+_ARTICLE_RE = re.compile(r'^\s*(\d[\d.]*\d|\d)\b')
+
+# Lägsta textlikhet för att en OCR-text ska identifiera en etikett
+IDENTIFY_MIN_SCORE = 0.8
+
+@dataclass
+class LabelReference:
+    """Referensdata för en etikett"""
+    label_id: str
+    name: str
+    customer_id: str = ""
+    customer_name: str = ""
+    article_number: str = ""
+    barcode: str = ""
+    text: str = ""
+    label_type: str = ""
+    path: str = ""
+    source: str = ""
+    extra: Dict = field(default_factory=dict)
+
+def article_number_from_name(name: str) -> str:
+    """Plockar ut artikelnumret i början av ett etikettnamn"""
+    match = _ARTICLE_RE.match(name or "")
+    return match.group(1) if match else ""
+
+class _CatalogIndex:
+    """Oföränderlig uppsättning uppslagstabeller
+    
+    Byggs om i sin helhet och byts ut med en enda tilldelning, så läsare
+    aldrig ser en halvt uppdaterad katalog och aldrig behöver låsa.
+    """
+    
+    def __init__(self, customers: Dict[str, str], labels: List[LabelReference]):
+        self.customers = dict(customers)
+        self.by_label_id: Dict[str, LabelReference] = {}
+        self.by_article: Dict[str, List[LabelReference]] = {}
+        self.by_barcode: Dict[str, LabelReference] = {}
+        self.by_customer: Dict[str, List[LabelReference]] = {}
+        self._text_index = None
+        self._text_index_lock = threading.Lock()
+        
+        for label in labels:
+            self.by_label_id[label.label_id] = label
+            if label.article_number:
+                self.by_article.setdefault(label.article_number, []).append(label)
+            if label.barcode:
+                self.by_barcode[normalize_gtin(label.barcode) or label.barcode] = label
+            if label.customer_id:
+                self.by_customer.setdefault(label.customer_id, []).append(label)
+                
+    def text_index(self) -> ReferenceIndex:
+        """Textindex över referenstexterna, byggs vid första användningen"""
+        with self._text_index_lock:
+            if self._text_index is None:
+                index = ReferenceIndex()
+                index.add_many(
+                    (label.label_id, label.text or label.name)
+                    for label in self.by_label_id.values()
+                )
+                self._text_index = index
+            return self._text_index
+
+class LabelCatalog:
+    """Samlar all referensdata och ger O(1)-uppslag
+    
+    Källor, i prioritetsordning (senare källor skriver över tidigare):
+        products.json                 produkter med artikelnummer
+        labels/<kund>/products.json   etikettfiler per kund
+        config/customers.json         kunder och etikettnamn
+        NiceLabel-API:t               etiketter med referenstext
+        
+    Senaste synkade katalogen sparas i en lokal ögonblicksbild så att
+    systemet kan starta och köra helt utan nätverk.
+    """
+    
+    def __init__(self, base_dir: Optional[str] = None,
+                 label_api: Optional[LabelAPI] = None,
+                 snapshot_path: Optional[str] = None):
+        """Initierar katalogen
+        
+        Args:
+            base_dir: Projektets rotkatalog
+            label_api: Klient för synk mot NiceLabel, None för enbart lokal data
+            snapshot_path: Sökväg till lokal ögonblicksbild
+        """
+        self.base_dir = Path(base_dir) if base_dir else Path(__file__).parent.parent
+        self.label_api = label_api
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else self.base_dir / "data" / "catalog.json"
+        
+        self._index = _CatalogIndex({}, [])
+        self._refresh_lock = threading.Lock()
+        self._refresher = None
+        self._stop_event = threading.Event()
+        
+    # Uppslag
+    
+    def get(self, label_id: str) -> Optional[LabelReference]:
+        """Hämtar en etikett på id"""
+        return self._index.by_label_id.get(str(label_id))
+        
+    def find_by_article(self, article_number: str) -> List[LabelReference]:
+        """Hämtar etiketter för ett artikelnummer"""
+        return list(self._index.by_article.get(str(article_number), []))
+        
+    def find_by_barcode(self, barcode: str) -> Optional[LabelReference]:
+        """Hämtar etiketten som har en viss streckkod
+        
+        GTIN jämförs normaliserat, så EAN-13 och GS1-128 med AI (01) för
+        samma produkt ger samma träff.
+        """
+        barcode = str(barcode)
+        return self._index.by_barcode.get(normalize_gtin(barcode) or barcode)
+        
+    def labels_for_customer(self, customer_id: str) -> List[LabelReference]:
+        """Hämtar alla etiketter för en kund"""
+        return list(self._index.by_customer.get(str(customer_id), []))
+        
+    def customers(self) -> Dict[str, str]:
+        """Alla kunder som id -> namn"""
+        return dict(self._index.customers)
+        
+    def labels(self) -> List[LabelReference]:
+        """Alla etiketter i katalogen"""
+        return list(self._index.by_label_id.values())
+        
+    def identify(self, text: str, top_k: int = 5,
+                 min_score: float = 0.0) -> List[Tuple[LabelReference, float]]:
+        """Identifierar vilken etikett en OCR-text kommer från
+        
+        Args:
+            text: OCR-text från en okänd etikett
+            top_k: Antal kandidater att returnera
+            min_score: Lägsta likhet för att en kandidat ska tas med
+            
+        Returns:
+            Lista med (etikett, likhet), bäst först
+        """
+        index = self._index
+        return [
+            (index.by_label_id[label_id], score)
+            for label_id, score in index.text_index().search(text, top_k, min_score)
+        ]
+        
+    def find_reference(self, barcode: str = "", text: str = "",
+                       min_score: float = IDENTIFY_MIN_SCORE) -> Optional[LabelReference]:
+        """Referens för en okänd etikett, från streckkoden eller annars OCR-texten
+        
+        Används när ingen etikett är vald, t.ex. vid blandade produktkörningar.
+        
+        Args:
+            barcode: Avläst streckkod
+            text: OCR-text från etiketten
+            min_score: Lägsta textlikhet för att bästa kandidaten ska väljas
+        """
+        if barcode:
+            label = self.find_by_barcode(barcode)
+            if label is not None:
+                return label
+        if text:
+            candidates = self.identify(text, top_k=1, min_score=min_score)
+            if candidates:
+                return candidates[0][0]
+        return None
+        
+    def __len__(self) -> int:
+        return len(self._index.by_label_id)
+        
+    # Laddning
+    
+    def load(self, sync: bool = True) -> bool:
+        """Laddar katalogen från lokala filer och, om möjligt, API:t
+        
+        Misslyckas synken används den senaste ögonblicksbilden.
+        
+        Returns:
+            True om data från API:t (nytt eller från ögonblicksbild) ingår
+        """
+        with self._refresh_lock:
+            customers, labels = self._load_local()
+            
+            remote = None
+            if sync and self.label_api is not None:
+                try:
+                    remote = self._fetch_remote()
+                    self._save_snapshot(remote)
+                except APIError as e:
+                    logger.warning(f"Kunde inte synka etikettkatalog, kör offline: {str(e)}")
+                    
+            if remote is None:
+                remote = self._load_snapshot()
+                
+            if remote is not None:
+                customers.update(remote['customers'])
+                labels.update({l.label_id: l for l in remote['labels']})
+                
+            self._index = _CatalogIndex(customers, list(labels.values()))
+            logger.info(f"Etikettkatalog laddad: {len(labels)} etiketter, {len(customers)} kunder")
+            return remote is not None
+            
+    def _read_json(self, path: Path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Kunde inte läsa {path}: {str(e)}")
+            return None
+            
+    def _load_local(self):
+        """Läser de lokala JSON-filerna"""
+        customers: Dict[str, str] = {}
+        labels: Dict[str, LabelReference] = {}
+        
+        products = self._read_json(self.base_dir / "products.json") or []
+        for product in products:
+            customer = product.get('customer', '')
+            if customer:
+                customers.setdefault(customer, customer)
+            for label in product.get('labels', []):
+                label_type = label.get('type', '')
+                label_id = f"{product.get('article_number', '')}_{label_type}"
+                labels[label_id] = LabelReference(
+                    label_id=label_id,
+                    name=product.get('name', ''),
+                    customer_id=customer,
+                    customer_name=customer,
+                    article_number=str(product.get('article_number', '')),
+                    barcode=str(label.get('barcode', product.get('barcode', '')) or ''),
+                    text=product.get('description', ''),
+                    label_type=label_type,
+                    path=label.get('path', ''),
+                    source='products.json'
+                )
+                
+        labels_root = self.base_dir / "labels"
+        if labels_root.is_dir():
+            for products_file in sorted(labels_root.glob("*/products.json")):
+                customer = products_file.parent.name
+                customers.setdefault(customer, customer)
+                for name, files in (self._read_json(products_file) or {}).items():
+                    for key, path in files.items():
+                        label_type = key.replace('_label', '')
+                        label_id = f"{customer}/{name}_{label_type}"
+                        labels[label_id] = LabelReference(
+                            label_id=label_id,
+                            name=name,
+                            customer_id=customer,
+                            customer_name=customer,
+                            article_number=article_number_from_name(name),
+                            label_type=label_type,
+                            path=str(products_file.parent / path),
+                            source=str(products_file.relative_to(self.base_dir))
+                        )
+                        
+        config = self._read_json(self.base_dir / "config" / "customers.json") or {}
+        for customer_id, customer in config.get('customers', {}).items():
+            customers[customer_id] = customer.get('name', customer_id)
+            for name in customer.get('labels', []):
+                labels.setdefault(name, LabelReference(
+                    label_id=name,
+                    name=name,
+                    customer_id=customer_id,
+                    customer_name=customer.get('name', customer_id),
+                    article_number=article_number_from_name(name),
+                    path=customer.get('label_dir', ''),
+                    source='config/customers.json'
+                ))
+                
+        return customers, labels
+        
+    def _fetch_remote(self) -> Dict:
+        """Hämtar alla kunder och etiketter från API:t
+        
+        Etiketterna hämtas med bulkanropet, så en synk kostar två anrop
+        oavsett antal kunder.
+        """
+        customers = {
+            str(customer.get('id', '')): customer.get('name', str(customer.get('id', '')))
+            for customer in self.label_api.get_customers()
+        }
+        labels, customer_ids = self.label_api.get_all_labels()
+        references = []
+        for label_id, label in labels.items():
+            customer_id = str(customer_ids.get(label_id, ''))
+            references.append(_reference_from_api(
+                {'id': label_id, **label}, customer_id, customers.get(customer_id, customer_id)))
+        return {'customers': customers, 'labels': references}
+        
+    def _save_snapshot(self, remote: Dict):
+        """Sparar synkad data atomiskt för offlineläge"""
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.snapshot_path.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'customers': remote['customers'],
+                    'labels': [asdict(l) for l in remote['labels']]
+                }, f, ensure_ascii=False, indent=4)
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Kunde inte spara katalogens ögonblicksbild: {str(e)}")
+            
+    def _load_snapshot(self) -> Optional[Dict]:
+        if not self.snapshot_path.exists():
+            return None
+        data = self._read_json(self.snapshot_path)
+        if data is None:
+            return None
+        known = {f.name for f in fields(LabelReference)}
+        try:
+            return {
+                'customers': dict(data.get('customers', {})),
+                'labels': [LabelReference(**{k: v for k, v in l.items() if k in known})
+                           for l in data.get('labels', [])]
+            }
+        except (AttributeError, TypeError, ValueError) as e:
+            logger.warning(f"Ogiltig ögonblicksbild {self.snapshot_path}, ignoreras: {str(e)}")
+            return None
+        
+    # Bakgrundsuppdatering
+    
+    def start_refresh(self, interval: float = 900.0, immediate: bool = False):
+        """Synkar om katalogen periodiskt i en bakgrundstråd
+        
+        Args:
+            interval: Sekunder mellan synkningarna
+            immediate: Synka direkt i tråden i stället för att vänta ett intervall,
+                används efter load(sync=False) så att starten inte väntar på API:t
+        """
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+            
+        def run():
+            wait = 0.0 if immediate else interval
+            while not self._stop_event.wait(wait):
+                wait = interval
+                try:
+                    self.load(sync=True)
+                except Exception as e:
+                    logger.error(f"Fel vid uppdatering av etikettkatalog: {str(e)}")
+                    
+        self._stop_event.clear()
+        self._refresher = threading.Thread(target=run, name="LabelCatalogRefresh", daemon=True)
+        self._refresher.start()
+        
+    def stop_refresh(self):
+        """Stoppar bakgrundsuppdateringen"""
+        self._stop_event.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5.0)
+            self._refresher = None
+
+def _reference_from_api(label: Dict, customer_id: str, customer_name: str) -> LabelReference:
+    """Skapar en LabelReference från ett API-svar"""
+    known = {'id', 'name', 'text', 'barcode', 'article_number', 'type', 'path'}
+    name = label.get('name', '')
+    return LabelReference(
+        label_id=str(label.get('id', name)),
+        name=name,
+        customer_id=customer_id,
+        customer_name=customer_name,
+        article_number=str(label.get('article_number') or article_number_from_name(name)),
+        barcode=str(label.get('barcode', '') or ''),
+        text=label.get('text', ''),
+        label_type=label.get('type', ''),
+        path=label.get('path', ''),
+        source='api',
+        extra={k: v for k, v in label.items() if k not in known}
+    )
@@ -0,0 +1,240 @@
+"""Inspektionstjänst med dynamisk batchning av YOLO-anrop"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class DeadlineExceeded(Exception):
+    """Förfrågan hann inte behandlas före sin deadline"""
+    pass
+
+class QueueFull(Exception):
+    """Tjänsten tar inte emot fler förfrågningar just nu"""
+    pass
+
+class _Request:
+    __slots__ = ('image', 'deadline', 'future')
+    
+    def __init__(self, image: np.ndarray, deadline: Optional[float]):
+        self.image = image
+        self.deadline = deadline
+        self.future = Future()
+        
+    def expired(self, now: float) -> bool:
+        return self.deadline is not None and now > self.deadline
+
+class InspectionService:
+    """Tar emot bilder från flera stationer och inspekterar dem gemensamt
+    
+    En batchtråd samlar förfrågningar som kommer inom max_wait_ms och kör
+    objektdetekteringen för hela gruppen i ett anrop. Resten av
+    inspektionen (OCR, streckkod) körs parallellt i en trådpool.
+    Förfrågningar vars deadline passerat hoppas över innan de kostar
+    beräkningstid.
+    """
+    
+    def __init__(self, detect_batch: Callable[[List[np.ndarray]], List[List[Dict]]],
+                 inspect: Callable[[np.ndarray, List[Dict]], object],
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0,
+                 workers: int = 4,
+                 max_queue: int = 256):
+        """Initierar tjänsten
+        
+        Args:
+            detect_batch: Objektdetektering för en lista bilder
+            inspect: Inspektion av en bild med färdiga detektioner
+            max_batch_size: Max antal bilder per detekteringsanrop
+            max_wait_ms: Hur länge batchtråden väntar på fler bilder
+            workers: Antal trådar för efterbehandling
+            max_queue: Max antal väntande förfrågningar innan nya avvisas
+        """
+        self.detect_batch = detect_batch
+        self.inspect = inspect
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        
+        self._queue: "queue.Queue[_Request]" = queue.Queue(maxsize=max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Inspect")
+        self._stop_event = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._in_flight = 0
+        self._batches = 0
+        self._batched_images = 0
+        self._completed = 0
+        self._expired = 0
+        self._rejected = 0
+        
+        self._batcher = threading.Thread(target=self._run, name="InspectionBatcher", daemon=True)
+        self._batcher.start()
+        
+    @classmethod
+    def from_vision_system(cls, factory: Callable[[], object], **kwargs) -> 'InspectionService':
+        """Skapar en tjänst där varje tråd har ett eget VisionSystem
+        
+        VisionSystem har föränderligt tillstånd (vald etikett, mall,
+        statistik, cachar per spår) och får inte delas mellan trådar.
+        Batchtråden och varje arbetstråd skapar därför sitt eget med factory.
+        
+        Args:
+            factory: Skapar ett nytt VisionSystem
+        """
+        detector = factory()
+        local = threading.local()
+        
+        def inspect(image: np.ndarray, objects: List[Dict]):
+            vision_system = getattr(local, 'vision_system', None)
+            if vision_system is None:
+                vision_system = local.vision_system = factory()
+            return vision_system.inspect_image(image, objects=objects)
+            
+        return cls(detector.detect_objects_batch, inspect, **kwargs)
+                   
+    def submit(self, image: np.ndarray, timeout_ms: Optional[float] = None) -> Future:
+        """Lägger en bild i kön
+        
+        Args:
+            image: BGR-bild
+            timeout_ms: Tid förfrågan får ta totalt, None för ingen gräns
+            
+        Returns:
+            Future med inspektionsresultatet
+            
+        Raises:
+            QueueFull: Om kön är full
+        """
+        deadline = time.monotonic() + timeout_ms / 1000.0 if timeout_ms else None
+        request = _Request(image, deadline)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._metrics_lock:
+                self._rejected += 1
+            raise QueueFull(f"Inspektionskön är full ({self.max_queue})")
+        return request.future
+        
+    def inspect_sync(self, image: np.ndarray, timeout_ms: Optional[float] = None):
+        """Inspekterar en bild och väntar på resultatet
+        
+        Raises:
+            DeadlineExceeded: Om resultatet inte blev klart i tid
+        """
+        future = self.submit(image, timeout_ms)
+        try:
+            return future.result(timeout=timeout_ms / 1000.0 if timeout_ms else None)
+        except FutureTimeout:
+            future.cancel()
+            raise DeadlineExceeded(f"Ingen inspektion inom {timeout_ms} ms")
+            
+    def metrics(self) -> Dict:
+        """Ködjup och genomströmning"""
+        with self._metrics_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'in_flight': self._in_flight,
+                'batches': self._batches,
+                'mean_batch_size': self._batched_images / self._batches if self._batches else 0.0,
+                'completed': self._completed,
+                'expired': self._expired,
+                'rejected': self._rejected,
+            }
+            
+    def _collect_batch(self) -> List[_Request]:
+        """Väntar på en första bild och samlar sedan fler under max_wait"""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+            
+        batch = [first]
+        until = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+        
+    def _expire(self, request: _Request):
+        if request.future.set_running_or_notify_cancel():
+            request.future.set_exception(DeadlineExceeded("Deadline passerad i kön"))
+        with self._metrics_lock:
+            self._expired += 1
+            
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+                
+            now = time.monotonic()
+            live = []
+            for request in batch:
+                if request.future.cancelled():
+                    continue
+                if request.expired(now):
+                    self._expire(request)
+                else:
+                    live.append(request)
+            if not live:
+                continue
+                
+            with self._metrics_lock:
+                self._batches += 1
+                self._batched_images += len(live)
+                self._in_flight += len(live)
+                
+            try:
+                detections = self.detect_batch([r.image for r in live])
+                if len(detections) != len(live):
+                    raise RuntimeError(f"Detekteringen gav {len(detections)} resultat för {len(live)} bilder")
+            except Exception as e:
+                logger.error(f"Error in batched detection: {str(e)}")
+                self._fail(live, e)
+                continue
+                
+            for request, objects in zip(live, detections):
+                self._pool.submit(self._finish, request, objects)
+                
+    def _fail(self, requests: List[_Request], error: Exception):
+        """Lämnar felet till alla förfrågningar i en batch"""
+        for request in requests:
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(error)
+        with self._metrics_lock:
+            self._in_flight -= len(requests)
+            
+    def _finish(self, request: _Request, objects: List[Dict]):
+        """Kör resten av inspektionen för en bild"""
+        try:
+            if request.expired(time.monotonic()):
+                self._expire(request)
+                return
+            if not request.future.set_running_or_notify_cancel():
+                return
+            try:
+                request.future.set_result(self.inspect(request.image, objects))
+            except Exception as e:
+                request.future.set_exception(e)
+            with self._metrics_lock:
+                self._completed += 1
+        finally:
+            with self._metrics_lock:
+                self._in_flight -= 1
+                
+    def close(self):
+        """Stoppar batchtråden och trådpoolen"""
+        self._stop_event.set()
+        self._batcher.join(timeout=5.0)
+        self._pool.shutdown(wait=True)
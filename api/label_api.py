@@ -1,36 +1,226 @@
 """API-integration med NiceLabel"""
 
 import requests
-from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, List, Optional, Tuple, Union
 from datetime import datetime
+import copy
 import json
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # Ladda miljövariabler
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# (anslutning, läsning) i sekunder
+DEFAULT_TIMEOUT = (3.05, 10.0)
+
+# Etikettdefinitioner ändras sällan under ett skift
+DEFAULT_CACHE_TTL = 3600.0
+
 class LabelAPI:
     """Hanterar kommunikation med NiceLabel API"""
     
-    def __init__(self, base_url: Optional[str] = None):
-        """Initierar API-klienten"""
+    def __init__(self, base_url: Optional[str] = None,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+                 max_retries: int = 3,
+                 backoff_factor: float = 0.3,
+                 pool_size: int = 10,
+                 cache_ttl: Optional[float] = None):
+        """Initierar API-klienten
+        
+        Args:
+            base_url: Bas-URL för API:t
+            timeout: Timeout i sekunder, eller (anslutning, läsning)
+            max_retries: Antal omförsök vid nätverksfel och 429/5xx
+            backoff_factor: Faktor för exponentiell väntetid mellan försök
+            pool_size: Antal återanvända anslutningar i poolen
+            cache_ttl: Hur länge etikettdata cachas i sekunder (0 = ingen cache)
+        """
         self.base_url = base_url or os.getenv('NICELABEL_API_URL', 'http://localhost:5000/api')
         self.api_key = os.getenv('NICELABEL_API_KEY')
+        self.timeout = timeout
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv('NICELABEL_CACHE_TTL', DEFAULT_CACHE_TTL))
+        self.cache_ttl = cache_ttl
+        
+        # label_id -> (giltig till, ETag, data)
+        self._cache: Dict[str, Tuple[float, Optional[str], Dict]] = {}
+        self._cache_lock = threading.Lock()
+        
+        self.session = self._create_session(max_retries, backoff_factor, pool_size)
+        
+    def _create_session(self, max_retries: int, backoff_factor: float,
+                        pool_size: int) -> requests.Session:
+        """Skapar en session med keep-alive-pool och omförsök"""
+        session = requests.Session()
         
-    def get_label_data(self, label_id: str) -> Dict:
-        """Hämtar etikettdata från NiceLabel"""
+        # Läsfel och felstatus försöks bara om för GET. POST försöks bara
+        # om vid anslutningsfel, då begäran aldrig nått servern.
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        
+        if self.api_key:
+            session.headers['Authorization'] = f'Bearer {self.api_key}'
+        return session
+        
+    def get_label_data(self, label_id: str, use_cache: bool = True) -> Dict:
+        """Hämtar etikettdata från NiceLabel
+        
+        Svar cachas i cache_ttl sekunder. När posten gått ut valideras den
+        med If-None-Match, så oförändrade etiketter bara kostar ett 304-svar.
+        Går servern inte att nå, eller svarar den med 5xx, används den
+        utgångna posten hellre än att inspektionen stoppas. Svarar servern
+        med 4xx (t.ex. borttagen etikett) tas posten bort och felet lyfts.
+        """
+        now = time.monotonic()
+        cached = None
+        if use_cache and self.cache_ttl > 0:
+            with self._cache_lock:
+                cached = self._cache.get(label_id)
+            if cached is not None and cached[0] > now:
+                return copy.deepcopy(cached[2])
+                
         try:
-            headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
-            response = requests.get(
+            headers = {}
+            if cached is not None and cached[1]:
+                headers['If-None-Match'] = cached[1]
+                
+            response = self.session.get(
                 f"{self.base_url}/labels/{label_id}",
-                headers=headers
+                headers=headers,
+                timeout=self.timeout
+            )
+            
+            if response.status_code == 304 and cached is not None:
+                data = cached[2]
+            else:
+                response.raise_for_status()
+                data = response.json()
+                
+            if self.cache_ttl > 0:
+                with self._cache_lock:
+                    self._cache[label_id] = (
+                        time.monotonic() + self.cache_ttl,
+                        response.headers.get('ETag', cached[1] if cached else None),
+                        data
+                    )
+            return copy.deepcopy(data)
+        except requests.exceptions.RequestException as e:
+            status_code = getattr(e.response, 'status_code', None)
+            if cached is not None:
+                if status_code is None or status_code >= 500:
+                    logger.warning(f"Använder cachad etikettdata för {label_id}: {str(e)}")
+                    return copy.deepcopy(cached[2])
+                with self._cache_lock:
+                    self._cache.pop(label_id, None)
+            raise APIError(f"Fel vid hämtning av etikettdata: {str(e)}", status_code)
+            
+    def get_labels(self, label_ids: List[str], use_cache: bool = True) -> Dict[str, Dict]:
+        """Hämtar flera etiketter i ett anrop och fyller cachen
+        
+        Bara etiketter som saknas i cachen hämtas från servern. Etiketter
+        som inte finns utelämnas ur svaret.
+        
+        Returns:
+            label_id -> etikettdata
+        """
+        result = {}
+        now = time.monotonic()
+        missing = []
+        for label_id in label_ids:
+            cached = None
+            if use_cache and self.cache_ttl > 0:
+                with self._cache_lock:
+                    cached = self._cache.get(label_id)
+            if cached is not None and cached[0] > now:
+                result[label_id] = copy.deepcopy(cached[2])
+            else:
+                missing.append(label_id)
+                
+        if not missing:
+            return result
+            
+        try:
+            response = self.session.post(
+                f"{self.base_url}/labels/batch",
+                json={'ids': missing},
+                timeout=self.timeout
             )
             response.raise_for_status()
-            return response.json()
+            labels = response.json().get('labels', {})
         except requests.exceptions.RequestException as e:
             raise APIError(f"Fel vid hämtning av etikettdata: {str(e)}")
             
+        expires = time.monotonic() + self.cache_ttl
+        for label_id, data in labels.items():
+            if self.cache_ttl > 0:
+                with self._cache_lock:
+                    self._cache[label_id] = (expires, None, data)
+            result[label_id] = copy.deepcopy(data)
+        return result
+        
+    def get_all_labels(self) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+        """Hämtar hela etikettkatalogen i ett anrop
+        
+        Returns:
+            (label_id -> etikettdata, label_id -> kund-id)
+        """
+        try:
+            response = self.session.get(f"{self.base_url}/labels", timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            raise APIError(f"Fel vid hämtning av etikettkatalog: {str(e)}")
+        return data.get('labels', {}), data.get('customer_ids', {})
+        
+    def get_customers(self) -> List[Dict]:
+        """Hämtar alla kunder"""
+        try:
+            response = self.session.get(f"{self.base_url}/customers", timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            raise APIError(f"Fel vid hämtning av kunder: {str(e)}")
+            
+    def get_customer_labels(self, customer_id: str) -> List[Dict]:
+        """Hämtar alla etiketter för en kund"""
+        try:
+            response = self.session.get(
+                f"{self.base_url}/customers/{customer_id}/labels",
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            raise APIError(f"Fel vid hämtning av etiketter för kund {customer_id}: {str(e)}")
+            
+    def invalidate_cache(self, label_id: Optional[str] = None):
+        """Tömmer cachen för en etikett, eller hela cachen"""
+        with self._cache_lock:
+            if label_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(label_id, None)
+                
     def validate_label(self, label_id: str, detected_text: str, detected_barcode: Optional[str] = None) -> Dict:
         """Validerar detekterad etikettdata mot NiceLabel"""
         try:
@@ -41,11 +231,10 @@ class LabelAPI:
                 'timestamp': datetime.now().isoformat()
             }
             
-            headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/validate",
                 json=data,
-                headers=headers
+                timeout=self.timeout
             )
             response.raise_for_status()
             return response.json()
@@ -55,17 +244,57 @@ class LabelAPI:
     def report_inspection(self, inspection_data: Dict) -> Dict:
         """Rapporterar inspektionsresultat till NiceLabel"""
         try:
-            headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/inspections",
                 json=inspection_data,
-                headers=headers
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            raise APIError(f"Fel vid rapportering av inspektion: {str(e)}",
+                           getattr(e.response, 'status_code', None))
+            
+    def report_inspections(self, inspections: List[Dict]) -> Dict:
+        """Rapporterar flera inspektionsresultat i ett anrop
+        
+        Varje rapport bör ha en 'idempotency_key' så att servern kan
+        ignorera rapporter som redan tagits emot vid omförsök.
+        """
+        try:
+            response = self.session.post(
+                f"{self.base_url}/inspections/batch",
+                json={'inspections': inspections},
+                timeout=self.timeout
             )
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            raise APIError(f"Fel vid rapportering av inspektion: {str(e)}")
+            raise APIError(f"Fel vid rapportering av inspektioner: {str(e)}",
+                           getattr(e.response, 'status_code', None))
             
+    def close(self):
+        """Stänger anslutningspoolen"""
+        self.session.close()
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 class APIError(Exception):
-    """Anpassat fel för API-relaterade problem"""
-    pass
+    """Anpassat fel för API-relaterade problem
+    
+    status_code är serverns HTTP-status, None om servern inte svarade.
+    """
+    
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        
+    @property
+    def permanent(self) -> bool:
+        """Servern avvisade själva förfrågan (4xx), ett omförsök ger samma svar"""
+        return (self.status_code is not None and 400 <= self.status_code < 500
+                and self.status_code not in (408, 429))
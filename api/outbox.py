@@ -0,0 +1,327 @@
+"""Lokal utkorg för inspektionsrapporter till NiceLabel"""
+
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from api.label_api import APIError, LabelAPI
+from database.migrations import enable_wal
+from database.timestamps import now_ms
+
+logger = logging.getLogger(__name__)
+
+# Kortaste väntan mellan sändningsförsök, så att sändartråden aldrig snurrar
+MIN_RETRY_WAIT = 0.1
+
+class InspectionOutbox:
+    """Köar inspektionsrapporter lokalt och skickar dem i batchar i bakgrunden
+    
+    Rapporter sparas först i en SQLite-kö, så inspektionen aldrig väntar på
+    etikettservern. En sändartråd skickar dem i batchar och försöker igen med
+    exponentiell backoff vid fel. Varje rapport får en idempotensnyckel som
+    följer med vid varje försök, så servern kan ignorera dubbletter och
+    varje rapport registreras exakt en gång.
+    
+    Avvisar servern en batch (4xx) skickas rapporterna en och en, så att
+    bara de som servern inte accepterar flyttas till dödkön. Rapporter som
+    misslyckats max_attempts gånger hamnar också där. Dödkön skickas inte
+    automatiskt men kan läggas tillbaka med retry_dead_letters.
+    """
+    
+    def __init__(self, label_api: LabelAPI,
+                 db_path: str = "data/outbox.db",
+                 batch_size: int = 50,
+                 max_pending: int = 100000,
+                 flush_interval: float = 1.0,
+                 min_backoff: float = 1.0,
+                 max_backoff: float = 300.0,
+                 max_attempts: int = 20):
+        """Initierar utkorgen
+        
+        Args:
+            label_api: Klient som används för att skicka rapporterna
+            db_path: Sökväg till köns databas
+            batch_size: Max antal rapporter per anrop
+            max_pending: Max antal osända rapporter innan nya avvisas
+            flush_interval: Sekunder mellan sändningsförsök när kön är tom,
+                0 för att bara skicka när något köats
+            min_backoff: Väntetid i sekunder före första omförsöket
+            max_backoff: Längsta väntetid i sekunder mellan omförsök
+            max_attempts: Antal misslyckade försök innan rapporten flyttas till dödkön
+        """
+        self.label_api = label_api
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._sender = None
+        self._send_lock = threading.Lock()
+        
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._init_database()
+        
+        # Antalet osända rapporter hålls i minnet så att enqueue slipper
+        # räkna tabellen. Förutsätter en utkorg per databasfil.
+        self._count_lock = threading.Lock()
+        self._pending = self.pending_count()
+        
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10.0)
+        
+    def _init_database(self):
+        """Skapar kötabellen"""
+        with self._connect() as conn:
+            enable_wal(conn)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                created_ms INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_ms INTEGER NOT NULL,
+                last_error TEXT,
+                dead INTEGER NOT NULL DEFAULT 0
+            )
+            """)
+            conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_outbox_pending
+            ON outbox(dead, next_attempt_ms, id)
+            """)
+            conn.commit()
+            
+    def enqueue(self, inspection_data: Dict) -> Optional[str]:
+        """Lägger en inspektionsrapport i kön
+        
+        Blockerar aldrig på nätverket. Är kön full avvisas rapporten och
+        None returneras, så att inspektionen kan fortsätta.
+        
+        Returns:
+            Rapportens idempotensnyckel, eller None om kön är full
+        """
+        key = inspection_data.get('idempotency_key') or uuid.uuid4().hex
+        payload = dict(inspection_data, idempotency_key=key)
+        now = now_ms()
+        
+        with self._count_lock:
+            if self._pending >= self.max_pending:
+                logger.warning(f"Outbox full ({self._pending} pending), rejecting report")
+                return None
+                
+            with self._connect() as conn:
+                inserted = conn.execute("""
+                INSERT OR IGNORE INTO outbox (idempotency_key, payload, created_ms, next_attempt_ms)
+                VALUES (?, ?, ?, ?)
+                """, (key, json.dumps(payload, default=str), now, now)).rowcount
+                conn.commit()
+            self._pending += inserted
+            
+        self._wakeup.set()
+        return key
+        
+    def pending_count(self) -> int:
+        """Antal osända rapporter, utom dödkön"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+            
+    def dead_letter_count(self) -> int:
+        """Antal rapporter i dödkön"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM outbox WHERE dead = 1").fetchone()[0]
+            
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        """Rapporterna i dödkön med antal försök och senaste fel, äldst först"""
+        with self._connect() as conn:
+            rows = conn.execute("""
+            SELECT payload, attempts, last_error FROM outbox
+            WHERE dead = 1
+            ORDER BY id
+            LIMIT ?
+            """, (limit,)).fetchall()
+        return [{'payload': json.loads(payload), 'attempts': attempts, 'last_error': error}
+                for payload, attempts, error in rows]
+                
+    def retry_dead_letters(self) -> int:
+        """Lägger tillbaka dödkön i den vanliga kön med nollställda försök
+        
+        Returns:
+            Antal rapporter som lades tillbaka
+        """
+        with self._count_lock:
+            with self._connect() as conn:
+                requeued = conn.execute("""
+                UPDATE outbox SET dead = 0, attempts = 0, next_attempt_ms = ?
+                WHERE dead = 1
+                """, (now_ms(),)).rowcount
+                conn.commit()
+            self._pending += requeued
+            
+        if requeued:
+            self._wakeup.set()
+        return requeued
+            
+    def flush(self) -> int:
+        """Skickar alla rapporter som är redo, en batch i taget
+        
+        Returns:
+            Antal rapporter som bekräftats av servern
+        """
+        sent = 0
+        with self._send_lock:
+            while not self._stop_event.is_set():
+                batch = self._due_batch()
+                if not batch:
+                    break
+                    
+                ids = [row_id for row_id, _, _ in batch]
+                payloads = [json.loads(payload) for _, payload, _ in batch]
+                
+                try:
+                    self.label_api.report_inspections(payloads)
+                except APIError as e:
+                    if not e.permanent:
+                        self._schedule_retry(batch, str(e))
+                        logger.warning(f"Could not send {len(batch)} reports: {str(e)}")
+                        break
+                    if len(batch) == 1:
+                        self._dead_letter(batch, str(e))
+                        continue
+                        
+                    # Servern avvisade batchen: skicka rapporterna var för sig
+                    # så att bara de felaktiga hamnar i dödkön
+                    logger.warning(f"Batch of {len(batch)} reports rejected, sending one by one: {str(e)}")
+                    isolated, retry = self._send_individually(batch)
+                    sent += isolated
+                    if retry:
+                        break
+                    continue
+                    
+                self._mark_sent(ids)
+                sent += len(ids)
+                
+        return sent
+        
+    def _send_individually(self, batch: List[tuple]) -> tuple:
+        """Skickar rapporterna i en avvisad batch en och en
+        
+        Returns:
+            (antal skickade, True om ett tillfälligt fel avbröt sändningen)
+        """
+        sent = 0
+        for i, row in enumerate(batch):
+            row_id, payload, _ = row
+            try:
+                self.label_api.report_inspections([json.loads(payload)])
+            except APIError as e:
+                if e.permanent:
+                    self._dead_letter([row], str(e))
+                    continue
+                self._schedule_retry(batch[i:], str(e))
+                logger.warning(f"Could not send {len(batch) - i} reports: {str(e)}")
+                return sent, True
+            self._mark_sent([row_id])
+            sent += 1
+        return sent, False
+        
+    def _due_batch(self) -> List[tuple]:
+        with self._connect() as conn:
+            return conn.execute("""
+            SELECT id, payload, attempts FROM outbox
+            WHERE dead = 0 AND next_attempt_ms <= ?
+            ORDER BY next_attempt_ms, id
+            LIMIT ?
+            """, (now_ms(), self.batch_size)).fetchall()
+            
+    def _mark_sent(self, ids: List[int]):
+        with self._count_lock:
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+                conn.commit()
+            self._pending -= len(ids)
+            
+    def _dead_letter(self, batch: List[tuple], error: str):
+        """Flyttar rapporter till dödkön"""
+        with self._count_lock:
+            with self._connect() as conn:
+                conn.executemany("""
+                UPDATE outbox SET dead = 1, attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+                """, [(error, row_id) for row_id, _, _ in batch])
+                conn.commit()
+            self._pending -= len(batch)
+        logger.error(f"Moved {len(batch)} reports to the dead letter queue: {error}")
+        
+    def _schedule_retry(self, batch: List[tuple], error: str):
+        """Flyttar fram nästa försök med exponentiell backoff
+        
+        Rapporter som nått max_attempts flyttas till dödkön.
+        """
+        exhausted = [row for row in batch if row[2] + 1 >= self.max_attempts]
+        if exhausted:
+            self._dead_letter(exhausted, error)
+            
+        now = now_ms()
+        updates = []
+        for row_id, _, attempts in batch:
+            if attempts + 1 < self.max_attempts:
+                delay = min(self.max_backoff, self.min_backoff * (2 ** attempts))
+                updates.append((now + int(delay * 1000), error, row_id))
+                
+        with self._connect() as conn:
+            conn.executemany("""
+            UPDATE outbox
+            SET attempts = attempts + 1, next_attempt_ms = ?, last_error = ?
+            WHERE id = ?
+            """, updates)
+            conn.commit()
+            
+    def _idle_wait(self) -> Optional[float]:
+        """Sekunder till nästa rapport är redo, None för att vänta på enqueue"""
+        with self._connect() as conn:
+            next_ms = conn.execute(
+                "SELECT MIN(next_attempt_ms) FROM outbox WHERE dead = 0"
+            ).fetchone()[0]
+        if next_ms is None:
+            return self.flush_interval or None
+        return max(MIN_RETRY_WAIT, (next_ms - now_ms()) / 1000.0)
+        
+    def start(self):
+        """Startar sändartråden"""
+        if self._sender is not None and self._sender.is_alive():
+            return
+            
+        self._stop_event.clear()
+        self._sender = threading.Thread(target=self._run, name="InspectionOutbox", daemon=True)
+        self._sender.start()
+        
+    def stop(self, timeout: float = 5.0):
+        """Stoppar sändartråden. Osända rapporter ligger kvar i kön."""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._sender is not None:
+            self._sender.join(timeout=timeout)
+            self._sender = None
+            
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in outbox sender: {str(e)}")
+            try:
+                wait = self._idle_wait()
+            except sqlite3.Error as e:
+                logger.error(f"Error in outbox sender: {str(e)}")
+                wait = max(self.flush_interval, MIN_RETRY_WAIT)
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
@@ -2,18 +2,41 @@
 
 import sqlite3
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Sequence, Union
 import json
 
+from database.migrations import (
+    DEFAULT_BATCH_SIZE, add_column, add_epoch_ms_column, delete_in_batches,
+    enable_wal, get_schema_version, set_schema_version
+)
+from database.fulltext import ensure_fts_index, search
+from database.history import DEFAULT_PAGE_SIZE, HistoryRecord, iter_history
+from database.timestamps import to_epoch_ms, now_ms
+
 logger = logging.getLogger(__name__)
 
+# Version 1: timestamp_ms (epoch-ms, indexerad) i validation_results
+# Version 2: index (customer_id, timestamp_ms, id) för filtrerad paginering
+# Version 3: FTS5-index över detected_text/expected_text (skapas vid varje start om det saknas)
+# Version 4: image_hash som referens till ImageStore
+SCHEMA_VERSION = 4
+
+FTS_COLUMNS = ('detected_text', 'expected_text')
+
 class DatabaseManager:
     """Hanterar databasoperationer för Label Vision System"""
     
-    def __init__(self, db_path: str = "data/label_vision.db"):
-        """Initiera databashanteraren"""
+    def __init__(self, db_path: str = "data/label_vision.db", image_store=None):
+        """Initiera databashanteraren
+        
+        Args:
+            db_path: Sökväg till databasen
+            image_store: ImageStore för bilder av underkända valideringar,
+                t.ex. ImageStore.from_config. None sparar inga bilder.
+        """
+        self.image_store = image_store
         try:
             # Säkerställ att databaskatalogen finns
             db_dir = Path(db_path).parent
@@ -47,7 +70,8 @@ class DatabaseManager:
                     confidence REAL NOT NULL,
                     error_message TEXT,
                     metadata TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    timestamp_ms INTEGER
                 )
                 """)
                 
@@ -63,15 +87,65 @@ class DatabaseManager:
                 """)
                 
                 conn.commit()
+                
+                enable_wal(conn)
+                self._migrate(conn)
                 logger.info("Database schema initialized successfully")
                 
         except Exception as e:
             logger.error(f"Error initializing database schema: {str(e)}")
             raise
             
+    def _migrate(self, conn: sqlite3.Connection):
+        """Migrera äldre databasfiler till aktuell schemaversion"""
+        # FTS5 kan saknas i en SQLite-version och finnas i nästa, så indexet
+        # kontrolleras vid varje start och inte via schemaversionen
+        ensure_fts_index(conn, 'validation_results', FTS_COLUMNS)
+        
+        version = get_schema_version(conn)
+        if version >= SCHEMA_VERSION:
+            return
+            
+        if version < 1:
+            # Textbaserade tidsstämplar kan inte använda index vid jämförelse
+            # via strftime(), så de kompletteras med epoch-ms
+            add_epoch_ms_column(
+                conn, 'validation_results', 'idx_validation_timestamp_ms'
+            )
+            
+        if version < 2:
+            conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_validation_customer_ts
+            ON validation_results(customer_id, timestamp_ms, id)
+            """)
+            conn.commit()
+            
+        if version < 4:
+            add_column(conn, 'validation_results', 'image_hash', 'TEXT')
+            conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_validation_image_hash
+            ON validation_results(image_hash)
+            """)
+            conn.commit()
+            
+        set_schema_version(conn, SCHEMA_VERSION)
+        logger.info(f"Migrated database schema from version {version} to {SCHEMA_VERSION}")
+        
     def save_validation_result(self, result: Dict) -> int:
-        """Spara ett valideringsresultat till databasen"""
+        """Spara ett valideringsresultat till databasen
+        
+        Har en underkänd validering en bild (result['image'], valfritt
+        utsnitt i result['roi']) sparas den i image_store och refereras med
+        image_hash.
+        """
         try:
+            image = result.get('image')
+            if image is not None and self.image_store is not None and not result['valid']:
+                digest = self.image_store.put(image, roi=result.get('roi'))
+                if digest is not None:
+                    result = dict(result, image_hash=digest,
+                                  image_path=result.get('image_path') or self.image_store.path_for(digest) or '')
+                                  
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
@@ -82,11 +156,11 @@ class DatabaseManager:
                 INSERT INTO validation_results (
                     timestamp, image_path, label_name, customer_id,
                     expected_text, detected_text, is_valid, confidence,
-                    error_message, metadata
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    error_message, metadata, timestamp_ms, image_hash
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
-                    result['timestamp'],
-                    result['image_path'],
+                    _timestamp_text(result['timestamp']),
+                    result.get('image_path', ''),
                     result['label_name'],
                     result['customer_id'],
                     result.get('expected_text', ''),
@@ -94,7 +168,9 @@ class DatabaseManager:
                     result['valid'],
                     result['confidence'],
                     result.get('error', ''),
-                    metadata
+                    metadata,
+                    to_epoch_ms(result['timestamp']) or now_ms(),
+                    result.get('image_hash')
                 ))
                 
                 result_id = cursor.lastrowid
@@ -109,8 +185,8 @@ class DatabaseManager:
             
     def get_validation_results(self, 
                              customer_id: Optional[str] = None,
-                             start_date: Optional[str] = None,
-                             end_date: Optional[str] = None,
+                             start_date: Optional[Union[str, datetime]] = None,
+                             end_date: Optional[Union[str, datetime]] = None,
                              valid_only: bool = False,
                              limit: int = 100) -> List[Dict]:
         """Hämta valideringsresultat med filter"""
@@ -127,17 +203,17 @@ class DatabaseManager:
                     params.append(customer_id)
                     
                 if start_date:
-                    query += " AND timestamp >= ?"
-                    params.append(start_date)
+                    query += " AND timestamp_ms >= ?"
+                    params.append(to_epoch_ms(start_date))
                     
                 if end_date:
-                    query += " AND timestamp <= ?"
-                    params.append(end_date)
+                    query += " AND timestamp_ms <= ?"
+                    params.append(to_epoch_ms(end_date))
                     
                 if valid_only:
                     query += " AND is_valid = 1"
                     
-                query += " ORDER BY timestamp DESC LIMIT ?"
+                query += " ORDER BY timestamp_ms DESC, id DESC LIMIT ?"
                 params.append(limit)
                 
                 cursor.execute(query, params)
@@ -157,10 +233,105 @@ class DatabaseManager:
             logger.error(f"Error getting validation results: {str(e)}")
             raise
             
+    def iter_validation_results(self,
+                                customer_id: Optional[str] = None,
+                                start_date: Optional[Union[str, datetime]] = None,
+                                end_date: Optional[Union[str, datetime]] = None,
+                                valid_only: bool = False,
+                                columns: Optional[Sequence[str]] = None,
+                                page_size: int = DEFAULT_PAGE_SIZE,
+                                descending: bool = True,
+                                after: Optional[tuple] = None) -> Iterator[HistoryRecord]:
+        """Strömma valideringsresultat med keyset-paginering på (timestamp_ms, id)
+        
+        Till skillnad från get_validation_results laddas aldrig hela
+        resultatet i minnet, och metadata avkodas först när den läses.
+        
+        Args:
+            customer_id: Filtrera på kund
+            start_date: Tidigaste tidpunkt (inklusive)
+            end_date: Senaste tidpunkt (inklusive)
+            valid_only: Endast godkända resultat
+            columns: Kolumner att läsa (None = alla)
+            page_size: Antal rader per databasfråga
+            descending: Nyaste först om True
+            after: Fortsätt efter nyckeln (timestamp_ms, id)
+            
+        Yields:
+            HistoryRecord per valideringsresultat
+        """
+        where = []
+        params = []
+        
+        if customer_id:
+            where.append("customer_id = ?")
+            params.append(customer_id)
+            
+        if start_date:
+            where.append("timestamp_ms >= ?")
+            params.append(to_epoch_ms(start_date))
+            
+        if end_date:
+            where.append("timestamp_ms <= ?")
+            params.append(to_epoch_ms(end_date))
+            
+        if valid_only:
+            where.append("is_valid = 1")
+            
+        return iter_history(
+            lambda: sqlite3.connect(self.db_path),
+            'validation_results',
+            where=where,
+            params=params,
+            columns=columns,
+            page_size=page_size,
+            descending=descending,
+            after=after
+        )
+            
+    def search_validation_results(self,
+                                  text: str,
+                                  customer_id: Optional[str] = None,
+                                  order: str = 'rank',
+                                  limit: int = 50) -> List[Dict]:
+        """Fritextsök i detekterad och förväntad text
+        
+        Args:
+            text: Sökord, t.ex. produktnamn eller batchnummer
+            customer_id: Filtrera på kund
+            order: 'rank' för relevans eller 'recent' för senaste först
+            limit: Maximalt antal träffar
+            
+        Returns:
+            Matchande valideringsresultat med relevanspoäng i 'score'
+        """
+        try:
+            where = []
+            params = []
+            if customer_id:
+                where.append("t.customer_id = ?")
+                params.append(customer_id)
+                
+            with sqlite3.connect(self.db_path) as conn:
+                results = search(
+                    conn, 'validation_results', text, FTS_COLUMNS,
+                    where=where, params=params, order=order, limit=limit
+                )
+                
+            for result in results:
+                result['metadata'] = json.loads(result['metadata'] or '{}')
+                
+            logger.info(f"Found {len(results)} validation results matching '{text}'")
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error searching validation results: {str(e)}")
+            raise
+            
     def get_statistics(self, 
                       customer_id: Optional[str] = None,
-                      start_date: Optional[str] = None,
-                      end_date: Optional[str] = None) -> Dict:
+                      start_date: Optional[Union[str, datetime]] = None,
+                      end_date: Optional[Union[str, datetime]] = None) -> Dict:
         """Hämta statistik över valideringsresultat"""
         try:
             with sqlite3.connect(self.db_path) as conn:
@@ -183,12 +354,12 @@ class DatabaseManager:
                     params.append(customer_id)
                     
                 if start_date:
-                    query += " AND timestamp >= ?"
-                    params.append(start_date)
+                    query += " AND timestamp_ms >= ?"
+                    params.append(to_epoch_ms(start_date))
                     
                 if end_date:
-                    query += " AND timestamp <= ?"
-                    params.append(end_date)
+                    query += " AND timestamp_ms <= ?"
+                    params.append(to_epoch_ms(end_date))
                     
                 cursor.execute(query, params)
                 row = cursor.fetchone()
@@ -207,28 +378,46 @@ class DatabaseManager:
             logger.error(f"Error getting statistics: {str(e)}")
             raise
             
-    def delete_old_results(self, days: int = 30) -> int:
-        """Ta bort gamla valideringsresultat"""
+    def delete_old_results(self, days: int = 30,
+                           batch_size: int = DEFAULT_BATCH_SIZE,
+                           max_batches: Optional[int] = None) -> int:
+        """Ta bort gamla valideringsresultat
+        
+        Raderingen sker i små batchar via indexet på timestamp_ms, med commit
+        mellan varje batch, så att pågående loggning inte blockeras.
+        
+        Args:
+            days: Behåll resultat från de senaste så många dagarna
+            batch_size: Maximalt antal rader per transaktion
+            max_batches: Avbryt efter så många batchar (None = tills klart)
+            
+        Returns:
+            Antal borttagna resultat
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Beräkna datum för borttagning
-                cutoff_date = (datetime.now()
-                             .replace(hour=0, minute=0, second=0, microsecond=0)
-                             .timestamp() - (days * 24 * 60 * 60))
-                
-                cursor.execute("""
-                DELETE FROM validation_results 
-                WHERE strftime('%s', timestamp) < ?
-                """, (cutoff_date,))
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
-                
-                logger.info(f"Deleted {deleted_count} old validation results")
-                return deleted_count
-                
+            # Beräkna datum för borttagning
+            cutoff = (datetime.now()
+                      .replace(hour=0, minute=0, second=0, microsecond=0)
+                      - timedelta(days=days))
+            
+            deleted_count = delete_in_batches(
+                lambda: sqlite3.connect(self.db_path),
+                'validation_results',
+                to_epoch_ms(cutoff),
+                batch_size=batch_size,
+                max_batches=max_batches
+            )
+            
+            logger.info(f"Deleted {deleted_count} old validation results")
+            return deleted_count
+            
         except Exception as e:
             logger.error(f"Error deleting old results: {str(e)}")
             raise
+
+
+def _timestamp_text(value: Union[str, datetime]) -> str:
+    """Textform av tidsstämpeln för den läsbara timestamp-kolumnen"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,191 @@
+"""FTS5-fulltextindex över detekterad etikettext"""
+
+import sqlite3
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# unicode61 med borttagna diakriter gör att OCR-läsningar som tappat
+# prickar/ringar (Appelmunk/Äppelmunk) ändå matchar
+TOKENIZER = "unicode61 remove_diacritics 2"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    """Kontrollera om SQLite är byggt med FTS5"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.__fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.__fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def fts_table_name(table: str) -> str:
+    """Namn på FTS-tabellen för en innehållstabell"""
+    return f"{table}_fts"
+
+
+def fts_exists(conn: sqlite3.Connection, table: str) -> bool:
+    """Kontrollera om FTS-tabellen för en tabell finns"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (fts_table_name(table),)
+    ).fetchone()
+    return row is not None
+
+
+def create_fts_index(conn: sqlite3.Connection, table: str,
+                     columns: Sequence[str]) -> bool:
+    """Skapa ett external content-index med triggers som håller det i synk
+
+    Indexet lagrar bara token, inte texten, och uppdateras automatiskt vid
+    INSERT/UPDATE/DELETE på innehållstabellen. Befintliga rader indexeras
+    med 'rebuild'.
+
+    Returns:
+        True om indexet finns efter anropet, False om FTS5 saknas
+    """
+    if not fts5_available(conn):
+        logger.warning("SQLite lacks FTS5, text search falls back to LIKE")
+        return False
+
+    fts = fts_table_name(table)
+    cols = ', '.join(columns)
+    new_values = ', '.join(f"new.{c}" for c in columns)
+    old_values = ', '.join(f"old.{c}" for c in columns)
+
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+        {cols},
+        content='{table}',
+        content_rowid='id',
+        tokenize='{TOKENIZER}'
+    )
+    """)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+    END
+    """)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+    END
+    """)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+        INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+    END
+    """)
+
+    conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    conn.commit()
+    logger.info(f"Created full-text index {fts}")
+    return True
+
+
+def ensure_fts_index(conn: sqlite3.Connection, table: str,
+                     columns: Sequence[str]) -> bool:
+    """Skapa indexet om det saknas
+
+    Körs vid varje start i stället för att följa schemaversionen, så att
+    indexet byggs så fort SQLite har FTS5 även om databasen migrerats utan.
+
+    Returns:
+        True om indexet finns efter anropet
+    """
+    if fts_exists(conn, table):
+        return True
+    return create_fts_index(conn, table, columns)
+
+
+def build_match_query(text: str, prefix: bool = True) -> Optional[str]:
+    """Bygg en säker FTS5 MATCH-fråga av fritext
+
+    Varje ord citeras så att operatörer och specialtecken i OCR-text inte
+    tolkas som frågesyntax. Alla ord måste förekomma.
+
+    Args:
+        text: Sökord, t.ex. 'Hallonmunk' eller ett batchnummer
+        prefix: Matcha även ord som börjar med sökorden
+
+    Returns:
+        MATCH-uttryck, eller None om texten saknar sökbara ord
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    suffix = '*' if prefix else ''
+    return ' AND '.join(f'"{token}"{suffix}' for token in tokens)
+
+
+def search(conn: sqlite3.Connection,
+           table: str,
+           text: str,
+           columns: Sequence[str],
+           where: Sequence[str] = (),
+           params: Sequence[Any] = (),
+           order: str = 'rank',
+           limit: int = 50,
+           prefix: bool = True) -> List[Dict]:
+    """Sök i en tabell via dess FTS-index, med LIKE som reserv
+
+    Args:
+        conn: Öppen databasanslutning
+        table: Innehållstabell
+        text: Sökord
+        columns: Indexerade kolumner (används för LIKE-reserven)
+        where: Extra villkor på innehållstabellen (alias 't')
+        params: Parametrar till villkoren
+        order: 'rank' för relevans (bm25) eller 'recent' för nyast först
+        limit: Maximalt antal träffar
+        prefix: Prefixmatchning per ord
+
+    Returns:
+        Lista med rader som dict, med 'score' (lägre = bättre vid 'rank')
+    """
+    conn.row_factory = sqlite3.Row
+    conditions = list(where)
+    query_params = list(params)
+
+    if fts_exists(conn, table):
+        match = build_match_query(text, prefix=prefix)
+        if match is None:
+            return []
+
+        fts = fts_table_name(table)
+        conditions.insert(0, f"{fts} MATCH ?")
+        query_params.insert(0, match)
+        if order == 'rank':
+            order_sql = f"{fts}.rank, t.timestamp_ms DESC"
+        else:
+            order_sql = "t.timestamp_ms DESC, t.id DESC"
+        query = f"""
+        SELECT t.*, {fts}.rank AS score
+        FROM {fts} JOIN {table} t ON t.id = {fts}.rowid
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order_sql}
+        LIMIT ?
+        """
+    else:
+        like = ' OR '.join(f"t.{c} LIKE ?" for c in columns)
+        conditions.insert(0, f"({like})")
+        query_params[0:0] = [f"%{text}%"] * len(columns)
+        query = f"""
+        SELECT t.*, 0.0 AS score
+        FROM {table} t
+        WHERE {' AND '.join(conditions)}
+        ORDER BY t.timestamp_ms DESC, t.id DESC
+        LIMIT ?
+        """
+
+    query_params.append(limit)
+    return [dict(row) for row in conn.execute(query, query_params)]
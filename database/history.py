@@ -0,0 +1,158 @@
+"""Strömmande läsning av inspektionshistorik med keyset-paginering"""
+
+import sqlite3
+import json
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+DEFAULT_PAGE_SIZE = 500
+
+# Kolumner som alltid läses eftersom de utgör pagineringsnyckeln
+KEY_COLUMNS = ('timestamp_ms', 'id')
+
+
+class HistoryRecord(Mapping):
+    """En rad ur historiken där metadata avkodas först vid åtkomst"""
+
+    __slots__ = ('_row', '_decoded')
+
+    def __init__(self, row: sqlite3.Row):
+        self._row = row
+        self._decoded = None
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            value = self._row[key]
+        except IndexError:
+            raise KeyError(key) from None
+
+        if key != 'metadata':
+            return value
+        if self._decoded is None:
+            self._decoded = json.loads(value) if value else {}
+        return self._decoded
+
+    def raw(self) -> Dict[str, Any]:
+        """Raden som dict med metadata kvar som JSON-sträng"""
+        return dict(zip(self._row.keys(), self._row))
+
+    def __iter__(self):
+        return iter(self._row.keys())
+
+    def __len__(self) -> int:
+        return len(self._row.keys())
+
+    def __repr__(self) -> str:
+        return f"HistoryRecord(id={self._row['id']})"
+
+
+def resolve_columns(conn: sqlite3.Connection, table: str,
+                    columns: Optional[Sequence[str]]) -> List[str]:
+    """Validera projicerade kolumner mot tabellens schema
+
+    Raises:
+        ValueError: Om en okänd kolumn efterfrågas
+    """
+    available = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if not columns:
+        return available
+
+    unknown = [c for c in columns if c not in available]
+    if unknown:
+        raise ValueError(f"Okända kolumner för {table}: {', '.join(unknown)}")
+
+    selected = list(dict.fromkeys(columns))
+    for key in KEY_COLUMNS:
+        if key not in selected:
+            selected.append(key)
+    return selected
+
+
+def _key_phases(descending: bool, after: Optional[tuple]) -> List[tuple]:
+    """Faser (null_timestamps, nyckel) som iterationen går igenom
+
+    Rader utan timestamp_ms läses i en egen fas sorterad på id. De kommer
+    först i stigande ordning och sist i fallande, som i SQLites sortering.
+    """
+    phases = [(False, None), (True, None)] if descending else [(True, None), (False, None)]
+    if after is None:
+        return phases
+    null_phase = after[0] is None
+    while phases[0][0] != null_phase:
+        phases.pop(0)
+    phases[0] = (null_phase, tuple(after))
+    return phases
+
+
+def iter_history(connect: Callable[[], sqlite3.Connection],
+                 table: str,
+                 where: Sequence[str] = (),
+                 params: Sequence[Any] = (),
+                 columns: Optional[Sequence[str]] = None,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 descending: bool = True,
+                 after: Optional[tuple] = None) -> Iterator[HistoryRecord]:
+    """Strömma rader sida för sida, sorterade på (timestamp_ms, id)
+
+    Varje sida hämtas i en egen kortlivad anslutning och nästa sida startar
+    efter senast levererade nyckel, så minnesanvändningen är konstant och
+    inga läsetransaktioner hålls öppna mellan sidorna. Rader utan
+    timestamp_ms sorteras som i SQLite (först i stigande ordning) och läses
+    i en separat fas, eftersom radjämförelsen med NULL aldrig är sann.
+
+    Args:
+        connect: Funktion som öppnar en ny databasanslutning
+        table: Tabell att läsa
+        where: SQL-villkor som kombineras med AND
+        params: Parametrar till villkoren
+        columns: Kolumner att läsa (None = alla). id och timestamp_ms
+            läggs alltid till
+        page_size: Antal rader per sida
+        descending: Nyaste först om True
+        after: Pagineringsnyckel (timestamp_ms, id) att fortsätta efter
+
+    Yields:
+        HistoryRecord för varje rad
+    """
+    order = 'DESC' if descending else 'ASC'
+    comparison = '<' if descending else '>'
+    selected = None
+
+    for null_phase, cursor_key in _key_phases(descending, after):
+        while True:
+            conn = connect()
+            try:
+                conn.row_factory = sqlite3.Row
+                if selected is None:
+                    selected = resolve_columns(conn, table, columns)
+
+                conditions = list(where)
+                query_params = list(params)
+                if null_phase:
+                    conditions.append("timestamp_ms IS NULL")
+                    if cursor_key is not None:
+                        conditions.append(f"id {comparison} ?")
+                        query_params.append(cursor_key[1])
+                    order_sql = f"id {order}"
+                else:
+                    conditions.append("timestamp_ms IS NOT NULL")
+                    if cursor_key is not None:
+                        conditions.append(f"(timestamp_ms, id) {comparison} (?, ?)")
+                        query_params.extend(cursor_key)
+                    order_sql = f"timestamp_ms {order}, id {order}"
+
+                query = f"SELECT {', '.join(selected)} FROM {table}"
+                query += " WHERE " + " AND ".join(conditions)
+                query += f" ORDER BY {order_sql} LIMIT ?"
+                query_params.append(page_size)
+
+                rows = conn.execute(query, query_params).fetchall()
+            finally:
+                conn.close()
+
+            for row in rows:
+                yield HistoryRecord(row)
+
+            if len(rows) < page_size:
+                break
+            cursor_key = (rows[-1]['timestamp_ms'], rows[-1]['id'])
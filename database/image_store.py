@@ -0,0 +1,302 @@
+"""Innehållsadresserad lagring av inspektionsbilder"""
+
+import cv2
+import numpy as np
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Kvalitetsnivåer: (filändelse, OpenCV-flagga, kvalitet)
+QUALITY_TIERS = {
+    'lossless': ('.png', cv2.IMWRITE_PNG_COMPRESSION, 3),
+    'standard': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 90),
+    'compact': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 70),
+    'archive': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 60),
+}
+
+# Packfiler roteras när de når denna storlek
+MAX_PACK_SIZE = 256 * 1024 * 1024
+
+
+def image_digest(image: np.ndarray) -> str:
+    """Beräkna innehållshash för en bild
+
+    Hashen beräknas på pixeldata och dimensioner, inte på den kodade filen,
+    så identiska bildrutor får samma hash oavsett kvalitetsnivå.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str(image.shape).encode('ascii'))
+    h.update(str(image.dtype).encode('ascii'))
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+class ImageStore:
+    """Lagrar bilder namngivna efter innehållshash i shardade kataloger
+
+    Layout under root:
+        ab/cd/abcd...<ext>      lösa bilder (två nivåer av shards)
+        packs/pack-*.pack       komprimerade arkiv av äldre bilder
+        index.db                index över bilder i packfiler
+    """
+
+    def __init__(self, root: str = "data/images", tier: str = 'standard'):
+        """Initiera bildlagringen
+
+        Args:
+            root: Rotkatalog för lagringen
+            tier: Standardnivå för kvalitet, se QUALITY_TIERS
+        """
+        if tier not in QUALITY_TIERS:
+            raise ValueError(f"Okänd kvalitetsnivå: {tier}")
+
+        self.root = Path(root)
+        self.tier = tier
+        self.pack_dir = self.root / "packs"
+        self.index_path = self.root / "index.db"
+        self._lock = threading.Lock()
+        self._compactor = None
+        self._stop_event = threading.Event()
+
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        self._init_index()
+
+    @classmethod
+    def from_config(cls, validation_config: Dict,
+                    start_compactor: bool = True) -> Optional['ImageStore']:
+        """Skapa lagring för underkända valideringar från main_config.json
+
+        Args:
+            validation_config: Avsnittet 'validation' i main_config.json
+            start_compactor: Starta bakgrundstråden som packar bilder äldre
+                än compact_after_days
+
+        Returns:
+            Lagringen, eller None om save_failed_validations är avstängt
+        """
+        if not validation_config.get('save_failed_validations', True):
+            return None
+
+        store = cls(
+            root=validation_config.get('failed_validations_dir', 'data/failed_validations'),
+            tier=validation_config.get('failed_validations_tier', 'compact')
+        )
+        if start_compactor:
+            store.start_compactor(older_than_days=validation_config.get('compact_after_days', 7.0))
+        return store
+
+    def _init_index(self):
+        """Initiera index för packade bilder"""
+        with sqlite3.connect(self.index_path) as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS packed_images (
+                digest TEXT PRIMARY KEY,
+                pack TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                ext TEXT NOT NULL
+            )
+            """)
+            conn.commit()
+
+    def _shard_dir(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4]
+
+    def _loose_path(self, digest: str) -> Optional[Path]:
+        """Hitta en lös fil för hashen oavsett filändelse"""
+        shard = self._shard_dir(digest)
+        for ext in {t[0] for t in QUALITY_TIERS.values()}:
+            path = shard / f"{digest}{ext}"
+            if path.exists():
+                return path
+        return None
+
+    def _packed_entry(self, digest: str) -> Optional[Tuple[str, int, int, str]]:
+        with sqlite3.connect(self.index_path) as conn:
+            return conn.execute(
+                "SELECT pack, offset, length, ext FROM packed_images WHERE digest = ?",
+                (digest,)
+            ).fetchone()
+
+    def contains(self, digest: str) -> bool:
+        """Kontrollera om en bild finns i lagringen"""
+        return self._loose_path(digest) is not None or self._packed_entry(digest) is not None
+
+    def put(self, image: np.ndarray,
+            roi: Optional[Tuple[int, int, int, int]] = None,
+            tier: Optional[str] = None) -> Optional[str]:
+        """Spara en bild (eller ett utsnitt) och returnera dess hash
+
+        Identiska bilder lagras bara en gång.
+
+        Args:
+            image: BGR-bild
+            roi: Utsnitt som (x1, y1, x2, y2), None för hela bilden
+            tier: Kvalitetsnivå, None för lagringens standardnivå
+
+        Returns:
+            Bildens hash, eller None om bilden är tom eller inte kunde kodas
+        """
+        if roi is not None:
+            x1, y1, x2, y2 = roi
+            image = image[max(0, y1):y2, max(0, x1):x2]
+        if image is None or image.size == 0:
+            return None
+
+        digest = image_digest(image)
+        if self.contains(digest):
+            return digest
+
+        ext, flag, quality = QUALITY_TIERS[tier or self.tier]
+        ok, encoded = cv2.imencode(ext, image, [flag, quality])
+        if not ok:
+            logger.error(f"Could not encode image as {ext}")
+            return None
+
+        shard = self._shard_dir(digest)
+        shard.mkdir(parents=True, exist_ok=True)
+        target = shard / f"{digest}{ext}"
+
+        # Skriv atomiskt så att läsare aldrig ser en halvskriven fil
+        tmp = target.with_suffix(f"{ext}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(encoded.tobytes())
+        os.replace(tmp, target)
+
+        return digest
+
+    def read_bytes(self, digest: str) -> Optional[bytes]:
+        """Läs den kodade bilden för en hash"""
+        path = self._loose_path(digest)
+        if path is not None:
+            try:
+                return path.read_bytes()
+            except FileNotFoundError:
+                # Filen packades mellan sökning och läsning
+                pass
+
+        entry = self._packed_entry(digest)
+        if entry is None:
+            return None
+
+        pack, offset, length, _ = entry
+        with open(self.pack_dir / pack, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        """Läs och avkoda en bild"""
+        data = self.read_bytes(digest)
+        if data is None:
+            return None
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def path_for(self, digest: str) -> Optional[str]:
+        """Sökväg till en lös bildfil, None om bilden är packad eller saknas"""
+        path = self._loose_path(digest)
+        return str(path) if path is not None else None
+
+    def list_images(self) -> List[Tuple[str, str]]:
+        """Alla lagrade bilder som (hash, filändelse), lösa och packade"""
+        images = {path.stem: path.suffix for path in self.root.glob("??/??/*.*") if path.suffix != '.tmp'}
+        with sqlite3.connect(self.index_path) as conn:
+            for digest, ext in conn.execute("SELECT digest, ext FROM packed_images"):
+                images.setdefault(digest, ext)
+        return sorted(images.items())
+
+    def compact(self, older_than_days: float = 7.0) -> int:
+        """Packa lösa bilder äldre än angiven ålder i arkivfiler
+
+        Bilderna skrivs sekventiellt till en packfil och indexeras med
+        offset och längd innan de lösa filerna tas bort.
+
+        Returns:
+            Antal packade bilder
+        """
+        cutoff = time.time() - older_than_days * 24 * 60 * 60
+        packed = 0
+
+        with self._lock:
+            pack_name = f"pack-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.pack"
+            pack_file = None
+            entries = []
+            compacted = []
+
+            try:
+                for path in self.root.glob("??/??/*.*"):
+                    if path.suffix == '.tmp' or path.stat().st_mtime >= cutoff:
+                        continue
+
+                    if pack_file is None or pack_file.tell() >= MAX_PACK_SIZE:
+                        if pack_file is not None:
+                            self._commit_pack(pack_file, entries, compacted)
+                            packed += len(entries)
+                            entries, compacted = [], []
+                            pack_name = f"pack-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.pack"
+                        pack_file = open(self.pack_dir / pack_name, 'ab')
+
+                    data = path.read_bytes()
+                    offset = pack_file.tell()
+                    pack_file.write(data)
+                    entries.append((path.stem, pack_name, offset, len(data), path.suffix))
+                    compacted.append(path)
+
+                if pack_file is not None:
+                    self._commit_pack(pack_file, entries, compacted)
+                    packed += len(entries)
+            finally:
+                if pack_file is not None and not pack_file.closed:
+                    pack_file.close()
+
+        if packed:
+            logger.info(f"Compacted {packed} images into archive packs")
+        return packed
+
+    def _commit_pack(self, pack_file, entries, compacted):
+        """Synka packfilen, indexera den och ta bort de lösa filerna"""
+        pack_file.flush()
+        os.fsync(pack_file.fileno())
+        pack_file.close()
+
+        with sqlite3.connect(self.index_path) as conn:
+            conn.executemany("""
+            INSERT OR IGNORE INTO packed_images (digest, pack, offset, length, ext)
+            VALUES (?, ?, ?, ?, ?)
+            """, entries)
+            conn.commit()
+
+        for path in compacted:
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"Could not remove compacted image {path}: {str(e)}")
+
+    def start_compactor(self, interval: float = 3600.0, older_than_days: float = 7.0):
+        """Starta en bakgrundstråd som packar gamla bilder periodiskt"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+
+        def run():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.compact(older_than_days)
+                except Exception as e:
+                    logger.error(f"Error compacting image store: {str(e)}")
+
+        self._stop_event.clear()
+        self._compactor = threading.Thread(target=run, name="ImageStoreCompactor", daemon=True)
+        self._compactor.start()
+
+    def stop_compactor(self):
+        """Stoppa bakgrundstråden"""
+        self._stop_event.set()
+        if self._compactor is not None:
+            self._compactor.join(timeout=5.0)
+            self._compactor = None
@@ -0,0 +1,156 @@
+"""Schemamigreringar och retention för Label Vision Systems SQLite-databaser"""
+
+import sqlite3
+import logging
+import time
+from typing import Callable, Optional
+
+from database.timestamps import to_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# Antal rader per transaktion vid backfill och borttagning. Hålls litet så att
+# skrivlåset släpps ofta och pågående loggning inte blockeras.
+DEFAULT_BATCH_SIZE = 5000
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Hämta databasens schemaversion (PRAGMA user_version)"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def set_schema_version(conn: sqlite3.Connection, version: int):
+    """Sätt databasens schemaversion"""
+    conn.execute(f"PRAGMA user_version = {int(version)}")
+    conn.commit()
+
+
+def enable_wal(conn: sqlite3.Connection):
+    """Aktivera WAL så att läsare och skrivare inte blockerar varandra"""
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Could not enable WAL mode: {str(e)}")
+
+
+def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    """Kontrollera om en kolumn finns i en tabell"""
+    rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return any(row[1] == column for row in rows)
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, column_type: str):
+    """Lägg till en kolumn om den inte redan finns"""
+    if not column_exists(conn, table, column):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        conn.commit()
+        logger.info(f"Added column {column} to {table}")
+
+
+def add_epoch_ms_column(conn: sqlite3.Connection,
+                        table: str,
+                        index_name: str,
+                        source_column: str = 'timestamp',
+                        target_column: str = 'timestamp_ms',
+                        batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Lägg till en indexerad epoch-ms-kolumn och fyll den från textkolumnen
+
+    Backfill sker i batchar med commit efter varje batch, så att en stor
+    befintlig databas kan migreras medan systemet loggar nya resultat.
+
+    Args:
+        conn: Öppen databasanslutning
+        table: Tabell att migrera
+        index_name: Namn på index för den nya kolumnen
+        source_column: Kolumn med tidsstämpel i textform
+        target_column: Ny heltalskolumn
+        batch_size: Antal rader per transaktion
+
+    Returns:
+        Antal rader som fylldes i
+    """
+    add_column(conn, table, target_column, 'INTEGER')
+
+    conn.execute(f"""
+    CREATE INDEX IF NOT EXISTS {index_name}
+    ON {table}({target_column}, id)
+    """)
+    conn.commit()
+
+    filled = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(f"""
+        SELECT id, {source_column} FROM {table}
+        WHERE {target_column} IS NULL AND id > ?
+        ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+
+        if not rows:
+            break
+
+        updates = [(to_epoch_ms(ts), row_id) for row_id, ts in rows]
+        conn.executemany(
+            f"UPDATE {table} SET {target_column} = ? WHERE id = ?",
+            [u for u in updates if u[0] is not None]
+        )
+        conn.commit()
+
+        filled += len(updates)
+        last_id = rows[-1][0]
+
+    if filled:
+        logger.info(f"Backfilled {target_column} for {filled} rows in {table}")
+    return filled
+
+
+def delete_in_batches(connect: Callable[[], sqlite3.Connection],
+                      table: str,
+                      cutoff_ms: int,
+                      column: str = 'timestamp_ms',
+                      batch_size: int = DEFAULT_BATCH_SIZE,
+                      pause: float = 0.01,
+                      max_batches: Optional[int] = None) -> int:
+    """Ta bort rader äldre än cutoff i korta, indexerade transaktioner
+
+    Varje batch körs i en egen transaktion och följs av en kort paus så att
+    andra skrivare hinner ta låset emellan. Därmed hålls skrivlåset aldrig
+    längre än det tar att ta bort en batch.
+
+    Args:
+        connect: Funktion som öppnar en ny databasanslutning
+        table: Tabell att rensa
+        cutoff_ms: Rader med tidsstämpel under detta värde tas bort
+        column: Indexerad epoch-ms-kolumn
+        batch_size: Maximalt antal rader per transaktion
+        pause: Paus i sekunder mellan batcharna
+        max_batches: Avbryt efter så många batchar (None = tills klart)
+
+    Returns:
+        Totalt antal borttagna rader
+    """
+    deleted = 0
+    batches = 0
+
+    with connect() as conn:
+        while max_batches is None or batches < max_batches:
+            cursor = conn.execute(f"""
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM {table}
+                WHERE {column} < ?
+                ORDER BY {column}, id
+                LIMIT ?
+            )
+            """, (cutoff_ms, batch_size))
+            conn.commit()
+
+            deleted += cursor.rowcount
+            batches += 1
+
+            if cursor.rowcount < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+
+    return deleted
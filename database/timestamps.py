@@ -0,0 +1,54 @@
+"""Tidsstämplar som heltal (epoch-millisekunder) för databaslagring"""
+
+from datetime import datetime, date
+from typing import Optional, Union
+
+TimestampLike = Union[str, int, float, datetime, date, None]
+
+
+def to_epoch_ms(value: TimestampLike) -> Optional[int]:
+    """Konvertera en tidsstämpel till epoch-millisekunder
+
+    Args:
+        value: ISO-sträng, datetime, date eller epoch (sekunder eller ms)
+
+    Returns:
+        Millisekunder sedan epoch, eller None om värdet inte kan tolkas
+    """
+    if value is None or value == '':
+        return None
+
+    if isinstance(value, bool):
+        return None
+
+    if isinstance(value, (int, float)):
+        # Värden under ~år 2286 i sekunder tolkas som sekunder
+        return int(value * 1000) if abs(value) < 10_000_000_000 else int(value)
+
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+
+    if isinstance(value, date):
+        return int(datetime(value.year, value.month, value.day).timestamp() * 1000)
+
+    text = str(value).strip()
+    if text.lstrip('-').isdigit():
+        return to_epoch_ms(int(text))
+
+    try:
+        # SQLite CURRENT_TIMESTAMP använder mellanslag istället för 'T'
+        return int(datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def from_epoch_ms(value: Optional[int]) -> Optional[datetime]:
+    """Konvertera epoch-millisekunder till lokal datetime"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value / 1000)
+
+
+def now_ms() -> int:
+    """Aktuell tid i epoch-millisekunder"""
+    return int(datetime.now().timestamp() * 1000)
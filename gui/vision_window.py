@@ -7,6 +7,7 @@ from PyQt5.QtGui import QImage, QPixmap, QIcon
 import cv2
 import logging
 import time
+from dataclasses import asdict
 from datetime import datetime
 from vision.vision_system import VisionSystem
 from models.database import Database
@@ -16,8 +17,11 @@ class VisionWindow(QMainWindow):
     
     inspection_started = pyqtSignal(bool)
     
-    def __init__(self, vision_system, label_id=None, parent=None):
-        """Initierar VisionWindow"""
+    def __init__(self, vision_system, label_id=None, parent=None, catalog=None):
+        """Initierar VisionWindow
+        
+        Finns en LabelCatalog hämtas etikettdata lokalt utan nätverksanrop.
+        """
         super().__init__(parent)
         self.logger = logging.getLogger(__name__)
         self.logger.debug("Initierar VisionWindow")
@@ -29,13 +33,18 @@ class VisionWindow(QMainWindow):
         self.logger.debug("Databas initierad")
         
         self.label_id = label_id
+        self.catalog = catalog
         self.inspection_active = False
         self.inspection_results = {}
         self.start_time = None
         
         # Hämta etikettdata direkt
         try:
-            if self.label_id is not None:
+            reference = self.catalog.get(label_id) if self.catalog and label_id is not None else None
+            if reference is not None:
+                self.label_info = asdict(reference)
+                self.vision_system.set_current_label(self.label_info)
+            elif self.label_id is not None:
                 self.label_info = self.vision_system.get_label_data(label_id)
                 self.vision_system.set_current_label(self.label_info)
             else:
@@ -2,56 +2,51 @@ import cv2
 import numpy as np
 from pyzbar import pyzbar
 import logging
+import time
 from typing import Tuple, Optional
+from vision.barcode_localizer import BarcodeLocalizer, decode_localized
+from vision.barcode_ladder import DecodeLadder
 
 class BarcodeReader:
     """Hanterar streckkodsläsning från bilder"""
     
-    def __init__(self):
-        """Initierar streckkodsläsaren"""
-        self.logger = logging.getLogger(__name__)
-        
-    def preprocess_barcode(self, image: np.ndarray) -> np.ndarray:
-        """Förbehandlar bilden för bättre streckkodsläsning"""
-        # Konvertera till gråskala
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def __init__(self, budget_ms: float = 30.0):
+        """Initierar streckkodsläsaren
         
-        # Brusreducering
-        denoised = cv2.GaussianBlur(gray, (5, 5), 0)
+        Args:
+            budget_ms: Tidsbudget per bild för avkodningsstegen i millisekunder
+        """
+        self.logger = logging.getLogger(__name__)
+        self.localizer = BarcodeLocalizer()
+        self.ladder = DecodeLadder(pyzbar.decode, budget_ms)
         
-        # Adaptiv thresholding
-        binary = cv2.adaptiveThreshold(
-            denoised,
-            255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY,
-            11,
-            2
+    def _decode(self, image: np.ndarray, label_type: Optional[str] = None,
+                budget_ms: Optional[float] = None) -> list:
+        """Lokalisera och avkoda med stegen inom en gemensam tidsbudget för bilden"""
+        budget = self.ladder.budget_ms if budget_ms is None else budget_ms
+        deadline = time.perf_counter() + budget / 1000.0
+        return decode_localized(
+            image,
+            lambda crop: self.ladder(crop, label_type, deadline),
+            self.localizer
         )
         
-        # Morfologisk operation för att förbättra streckkoden
-        kernel = np.ones((3,3), np.uint8)
-        morphed = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-        
-        return morphed
+    def detect_barcode(self, image: np.ndarray, label_type: Optional[str] = None,
+                       budget_ms: Optional[float] = None) -> Tuple[bool, str, float]:
+        """Detekterar streckkod i bilden
         
-    def detect_barcode(self, image: np.ndarray) -> Tuple[bool, str, float]:
-        """Detekterar streckkod i bilden"""
+        Args:
+            image: BGR-bild
+            label_type: Etikettyp, stegens ordning lärs in per typ
+            budget_ms: Tidsbudget för bilden, None för standard
+        """
         try:
-            # Förbehandla bilden
-            processed = self.preprocess_barcode(image)
-            
-            # Sök efter streckkoder
-            barcodes = pyzbar.decode(processed)
-            
-            if barcodes:
-                # Ta den första streckkoden som hittas
-                barcode = barcodes[0]
-                
-                # Beräkna kvalitet baserat på streckkodens area
-                quality = min(100.0, (barcode.rect.width * barcode.rect.height) / 1000)
-                
-                return True, barcode.data.decode('utf-8'), quality
+            found = self._decode(image, label_type, budget_ms)
+            if found:
+                # Kvalitet baserat på streckkodens area
+                x1, y1, x2, y2 = found[0]['box']
+                quality = min(100.0, ((x2 - x1) * (y2 - y1)) / 1000)
+                return True, found[0]['data'], quality
                 
             return False, "", 0.0
             
@@ -59,34 +54,26 @@ class BarcodeReader:
             self.logger.error(f"Fel vid streckkodsläsning: {str(e)}")
             return False, "", 0.0
             
-    def get_barcode_regions(self, image: np.ndarray) -> list:
+    def get_barcode_regions(self, image: np.ndarray, label_type: Optional[str] = None,
+                            budget_ms: Optional[float] = None) -> list:
         """Hittar regioner med streckkoder i bilden"""
         try:
-            # Förbehandla bilden
-            processed = self.preprocess_barcode(image)
-            
-            # Hitta streckkoder
-            barcodes = pyzbar.decode(processed)
-            
-            regions = []
-            for barcode in barcodes:
-                # Få streckkodens position
-                rect = barcode.rect
-                polygon = barcode.polygon
-                
-                regions.append({
-                    'type': barcode.type,
-                    'data': barcode.data.decode('utf-8'),
-                    'rect': (rect.left, rect.top, rect.width, rect.height),
-                    'polygon': polygon
-                })
-                
-            return regions
+            return [{
+                'type': barcode['type'],
+                'data': barcode['data'],
+                'rect': (barcode['box'][0], barcode['box'][1],
+                         barcode['box'][2] - barcode['box'][0], barcode['box'][3] - barcode['box'][1]),
+                'polygon': barcode['points']
+            } for barcode in self._decode(image, label_type, budget_ms)]
             
         except Exception as e:
             self.logger.error(f"Fel vid identifiering av streckkodsregioner: {str(e)}")
             return []
             
+    def ladder_stats(self) -> dict:
+        """Lyckade och totala avkodningsförsök per etikettyp och variant"""
+        return self.ladder.stats()
+        
     def draw_barcode_regions(self, image: np.ndarray, regions: list) -> np.ndarray:
         """Ritar ut streckkodsregioner på bilden"""
         annotated = image.copy()
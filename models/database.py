@@ -1,12 +1,27 @@
 """Databashantering för Label Vision System"""
 
 import sqlite3
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 import os
 import json
 from pathlib import Path
 
+from database.migrations import (
+    DEFAULT_BATCH_SIZE, add_column, add_epoch_ms_column, delete_in_batches,
+    enable_wal, get_schema_version, set_schema_version
+)
+from database.fulltext import ensure_fts_index, search
+from database.history import DEFAULT_PAGE_SIZE, HistoryRecord, iter_history
+from database.timestamps import to_epoch_ms, now_ms
+
+# Version 1: timestamp_ms (epoch-ms, indexerad) i inspections
+# Version 2: FTS5-index över detected_text/detected_barcode (skapas vid varje start om det saknas)
+# Version 3: image_hash som referens till ImageStore
+SCHEMA_VERSION = 3
+
+FTS_COLUMNS = ('detected_text', 'detected_barcode')
+
 class Database:
     """Hanterar databasoperationer för vision-systemet"""
     
@@ -38,7 +53,8 @@ class Database:
                     detected_barcode TEXT,
                     error_message TEXT,
                     image_path TEXT,
-                    metadata TEXT
+                    metadata TEXT,
+                    timestamp_ms INTEGER
                 )
             ''')
             
@@ -57,6 +73,31 @@ class Database:
             
             conn.commit()
             
+            enable_wal(conn)
+            self._migrate(conn)
+            
+    def _migrate(self, conn: sqlite3.Connection):
+        """Migrerar äldre databasfiler till aktuell schemaversion"""
+        # FTS5 kan saknas i en SQLite-version och finnas i nästa, så indexet
+        # kontrolleras vid varje start och inte via schemaversionen
+        ensure_fts_index(conn, 'inspections', FTS_COLUMNS)
+        
+        version = get_schema_version(conn)
+        if version >= SCHEMA_VERSION:
+            return
+            
+        if version < 1:
+            add_epoch_ms_column(conn, 'inspections', 'idx_inspections_timestamp_ms')
+            
+        if version < 3:
+            add_column(conn, 'inspections', 'image_hash', 'TEXT')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_inspections_image_hash ON inspections(image_hash)'
+            )
+            conn.commit()
+            
+        set_schema_version(conn, SCHEMA_VERSION)
+            
     def log_inspection(self, inspection_data: Dict) -> int:
         """Loggar ett inspektionsresultat"""
         with sqlite3.connect(self.db_path) as conn:
@@ -69,6 +110,7 @@ class Database:
             # Sätt timestamp om det inte finns
             if 'timestamp' not in inspection_data:
                 inspection_data['timestamp'] = datetime.now().isoformat()
+            inspection_data['timestamp_ms'] = to_epoch_ms(inspection_data['timestamp']) or now_ms()
                 
             # Bygg SQL-frågan dynamiskt
             fields = ', '.join(inspection_data.keys())
@@ -80,34 +122,32 @@ class Database:
                 values
             )
             
-            # Uppdatera statistik
+            # Uppdatera statistik i samma transaktion
             self._update_statistics(
+                cursor,
                 inspection_data['status'] == 'OK',
                 inspection_data.get('confidence', 0.0)
             )
             
             return cursor.lastrowid
             
-    def _update_statistics(self, passed: bool, confidence: float):
+    def _update_statistics(self, cursor: sqlite3.Cursor, passed: bool, confidence: float):
         """Uppdaterar statistik för dagens datum"""
         today = datetime.now().date()
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Försök uppdatera befintlig statistik
-            cursor.execute('''
-                INSERT INTO statistics (date, total_inspections, passed_inspections,
-                                     failed_inspections, average_confidence)
-                VALUES (?, 1, ?, ?, ?)
-                ON CONFLICT(date) DO UPDATE SET
-                    total_inspections = total_inspections + 1,
-                    passed_inspections = passed_inspections + ?,
-                    failed_inspections = failed_inspections + ?,
-                    average_confidence = (average_confidence * total_inspections + ?) /
-                                       (total_inspections + 1)
-            ''', (today, int(passed), int(not passed), confidence,
-                  int(passed), int(not passed), confidence))
+        # Försök uppdatera befintlig statistik
+        cursor.execute('''
+            INSERT INTO statistics (date, total_inspections, passed_inspections,
+                                 failed_inspections, average_confidence)
+            VALUES (?, 1, ?, ?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                total_inspections = total_inspections + 1,
+                passed_inspections = passed_inspections + ?,
+                failed_inspections = failed_inspections + ?,
+                average_confidence = (average_confidence * total_inspections + ?) /
+                                   (total_inspections + 1)
+        ''', (today, int(passed), int(not passed), confidence,
+              int(passed), int(not passed), confidence))
                   
     def get_statistics(self, start_date: Optional[datetime] = None,
                       end_date: Optional[datetime] = None) -> Dict:
@@ -148,21 +188,78 @@ class Database:
             
             cursor.execute('''
                 SELECT * FROM inspections
-                ORDER BY timestamp DESC
+                ORDER BY timestamp_ms DESC, id DESC
                 LIMIT ?
             ''', (limit,))
             
             return [dict(row) for row in cursor.fetchall()]
             
-    def save_inspection_image(self, image_path: str, inspection_id: int):
-        """Sparar sökväg till inspektionsbild"""
+    def iter_inspections(self, start_date: Optional[datetime] = None,
+                         end_date: Optional[datetime] = None,
+                         label_id: Optional[str] = None,
+                         columns: Optional[Sequence[str]] = None,
+                         page_size: int = DEFAULT_PAGE_SIZE,
+                         descending: bool = True,
+                         after: Optional[tuple] = None) -> Iterator[HistoryRecord]:
+        """Strömmar inspektioner med keyset-paginering på (timestamp_ms, id)
+        
+        Metadata avkodas först när den läses från respektive rad.
+        """
+        where = []
+        params = []
+        
+        if start_date:
+            where.append('timestamp_ms >= ?')
+            params.append(to_epoch_ms(start_date))
+        if end_date:
+            where.append('timestamp_ms <= ?')
+            params.append(to_epoch_ms(end_date))
+        if label_id:
+            where.append('label_id = ?')
+            params.append(label_id)
+            
+        return iter_history(
+            lambda: sqlite3.connect(self.db_path),
+            'inspections',
+            where=where,
+            params=params,
+            columns=columns,
+            page_size=page_size,
+            descending=descending,
+            after=after
+        )
+            
+    def search_inspections(self, text: str, label_id: Optional[str] = None,
+                           order: str = 'rank', limit: int = 50) -> List[Dict]:
+        """Fritextsöker i detekterad text och streckkod
+        
+        order='recent' ger senaste träff först, t.ex. för att se när en
+        viss batch senast inspekterades.
+        """
+        where = []
+        params = []
+        if label_id:
+            where.append('t.label_id = ?')
+            params.append(label_id)
+            
+        with sqlite3.connect(self.db_path) as conn:
+            return search(conn, 'inspections', text, FTS_COLUMNS,
+                          where=where, params=params, order=order, limit=limit)
+            
+    def save_inspection_image(self, image_path: Optional[str], inspection_id: int,
+                              image_hash: Optional[str] = None):
+        """Sparar referens till inspektionsbild
+        
+        image_hash refererar till en bild i ImageStore. image_path behålls
+        för bilder som lagras utanför den.
+        """
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE inspections
-                SET image_path = ?
+                SET image_path = ?, image_hash = ?
                 WHERE id = ?
-            ''', (image_path, inspection_id))
+            ''', (image_path, image_hash, inspection_id))
             
     def get_inspection_by_id(self, inspection_id: int) -> Optional[Dict]:
         """Hämtar en specifik inspektion"""
@@ -174,3 +271,19 @@ class Database:
             row = cursor.fetchone()
             
             return dict(row) if row else None
+            
+    def delete_old_inspections(self, days: int = 30,
+                               batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """Tar bort inspektioner äldre än angivet antal dagar
+        
+        Raderar i små batchar via indexet på timestamp_ms så att
+        skrivlåset släpps mellan varje batch.
+        """
+        cutoff = (datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+                  - timedelta(days=days))
+        return delete_in_batches(
+            lambda: sqlite3.connect(self.db_path),
+            'inspections',
+            to_epoch_ms(cutoff),
+            batch_size=batch_size
+        )
@@ -4,14 +4,28 @@ Detta script:
 1. Kopierar bilder från Labels-mappen till dataset/images
 2. Delar upp bilderna i train/val/test set
 3. Skapar en struktur för annoteringar
+
+Bilderna avkodas och skalas om parallellt i en processpool. Ett manifest
+(dataset/.prepare_manifest.json) med ändringstid, storlek och
+innehållshash gör att redan förberedda bilder hoppas över nästa körning.
+Uppdelningen bestäms av en seedad hash av sökvägen, så en bild hamnar i
+samma set varje gång och nya bilder inte flyttar de gamla. Bilderna
+skrivs som vanliga filer så att de kan annoteras; träningsskripten packar
+sedan om dem till shards med utils.dataset_shards.
 """
 
+import argparse
+import hashlib
+import json
 import os
-import shutil
-import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import logging
+from typing import Dict, Optional, Tuple
 import cv2
+import numpy as np
 
 # Konfigurera logging
 logging.basicConfig(
@@ -20,120 +34,246 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SPLITS = ('train', 'val', 'test')
+MANIFEST_FILE = '.prepare_manifest.json'
+
+# Sparar manifestet med jämna mellanrum så att en avbruten körning kan återupptas
+SAVE_EVERY = 100
+
+def resize_to_fit(img: np.ndarray, max_size: int) -> np.ndarray:
+    """Skalar ner bilden så att längsta sidan blir högst max_size (behåll proportioner)"""
+    height, width = img.shape[:2]
+    if max(height, width) <= max_size:
+        return img
+    scale = max_size / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+def split_for(key: str, seed: int, train_split: float = 0.7, val_split: float = 0.2) -> str:
+    """Bestämmer set för en bild utifrån en seedad hash av nyckeln
+    
+    Samma nyckel och seed ger alltid samma set, oberoende av vilka andra
+    bilder som finns.
+    """
+    digest = hashlib.blake2b(f"{seed}:{key}".encode('utf-8'), digest_size=8).digest()
+    position = int.from_bytes(digest, 'big') / 2 ** 64
+    if position < train_split:
+        return 'train'
+    if position < train_split + val_split:
+        return 'val'
+    return 'test'
+
+def _prepare_one(source: str, target: str, max_size: int,
+                 known_digest: Optional[str]) -> Tuple[str, Optional[str], Optional[str], Tuple[int, int]]:
+    """Förbereder en bild i en arbetsprocess
+    
+    Filen läses en gång och används både för innehållshashen och
+    avkodningen.
+    
+    Returns:
+        (status, innehållshash, felmeddelande, (bredd, höjd)) där status är
+        'prepared', 'unchanged' eller 'failed'
+    """
+    try:
+        data = Path(source).read_bytes()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if digest == known_digest:
+            return 'unchanged', digest, None, (0, 0)
+            
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return 'failed', digest, "Kunde inte avkoda bilden", (0, 0)
+        img = resize_to_fit(img, max_size)
+        
+        ok, encoded = cv2.imencode(Path(source).suffix.lower(), img)
+        if not ok:
+            return 'failed', digest, "Kunde inte koda bilden", (0, 0)
+            
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(encoded.data)
+        os.replace(tmp, target)
+        return 'prepared', digest, None, (img.shape[1], img.shape[0])
+        
+    except Exception as e:
+        return 'failed', None, str(e), (0, 0)
+
 class DatasetPreparer:
-    def __init__(self):
-        self.base_dir = Path(__file__).parent
+    def __init__(self, base_dir=None, max_size: int = 1024, seed: int = 0, workers: Optional[int] = None):
+        self.base_dir = Path(base_dir) if base_dir else Path(__file__).parent
         self.labels_dir = self.base_dir / "Labels"
         self.dataset_dir = self.base_dir / "dataset"
         self.train_dir = self.dataset_dir / "images" / "train"
         self.val_dir = self.dataset_dir / "images" / "val"
         self.test_dir = self.dataset_dir / "images" / "test"
+        self.max_size = max_size
+        self.seed = seed
+        self.workers = workers
         
         # Skapa alla nödvändiga mappar
         for dir in [self.train_dir, self.val_dir, self.test_dir]:
             dir.mkdir(parents=True, exist_ok=True)
             
+    @property
+    def split_dirs(self) -> Dict[str, Path]:
+        return {'train': self.train_dir, 'val': self.val_dir, 'test': self.test_dir}
+        
     def collect_images(self):
-        """Samla alla bilder från Labels-mappen"""
-        image_files = []
-        for ext in ['.jpg', '.jpeg', '.png']:
-            image_files.extend(list(self.labels_dir.rglob(f'*{ext}')))
-        return image_files
+        """Samla alla bilder från Labels-mappen i en genomgång"""
+        return sorted(p for p in self.labels_dir.rglob('*')
+                      if p.suffix.lower() in IMAGE_EXTENSIONS and p.is_file())
+                      
+    def _relative(self, image_path: Path) -> str:
+        return Path(image_path).relative_to(self.labels_dir).as_posix()
+        
+    @staticmethod
+    def target_name(image_path: Path) -> str:
+        """Filnamn i datasetet: föräldramapp och filnamn"""
+        image_path = Path(image_path)
+        return f"{image_path.parent.name}_{image_path.name}"
         
-    def prepare_image(self, image_path):
-        """Förbereder en bild för annotering"""
+    def _load_manifest(self) -> Dict[str, Dict]:
+        """Läser manifestet, tomt om det saknas, är trasigt eller gjordes med annan storlek"""
         try:
-            # Läs bilden
-            img = cv2.imread(str(image_path))
-            if img is None:
-                logger.error(f"Kunde inte läsa bild: {image_path}")
-                return None
-                
-            # Standardisera storlek (behåll proportioner)
-            max_size = 1024
-            height, width = img.shape[:2]
-            if height > max_size or width > max_size:
-                if height > width:
-                    new_height = max_size
-                    new_width = int(width * (max_size / height))
-                else:
-                    new_width = max_size
-                    new_height = int(height * (max_size / width))
-                img = cv2.resize(img, (new_width, new_height))
-                
-            return img
-            
-        except Exception as e:
-            logger.error(f"Fel vid bildbehandling av {image_path}: {e}")
-            return None
-            
-    def split_dataset(self, images, train_split=0.7, val_split=0.2):
-        """Dela upp bilder i train/val/test"""
-        random.shuffle(images)
-        n = len(images)
-        train_n = int(n * train_split)
-        val_n = int(n * val_split)
+            manifest = json.loads((self.dataset_dir / MANIFEST_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('max_size') != self.max_size:
+            return {}
+        return manifest.get('files', {})
+        
+    def _save_manifest(self, files: Dict[str, Dict]):
+        """Sparar manifestet atomiskt"""
+        path = self.dataset_dir / MANIFEST_FILE
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'max_size': self.max_size, 'files': files},
+                                  ensure_ascii=False, indent=1, sort_keys=True), encoding='utf-8')
+        os.replace(tmp, path)
         
-        train_images = images[:train_n]
-        val_images = images[train_n:train_n + val_n]
-        test_images = images[train_n + val_n:]
+    def build(self, force: bool = False, prune: bool = False,
+              train_split: float = 0.7, val_split: float = 0.2) -> Dict[str, int]:
+        """Förbereder alla bilder parallellt och inkrementellt
         
-        return train_images, val_images, test_images
+        Bilder vars ändringstid och storlek stämmer med manifestet hoppas över
+        direkt. Har de ändrats jämförs innehållshashen i arbetsprocessen innan
+        bilden avkodas.
         
-    def copy_and_prepare_images(self, image_list, target_dir):
-        """Kopiera och förbered bilder till målmappen"""
-        for img_path in image_list:
-            try:
-                # Förbered bilden
-                prepared_img = self.prepare_image(img_path)
-                if prepared_img is None:
-                    continue
+        Args:
+            force: Förbered alla bilder oavsett manifest
+            prune: Ta bort förberedda filer vars källbild försvunnit
+            train_split: Andel träningsbilder
+            val_split: Andel valideringsbilder
+            
+        Returns:
+            Antal förberedda, oförändrade, misslyckade och borttagna bilder
+        """
+        manifest = {} if force else self._load_manifest()
+        images = {self._relative(p): p for p in self.collect_images()}
+        counts = {'prepared': 0, 'unchanged': 0, 'failed': 0, 'removed': 0}
+        
+        # Gamla utdata för bilder som försvunnit
+        for relative in set(manifest) - set(images):
+            entry = manifest.pop(relative)
+            if prune:
+                try:
+                    os.remove(self.split_dirs[entry['split']] / entry['name'])
+                    counts['removed'] += 1
+                except OSError:
+                    pass
                     
-                # Skapa nytt filnamn
-                new_name = f"{img_path.parent.name}_{img_path.name}"
-                target_path = target_dir / new_name
-                
-                # Spara bilden
-                cv2.imwrite(str(target_path), prepared_img)
-                logger.info(f"Sparade {new_name} i {target_dir.name}")
-                
-            except Exception as e:
-                logger.error(f"Fel vid kopiering av {img_path}: {e}")
-                
-    def prepare_dataset(self):
-        """Huvudfunktion för att förbereda datasetet"""
-        try:
-            # Samla alla bilder
-            logger.info("Samlar bilder...")
-            images = self.collect_images()
+        pending = []
+        for relative, image_path in sorted(images.items()):
+            stat = image_path.stat()
+            split = split_for(relative, self.seed, train_split, val_split)
+            name = self.target_name(image_path)
+            entry = manifest.get(relative)
+            known = entry if entry and (self.split_dirs[entry['split']] / entry['name']).exists() else None
             
-            if not images:
-                logger.error("Inga bilder hittades!")
-                return
+            if known and known['split'] != split:
+                # Ny seed eller nya andelar: flytta filen i stället för att göra om den
+                os.replace(self.split_dirs[known['split']] / known['name'], self.split_dirs[split] / name)
+                known = dict(known, split=split, name=name)
+                manifest[relative] = known
                 
-            logger.info(f"Hittade {len(images)} bilder")
-            
-            # Dela upp i train/val/test
-            train_imgs, val_imgs, test_imgs = self.split_dataset(images)
-            
-            # Kopiera och förbered bilder
-            logger.info("Kopierar och förbereder träningsbilder...")
-            self.copy_and_prepare_images(train_imgs, self.train_dir)
+            if known and known['mtime'] == stat.st_mtime_ns and known['size'] == stat.st_size:
+                counts['unchanged'] += 1
+                continue
+            pending.append((relative, image_path, stat, split, name, known))
             
-            logger.info("Kopierar och förbereder valideringsbilder...")
-            self.copy_and_prepare_images(val_imgs, self.val_dir)
+        logger.info(f"Hittade {len(images)} bilder, {len(pending)} att förbereda")
+        
+        start = time.monotonic()
+        if pending:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = {}
+                for relative, image_path, stat, split, name, known in pending:
+                    future = pool.submit(_prepare_one, str(image_path), str(self.split_dirs[split] / name),
+                                         self.max_size, known['digest'] if known else None)
+                    futures[future] = (relative, stat, split, name, known)
+                    
+                for done, future in enumerate(as_completed(futures), 1):
+                    relative, stat, split, name, known = futures[future]
+                    status, digest, error, (width, height) = future.result()
+                    counts[status] += 1
+                    
+                    if status == 'failed':
+                        logger.error(f"Fel vid förberedelse av {relative}: {error}")
+                        manifest.pop(relative, None)
+                    else:
+                        if status == 'unchanged':
+                            width, height = known['width'], known['height']
+                        manifest[relative] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+                                              'digest': digest, 'split': split, 'name': name,
+                                              'width': width, 'height': height}
+                                              
+                    if done % SAVE_EVERY == 0:
+                        self._save_manifest(manifest)
+                        
+                    # Uppdatera framsteg
+                    elapsed = max(time.monotonic() - start, 1e-6)
+                    rate = done / elapsed
+                    print(f"\rFramsteg: {done / len(pending) * 100:.1f}% ({done}/{len(pending)}) "
+                          f"{rate:.1f} bilder/s, kvar {(len(pending) - done) / rate:.0f} s",
+                          end='', flush=True)
+            print()
             
-            logger.info("Kopierar och förbereder testbilder...")
-            self.copy_and_prepare_images(test_imgs, self.test_dir)
+        self._save_manifest(manifest)
+        return counts
+        
+    def prepare_dataset(self, force: bool = False, prune: bool = False):
+        """Huvudfunktion för att förbereda datasetet"""
+        try:
+            start = time.monotonic()
+            counts = self.build(force, prune)
             
-            logger.info("Dataset förberett och klart!")
-            logger.info(f"Train: {len(train_imgs)} bilder")
-            logger.info(f"Val: {len(val_imgs)} bilder")
-            logger.info(f"Test: {len(test_imgs)} bilder")
+            sizes = {split: 0 for split in SPLITS}
+            for entry in self._load_manifest().values():
+                sizes[entry['split']] += 1
+                
+            logger.info(f"Dataset förberett och klart på {time.monotonic() - start:.1f} s: {counts}")
+            logger.info(f"Train: {sizes['train']} bilder")
+            logger.info(f"Val: {sizes['val']} bilder")
+            logger.info(f"Test: {sizes['test']} bilder")
+            return counts
             
         except Exception as e:
             logger.error(f"Ett fel uppstod: {e}")
+            return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Förbereder bilder för annotering och träning")
+    parser.add_argument('--base-dir', default=None, help="Projektmapp med Labels/ och dataset/")
+    parser.add_argument('--max-size', type=int, default=1024, help="Längsta sida efter omskalning")
+    parser.add_argument('--seed', type=int, default=0, help="Seed för uppdelningen i train/val/test")
+    parser.add_argument('--workers', type=int, default=None, help="Antal processer")
+    parser.add_argument('--force', action='store_true', help="Förbered allt oavsett manifest")
+    parser.add_argument('--prune', action='store_true', help="Ta bort bilder utan källbild")
+    args = parser.parse_args()
+    
+    preparer = DatasetPreparer(args.base_dir, args.max_size, args.seed, args.workers)
+    counts = preparer.prepare_dataset(args.force, args.prune)
+    return 1 if counts is None or counts['failed'] else 0
 
 if __name__ == "__main__":
-    preparer = DatasetPreparer()
-    preparer.prepare_dataset()
+    sys.exit(main())
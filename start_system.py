@@ -1,10 +1,19 @@
 import sys
+import json
 import logging
 import os
 from PyQt5.QtWidgets import QApplication
+from labelvision.api.catalog import LabelCatalog
+from labelvision.api.label_api import LabelAPI
+from labelvision.api.outbox import InspectionOutbox
+from labelvision.database.db_manager import DatabaseManager
+from labelvision.database.image_store import ImageStore
 from labelvision.gui.vision_window import VisionWindow
+from labelvision.vision.reference_store import ReferenceStore
 from labelvision.vision.vision_system import VisionSystem
 
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config', 'main_config.json')
+
 def setup_logging():
     """Konfigurerar loggning"""
     # Skapa logs-katalogen om den inte finns
@@ -19,6 +28,23 @@ def setup_logging():
         ]
     )
 
+def load_config(path: str = CONFIG_PATH) -> dict:
+    """Läser main_config.json, tom konfiguration om filen saknas"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def load_reference_store(config: dict):
+    """Laddar referenslagret, None om det inte byggts"""
+    store = ReferenceStore(config.get('references', {}).get('store_dir', 'data/reference_store'))
+    if not store.load():
+        logging.getLogger(__name__).warning(
+            "Referenslagret saknas, bygg det med tools/build_reference_store.py")
+        return None
+    return store
+
 def main():
     """Huvudfunktion för att starta systemet"""
     # Konfigurera loggning
@@ -29,15 +55,34 @@ def main():
         # Skapa QApplication
         app = QApplication(sys.argv)
         
-        # Initiera vision system
-        vision_system = VisionSystem(use_test_image=True)
+        # Underkända valideringar sparas med bild; äldre bilder packas i bakgrunden
+        config = load_config()
+        image_store = ImageStore.from_config(config.get('validation', {}))
+        validations = DatabaseManager(image_store=image_store)
+        
+        # Inspektionsrapporter köas lokalt och skickas till NiceLabel i bakgrunden
+        outbox = InspectionOutbox(LabelAPI())
+        outbox.start()
         
+        # Etikettkatalogen startar från ögonblicksbilden och synkas i bakgrunden,
+        # så en långsam etikettserver fördröjer inte starten
+        catalog = LabelCatalog(label_api=LabelAPI())
+        catalog.load(sync=False)
+        catalog.start_refresh(immediate=True)
+        
+        # Initiera vision system
+        vision_system = VisionSystem(use_test_image=True, validations=validations, outbox=outbox,
+                                     reference_store=load_reference_store(config), catalog=catalog)
+                                     
         # Skapa och visa huvudfönstret
-        window = VisionWindow(vision_system)
+        window = VisionWindow(vision_system, catalog=catalog)
         window.show()
         
         # Starta applikationen
-        sys.exit(app.exec_())
+        exit_code = app.exec_()
+        catalog.stop_refresh()
+        outbox.stop()
+        sys.exit(exit_code)
         
     except Exception as e:
         logger.error(f"Fel vid start av systemet: {str(e)}")
@@ -0,0 +1,100 @@
+"""Tester för urvalet av bilder att annotera"""
+
+import tempfile
+import unittest
+from pathlib import Path
+import cv2
+import numpy as np
+from database.image_store import ImageStore
+from tools.active_sampler import Candidate, embed, export_selection, sample, select_diverse
+from tools.auto_annotator import Detection
+
+def _scene(seed):
+    """Unik scen med några former"""
+    rng = np.random.default_rng(seed)
+    image = np.full((240, 320, 3), 200, np.uint8)
+    for _ in range(4):
+        x, y = (int(v) for v in rng.integers(20, 220, 2))
+        cv2.rectangle(image, (x, y), (x + int(rng.integers(30, 90)), y + int(rng.integers(20, 60))),
+                      tuple(int(c) for c in rng.integers(0, 120, 3)), -1)
+    return image
+
+def _fake_scorers(confidences):
+    """Detektor utan modell: konfidensen läses från bildens övre vänstra pixel"""
+    def detect(images):
+        return [[Detection(0, 0.5, 0.5, 0.2, 0.2, confidences[int(image[0, 0, 0])])] for image in images]
+    return detect, None
+
+class TestActiveSampler(unittest.TestCase):
+    """Tester för sample och export_selection"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.captured = self.root / "captured_images"
+        self.train = self.root / "images" / "train"
+        (self.root / "labels" / "train").mkdir(parents=True)
+        self.captured.mkdir()
+        self.train.mkdir(parents=True)
+        
+        # Bild i har konfidensen confidences[i], markerad i pixel (0, 0); 6 ligger i lagringen
+        self.confidences = {i: c for i, c in enumerate([0.5, 0.95, 0.45, 0.99, 0.6, 0.98, 0.55])}
+        for i in range(6):
+            image = _scene(i)
+            image[0, 0] = i
+            cv2.imwrite(str(self.captured / f"frame_{i}.png"), image)
+        # Nästan identisk kopia av den osäkraste bilden
+        duplicate = cv2.add(_scene(0), np.full((240, 320, 3), 3, np.uint8))
+        duplicate[0, 0] = 0
+        cv2.imwrite(str(self.captured / "frame_0b.png"), duplicate)
+        
+        # Annoterad bild som liknar frame_2
+        cv2.imwrite(str(self.train / "done.png"), _scene(2))
+        (self.root / "labels" / "train" / "done.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+        
+        self.store = self.root / "failed"
+        image = _scene(10)
+        image[0, 0] = 6
+        ImageStore(str(self.store), tier='lossless').put(image)
+        
+    def tearDown(self):
+        self._tmp.cleanup()
+        
+    def _sample(self, count):
+        return sample([str(self.captured), str(self.train)], count, [str(self.store)], workers=2,
+                      diversity=0.0, factory=_fake_scorers, factory_args=(self.confidences,))
+                      
+    def test_dedupes_and_ranks_by_uncertainty(self):
+        """Dubbletter och bilder lika annoterade tas bort, osäkrast väljs först"""
+        selected = self._sample(3)
+        
+        names = [Path(c.key).name if not c.key.startswith('store:') else 'store' for c in selected]
+        self.assertEqual(names, ["frame_0.png", "store", "frame_4.png"])
+        self.assertAlmostEqual(selected[0].score, 1.0)
+        
+    def test_export_for_annotator(self):
+        """Urvalet kopieras till en mapp som label_annotator kan öppna"""
+        images_dir = export_selection(self._sample(2), self.root / "to_label")
+        
+        files = sorted(p.name for p in images_dir.iterdir())
+        self.assertEqual(len(files), 2)
+        self.assertIn("captured_images_frame_0.png", files)
+        self.assertTrue((self.root / "to_label" / "selection.json").exists())
+
+class TestSelectDiverse(unittest.TestCase):
+    """Tester för select_diverse"""
+    
+    def test_spreads_selection(self):
+        """Med spridning väljs en annan scen före en variant av den redan valda"""
+        gray = cv2.cvtColor(_scene(1), cv2.COLOR_BGR2GRAY)
+        variant = cv2.GaussianBlur(gray, (5, 5), 0)
+        other = cv2.cvtColor(_scene(2), cv2.COLOR_BGR2GRAY)
+        candidates = [Candidate('a', embedding=embed(gray), score=0.9),
+                      Candidate('b', embedding=embed(variant), score=0.85),
+                      Candidate('c', embedding=embed(other), score=0.6)]
+                      
+        self.assertEqual([c.key for c in select_diverse(candidates, [], 2, diversity=0.0)], ['a', 'b'])
+        self.assertEqual([c.key for c in select_diverse(candidates, [], 2, diversity=0.5)], ['a', 'c'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Tester för etikett-API-servern"""
+
+import gzip
+import json
+import unittest
+from api import api_server
+
+class TestApiServer(unittest.TestCase):
+    def setUp(self):
+        api_server.app.testing = True
+        self.client = api_server.app.test_client()
+        
+    def test_label_etag_and_not_modified(self):
+        """Testa att etiketter får ETag och att 304 skickas vid match"""
+        response = self.client.get('/api/labels/101')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['id'], '101')
+        self.assertIn('max-age', response.headers['Cache-Control'])
+        
+        etag = response.headers['ETag']
+        response = self.client.get('/api/labels/101', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+        self.assertEqual(self.client.get('/api/labels/999999').status_code, 404)
+        
+    def test_bulk_labels(self):
+        """Testa att flera etiketter kan hämtas i ett anrop"""
+        response = self.client.post('/api/labels/batch', json={'ids': ['101', '201', 'saknas']})
+        data = response.get_json()
+        self.assertEqual(set(data['labels']), {'101', '201'})
+        self.assertEqual(data['missing'], ['saknas'])
+        
+        response = self.client.get('/api/labels?ids=101,102')
+        self.assertEqual(set(response.get_json()['labels']), {'101', '102'})
+        
+    def test_full_label_catalog(self):
+        """Testa att GET utan ids ger alla etiketter med kund per etikett"""
+        response = self.client.get('/api/labels')
+        data = response.get_json()
+        self.assertEqual(set(data['labels']), set(api_server.LABEL_INDEX.labels))
+        self.assertEqual(data['customer_ids'], api_server.LABEL_INDEX.customer_of)
+        
+        etag = response.headers['ETag']
+        response = self.client.get('/api/labels', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+    def test_seen_inspection_keys_are_bounded(self):
+        """Testa att bara de senaste idempotensnycklarna minns"""
+        limit = api_server.MAX_SEEN_INSPECTION_KEYS
+        api_server.MAX_SEEN_INSPECTION_KEYS = 2
+        try:
+            for key in ('a', 'b', 'c'):
+                self.assertTrue(api_server.store_inspection({'idempotency_key': key}))
+            self.assertFalse(api_server.store_inspection({'idempotency_key': 'c'}))
+            self.assertEqual(len(api_server.SEEN_INSPECTION_KEYS), 2)
+            self.assertTrue(api_server.store_inspection({'idempotency_key': 'a'}))
+        finally:
+            api_server.MAX_SEEN_INSPECTION_KEYS = limit
+            api_server.SEEN_INSPECTION_KEYS.clear()
+            api_server.INSPECTIONS.clear()
+            
+    def test_gzip_for_large_responses(self):
+        """Testa att stora svar komprimeras när klienten accepterar gzip"""
+        ids = ','.join(api_server.LABEL_INDEX.labels)
+        response = self.client.get(f'/api/labels?ids={ids}', headers={'Accept-Encoding': 'gzip'})
+        if response.headers.get('Content-Encoding') == 'gzip':
+            data = json.loads(gzip.decompress(response.data))
+        else:
+            data = response.get_json()
+        self.assertEqual(len(data['labels']), len(api_server.LABEL_INDEX.labels))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tester för förannotering med detektorn"""
+
+import tempfile
+import unittest
+from pathlib import Path
+import cv2
+import numpy as np
+from tools.auto_annotator import Detection, auto_annotate
+
+def _fake_predictor(calls_dir):
+    """Detektor utan modell: en box vars konfidens är bildens ljushet"""
+    def predict(images):
+        tempfile.NamedTemporaryFile(dir=calls_dir, suffix='.batch', delete=False).close()
+        return [[Detection(1, 0.5, 0.5, 0.4, 0.2, float(image.mean()) / 255)] if image.mean() else []
+                for image in images]
+    return predict
+
+class TestAutoAnnotate(unittest.TestCase):
+    """Tester för auto_annotate"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.images = root / "images" / "train"
+        self.labels = root / "labels" / "train"
+        self.calls = root / "calls"
+        for path in (self.images, self.labels, self.calls):
+            path.mkdir(parents=True)
+        for i in range(120):
+            brightness = 0 if i == 7 else (60 if i % 10 == 0 else 230)
+            cv2.imwrite(str(self.images / f"{i:03d}.png"), np.full((32, 32, 3), brightness, np.uint8))
+        (self.labels / "005.txt").write_text("0 0.1 0.1 0.1 0.1\n")
+        
+    def tearDown(self):
+        self._tmp.cleanup()
+        
+    def test_annotates_all_in_batches_and_flags_uncertain(self):
+        """Alla oannoterade bilder körs i batcher, osäkra flaggas för granskning"""
+        counts = auto_annotate(self.images, batch=16, workers=2, factory=_fake_predictor,
+                               factory_args=(str(self.calls),))
+                               
+        self.assertEqual(counts, {'annotated': 106, 'review': 13, 'failed': 0})
+        self.assertEqual(len(list(self.calls.iterdir())), 8)
+        self.assertEqual((self.labels / "001.txt").read_text(), "1 0.500000 0.500000 0.400000 0.200000\n")
+        self.assertEqual((self.labels / "005.txt").read_text(), "0 0.1 0.1 0.1 0.1\n")
+        self.assertFalse((self.labels / "007.txt").exists())
+        
+        review = (self.labels.parent / "train_review.txt").read_text().split()
+        self.assertEqual(review[0], "007.png")
+        self.assertIn("010.png", review)
+        
+    def test_corrected_images_leave_review_list(self):
+        """En bild som rättats för hand försvinner ur granskningslistan"""
+        auto_annotate(self.images, batch=16, workers=2, factory=_fake_predictor, factory_args=(str(self.calls),))
+        (self.labels / "010.txt").write_text("2 0.5 0.5 0.3 0.3\n")
+        
+        auto_annotate(self.images, batch=16, workers=2, factory=_fake_predictor, factory_args=(str(self.calls),))
+        
+        review = (self.labels.parent / "train_review.txt").read_text().split()
+        self.assertNotIn("010.png", review)
+        self.assertIn("007.png", review)
+
+if __name__ == '__main__':
+    unittest.main()
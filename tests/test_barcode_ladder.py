@@ -0,0 +1,87 @@
+"""Tester för avkodningsstegen för streckkoder"""
+
+import time
+import unittest
+from collections import namedtuple
+import numpy as np
+from vision.barcode_ladder import DecodeLadder, VARIANTS
+
+Point = namedtuple('Point', 'x y')
+Rect = namedtuple('Rect', 'left top width height')
+Decoded = namedtuple('Decoded', 'data type rect polygon')
+
+def _decoder_for(image_size):
+    """Avkodare som bara lyckas på bilder av en viss storlek"""
+    calls = []
+    
+    def decode(image):
+        calls.append(image.shape)
+        if image.shape == image_size:
+            return [Decoded(b'7310865004703', 'EAN13', Rect(20, 10, 40, 20),
+                            [Point(20, 10), Point(60, 10), Point(60, 30), Point(20, 30)])]
+        return []
+        
+    return decode, calls
+
+class TestDecodeLadder(unittest.TestCase):
+    """Tester för DecodeLadder"""
+    
+    def setUp(self):
+        self.image = np.full((50, 100), 200, np.uint8)
+        
+    def test_tries_variants_until_success(self):
+        """Uppskalningen lyckas och punkterna räknas om till indatabilden"""
+        decode, calls = _decoder_for((100, 200))
+        ladder = DecodeLadder(decode, budget_ms=1000)
+        
+        found = ladder(self.image, 'front')
+        
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0].variant, 'upscaled')
+        self.assertEqual(found[0].polygon[0], (10, 5))
+        self.assertEqual(tuple(found[0].rect), (10, 5, 20, 10))
+        self.assertEqual(len(calls), [name for name, _ in VARIANTS].index('upscaled') + 1)
+        
+    def test_rotated_points_map_back(self):
+        """Punkter från den roterade varianten hamnar rätt i originalet"""
+        decode, _ = _decoder_for((100, 50))
+        found = DecodeLadder(decode, budget_ms=1000)(self.image)
+        
+        self.assertEqual(found[0].variant, 'rotated')
+        # (x, y) i den medurs roterade bilden motsvarar (y, h - 1 - x)
+        self.assertEqual(found[0].polygon[0], (10, 29))
+        
+    def test_learns_order_per_label_type(self):
+        """Varianten som lyckas flyttas först för just den etikettypen"""
+        decode, calls = _decoder_for((100, 50))
+        ladder = DecodeLadder(decode, budget_ms=1000)
+        for _ in range(3):
+            ladder(self.image, 'back')
+            
+        self.assertEqual(ladder.order('back')[0], 'rotated')
+        self.assertEqual(ladder.order('front'), [name for name, _ in VARIANTS])
+        
+        calls.clear()
+        ladder(self.image, 'back')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(ladder.stats()['back']['rotated'], (4, 4))
+        
+    def test_budget_stops_ladder(self):
+        """Inga fler försök görs när tidsbudgeten är slut"""
+        decode, calls = _decoder_for((1, 1))
+        ladder = DecodeLadder(decode)
+        
+        self.assertEqual(ladder(self.image, deadline=time.perf_counter() - 1.0), [])
+        self.assertEqual(calls, [])
+        
+    def test_load_stats_ignores_unknown_variants(self):
+        """Sparad statistik för borttagna varianter ignoreras"""
+        decode, _ = _decoder_for((1, 1))
+        ladder = DecodeLadder(decode)
+        ladder.load_stats({'front': {'sharpened': (9, 10), 'gone': (5, 5)}})
+        
+        self.assertEqual(ladder.order('front')[0], 'sharpened')
+        self.assertNotIn('gone', ladder.stats()['front'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""Tester för den lokala etikettkatalogen"""
+
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from api.catalog import LabelCatalog, article_number_from_name
+from api.label_api import APIError
+
+class _FakeAPI:
+    """Ersätter LabelAPI med fast data, eller ett nätverksfel"""
+    
+    def __init__(self, offline=False):
+        self.offline = offline
+        self.calls = []
+        
+    def get_customers(self):
+        self.calls.append('customers')
+        if self.offline:
+            raise APIError("Ingen anslutning")
+        return [{"id": "1", "name": "Kund A"}, {"id": "2", "name": "Kund B"}]
+        
+    def get_all_labels(self):
+        self.calls.append('labels')
+        labels = {
+            "label1": {"id": "label1", "name": "226580 Kanelbulle", "text": "Kanelbulle 75g",
+                       "barcode": "7310000000017"},
+            "label2": {"id": "label2", "name": "62865 Donut", "text": "Donut Hallon"},
+        }
+        return labels, {"label1": "1", "label2": "2"}
+
+class TestLabelCatalog(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = Path(tempfile.mkdtemp())
+        (self.base_dir / "config").mkdir()
+        with open(self.base_dir / "products.json", 'w', encoding='utf-8') as f:
+            json.dump([{
+                "article_number": "62865",
+                "name": "Donut Hallon",
+                "customer": "Schulstad",
+                "description": "Donut Hallon",
+                "labels": [{"path": "labels/62865_kartong.jpg", "type": "kartong"}]
+            }], f)
+        with open(self.base_dir / "config" / "customers.json", 'w', encoding='utf-8') as f:
+            json.dump({"customers": {"Customer A": {
+                "name": "Customer A",
+                "labels": ["2.76880.822 Chocolatey Donut Label"],
+                "label_dir": "labels/customer_a"
+            }}}, f)
+        self.snapshot = str(self.base_dir / "data" / "catalog.json")
+        
+    def tearDown(self):
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+        
+    def test_local_sources_are_indexed(self):
+        """Testa att lokala filer indexeras på artikelnummer och kund"""
+        catalog = LabelCatalog(str(self.base_dir), snapshot_path=self.snapshot)
+        self.assertFalse(catalog.load(sync=False))
+        
+        self.assertEqual(catalog.find_by_article("62865")[0].label_type, "kartong")
+        self.assertEqual(len(catalog.find_by_article("2.76880.822")), 1)
+        self.assertEqual(len(catalog.labels_for_customer("Schulstad")), 1)
+        
+    def test_sync_then_offline_start(self):
+        """Testa att synkad data finns kvar när API:t inte svarar"""
+        catalog = LabelCatalog(str(self.base_dir), _FakeAPI(), self.snapshot)
+        self.assertTrue(catalog.load())
+        self.assertEqual(catalog.find_by_barcode("7310000000017").label_id, "label1")
+        
+        offline = LabelCatalog(str(self.base_dir), _FakeAPI(offline=True), self.snapshot)
+        self.assertTrue(offline.load())
+        self.assertEqual(offline.get("label1").text, "Kanelbulle 75g")
+        self.assertEqual(offline.get("label1").article_number, "226580")
+        self.assertEqual(offline.customers()["1"], "Kund A")
+        
+    def test_sync_uses_bulk_endpoint(self):
+        """Testa att synken gör samma antal anrop oavsett antal kunder"""
+        api = _FakeAPI()
+        catalog = LabelCatalog(str(self.base_dir), api, self.snapshot)
+        catalog.load()
+        self.assertEqual(api.calls, ['customers', 'labels'])
+        self.assertEqual(catalog.get("label2").customer_name, "Kund B")
+        self.assertEqual([l.label_id for l in catalog.labels_for_customer("1")], ["label1"])
+        
+    def test_snapshot_with_unknown_or_missing_keys(self):
+        """Testa att okända nycklar ignoreras och att en trasig ögonblicksbild ger tom katalog"""
+        Path(self.snapshot).parent.mkdir(parents=True)
+        with open(self.snapshot, 'w', encoding='utf-8') as f:
+            json.dump({"customers": {"1": "Kund A"},
+                       "labels": [{"label_id": "label1", "name": "Kanelbulle", "ny_nyckel": 1}]}, f)
+        catalog = LabelCatalog(str(self.base_dir), snapshot_path=self.snapshot)
+        self.assertTrue(catalog.load(sync=False))
+        self.assertEqual(catalog.get("label1").name, "Kanelbulle")
+        
+        with open(self.snapshot, 'w', encoding='utf-8') as f:
+            json.dump({"labels": [{"name": "saknar label_id"}]}, f)
+        with self.assertLogs('api.catalog', level='WARNING'):
+            self.assertFalse(catalog.load(sync=False))
+        self.assertIsNone(catalog.get("label1"))
+        
+    def test_background_sync_after_offline_load(self):
+        """Testa att starten inte synkar men bakgrundstråden gör det direkt"""
+        api = _FakeAPI()
+        catalog = LabelCatalog(str(self.base_dir), api, self.snapshot)
+        catalog.load(sync=False)
+        self.assertEqual(api.calls, [])
+        
+        catalog.start_refresh(interval=60.0, immediate=True)
+        try:
+            for _ in range(100):
+                if catalog.get("label1") is not None:
+                    break
+                time.sleep(0.01)
+        finally:
+            catalog.stop_refresh()
+        self.assertEqual(catalog.get("label1").text, "Kanelbulle 75g")
+        
+    def test_identify_by_text(self):
+        """Testa att en etikett kan identifieras från OCR-text"""
+        catalog = LabelCatalog(str(self.base_dir), _FakeAPI(), self.snapshot)
+        catalog.load()
+        label, score = catalog.identify("Kane1bulle 75g", top_k=1)[0]
+        self.assertEqual(label.label_id, "label1")
+        self.assertGreater(score, 0.8)
+        
+    def test_find_reference_falls_back_to_text(self):
+        """Testa att en okänd etikett utan streckkodsträff identifieras på texten"""
+        catalog = LabelCatalog(str(self.base_dir), _FakeAPI(), self.snapshot)
+        catalog.load()
+        self.assertEqual(catalog.find_reference("7310000000017").label_id, "label1")
+        self.assertEqual(catalog.find_reference("0000000000000", "Kane1bulle 75g").label_id, "label1")
+        self.assertIsNone(catalog.find_reference("", "Skillingsbolle 95g"))
+        self.assertIsNone(catalog.find_reference())
+        
+    def test_article_number_from_name(self):
+        """Testa tolkning av artikelnummer i etikettnamn"""
+        self.assertEqual(article_number_from_name("226580 YD Kanelbulle"), "226580")
+        self.assertEqual(article_number_from_name("2.76880.822 Vanilla"), "2.76880.822")
+        self.assertEqual(article_number_from_name("Produkt1"), "")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tester för packade träningsshards"""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+import cv2
+import numpy as np
+from utils.dataset_shards import PackedDataset, ShardWriter, label_path_for, pack_training_split, read_yolo_labels
+
+class TestTrainingShards(unittest.TestCase):
+    """Tester för pack_training_split och PackedDataset"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.images = self.root / "images" / "train"
+        (self.root / "labels" / "train").mkdir(parents=True)
+        self.images.mkdir(parents=True)
+        for i in range(4):
+            image = np.full((960, 1280, 3), i * 40, np.uint8)
+            cv2.imwrite(str(self.images / f"{i}.png"), image)
+            label_path_for(self.images / f"{i}.png").write_text(f"{i % 3} 0.5 0.5 0.2 0.1\n")
+        self.shard = self.root / "shards" / "train.640.shard"
+        
+    def tearDown(self):
+        self._tmp.cleanup()
+        
+    def test_pack_and_load(self):
+        """Bilderna förskalas till imgsz och läses minnesmappat med annoteringar"""
+        self.assertTrue(pack_training_split(self.images, self.shard, imgsz=640, workers=2))
+        
+        dataset = PackedDataset(self.shard)
+        
+        self.assertEqual(len(dataset), 4)
+        image, labels = dataset[2]
+        self.assertEqual(image.shape, (480, 640, 3))
+        self.assertEqual(int(image[0, 0, 0]), 80)
+        self.assertEqual(dataset.original_shape(2), (960, 1280))
+        np.testing.assert_allclose(labels, [[2, 0.5, 0.5, 0.2, 0.1]])
+        
+    def test_rebuilds_only_on_change(self):
+        """Sharden byggs om först när en annotering ändras"""
+        pack_training_split(self.images, self.shard, imgsz=640, workers=2)
+        self.assertFalse(pack_training_split(self.images, self.shard, imgsz=640, workers=2))
+        
+        label = label_path_for(self.images / "1.png")
+        label.write_text("0 0.5 0.5 0.2 0.1\n1 0.2 0.2 0.1 0.1\n")
+        os.utime(label, ns=(1, 1))
+        
+        self.assertTrue(pack_training_split(self.images, self.shard, imgsz=640, workers=2))
+        self.assertEqual(len(PackedDataset(self.shard).labels(1)), 2)
+        
+    def test_segments_become_boxes(self):
+        """Polygonrader läses som sin omskrivna box"""
+        path = self.root / "segment.txt"
+        path.write_text("1 0.1 0.2 0.5 0.2 0.5 0.6 0.1 0.6\n")
+        
+        np.testing.assert_allclose(read_yolo_labels(path), [[1, 0.3, 0.4, 0.4, 0.4]], atol=1e-6)
+        self.assertEqual(read_yolo_labels(self.root / "saknas.txt").shape, (0, 5))
+
+class TestShardWriter(unittest.TestCase):
+    """Tester för ShardWriter"""
+    
+    def test_failed_write_keeps_old_shard(self):
+        """Ett avbrott under skrivning lämnar den gamla sharden orörd"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "test.shard"
+            with ShardWriter(path) as writer:
+                writer.add("a", b"gammal")
+            with self.assertRaises(RuntimeError):
+                with ShardWriter(path) as writer:
+                    writer.add("a", b"ny")
+                    raise RuntimeError("avbrott")
+                    
+            self.assertEqual(path.read_bytes(), b"gammal")
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), ["test.shard", "test.shard.index.json"])
+
+if __name__ == '__main__':
+    unittest.main()
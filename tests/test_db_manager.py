@@ -0,0 +1,209 @@
+"""Tester för DatabaseManager (validation_results)"""
+
+import unittest
+import sqlite3
+import tempfile
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+from database.db_manager import DatabaseManager, SCHEMA_VERSION
+from database.image_store import ImageStore
+
+class TestDatabaseManager(unittest.TestCase):
+    def setUp(self):
+        """Körs före varje test"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = str(Path(self.tmp_dir) / "label_vision.db")
+        self.db = DatabaseManager(self.db_path)
+
+    def tearDown(self):
+        """Körs efter varje test"""
+        self.db = None
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _save(self, timestamp, valid=True):
+        return self.db.save_validation_result({
+            'timestamp': timestamp,
+            'image_path': 'test.jpg',
+            'label_name': 'TEST001',
+            'customer_id': 'Kund1',
+            'valid': valid,
+            'confidence': 0.9
+        })
+
+    def test_timestamp_stored_as_epoch_ms(self):
+        """Testa att tidsstämpeln sparas som epoch-ms"""
+        now = datetime.now()
+        result_id = self._save(now.isoformat())
+
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT timestamp_ms FROM validation_results WHERE id = ?",
+                (result_id,)
+            ).fetchone()
+
+        self.assertEqual(row[0], int(now.timestamp() * 1000))
+
+    def test_migrates_text_timestamps(self):
+        """Testa migrering av en databas utan timestamp_ms"""
+        old_path = str(Path(self.tmp_dir) / "old.db")
+        with sqlite3.connect(old_path) as conn:
+            conn.execute("""
+            CREATE TABLE validation_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                image_path TEXT NOT NULL,
+                label_name TEXT NOT NULL,
+                customer_id TEXT NOT NULL,
+                expected_text TEXT,
+                detected_text TEXT,
+                is_valid BOOLEAN NOT NULL,
+                confidence REAL NOT NULL,
+                error_message TEXT,
+                metadata TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+            conn.execute("""
+            INSERT INTO validation_results
+            (timestamp, image_path, label_name, customer_id, is_valid, confidence, metadata)
+            VALUES ('2024-01-24T10:00:00', 'a.jpg', 'L', 'K', 1, 0.9, '{}')
+            """)
+
+        DatabaseManager(old_path)
+
+        with sqlite3.connect(old_path) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            ts_ms = conn.execute("SELECT timestamp_ms FROM validation_results").fetchone()[0]
+
+        self.assertEqual(version, SCHEMA_VERSION)
+        self.assertEqual(ts_ms, int(datetime(2024, 1, 24, 10).timestamp() * 1000))
+
+    def test_delete_old_results_in_batches(self):
+        """Testa att gamla resultat tas bort i batchar"""
+        for days in range(60):
+            self._save((datetime.now() - timedelta(days=days)).isoformat())
+
+        deleted = self.db.delete_old_results(days=30, batch_size=7)
+
+        self.assertEqual(deleted, 29)
+        results = self.db.get_validation_results(limit=100)
+        self.assertEqual(len(results), 31)
+
+    def test_date_filter_uses_epoch_ms(self):
+        """Testa datumfilter med datetime och ISO-sträng"""
+        self._save((datetime.now() - timedelta(days=5)).isoformat())
+        self._save(datetime.now().isoformat())
+
+        since = datetime.now() - timedelta(days=1)
+        self.assertEqual(len(self.db.get_validation_results(start_date=since)), 1)
+        self.assertEqual(len(self.db.get_validation_results(start_date=since.isoformat())), 1)
+
+    def test_iter_validation_results_pages(self):
+        """Testa keyset-paginering över flera sidor"""
+        base = datetime.now()
+        for i in range(25):
+            self._save(base.isoformat(), valid=i % 2 == 0)
+
+        records = list(self.db.iter_validation_results(page_size=4))
+        ids = [r['id'] for r in records]
+
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_iter_validation_results_null_timestamps(self):
+        """Testa att rader utan timestamp_ms inte avbryter pagineringen"""
+        base = datetime.now()
+        for i in range(10):
+            self._save((base + timedelta(seconds=i)).isoformat())
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE validation_results SET timestamp_ms = NULL WHERE id IN (2, 3, 4, 8)")
+
+        ascending = [r['id'] for r in self.db.iter_validation_results(page_size=3, descending=False)]
+        descending = [r['id'] for r in self.db.iter_validation_results(page_size=3)]
+
+        self.assertEqual(ascending, [2, 3, 4, 8, 1, 5, 6, 7, 9, 10])
+        self.assertEqual(descending, list(reversed(ascending)))
+        resumed = self.db.iter_validation_results(page_size=3, descending=False, after=(None, 4))
+        self.assertEqual([r['id'] for r in resumed], [8, 1, 5, 6, 7, 9, 10])
+
+    def test_iter_validation_results_projection(self):
+        """Testa kolumnprojektion och lat avkodning av metadata"""
+        self._save(datetime.now().isoformat())
+
+        record = next(self.db.iter_validation_results(columns=['label_name', 'metadata']))
+
+        self.assertEqual(record['label_name'], 'TEST001')
+        self.assertEqual(record['metadata'], {})
+        self.assertIn('id', record)
+        self.assertNotIn('image_path', record)
+        with self.assertRaises(ValueError):
+            next(self.db.iter_validation_results(columns=['finns_inte']))
+
+    def test_search_validation_results(self):
+        """Testa fritextsökning i detekterad text"""
+        for text in ("Hallonmunk Batch 4711", "Äppelmunk Batch 4712", "Kanelbulle"):
+            self.db.save_validation_result({
+                'timestamp': datetime.now().isoformat(),
+                'image_path': 'test.jpg',
+                'label_name': 'TEST001',
+                'customer_id': 'Kund1',
+                'detected_text': text,
+                'valid': True,
+                'confidence': 0.9
+            })
+
+        hits = self.db.search_validation_results("hallonmunk")
+        self.assertEqual([h['detected_text'] for h in hits], ["Hallonmunk Batch 4711"])
+
+        # Diakriter ignoreras och prefix matchar
+        hits = self.db.search_validation_results("appelm")
+        self.assertEqual(len(hits), 1)
+
+        hits = self.db.search_validation_results("batch 471", order='recent')
+        self.assertEqual(len(hits), 2)
+
+        self.db.delete_old_results(days=-1)
+        self.assertEqual(self.db.search_validation_results("Kanelbulle"), [])
+
+    def test_missing_fulltext_index_is_created_on_start(self):
+        """Testa att FTS-indexet skapas vid start även om schemaversionen redan är aktuell"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DROP TABLE validation_results_fts")
+            for suffix in ('ai', 'ad', 'au'):
+                conn.execute(f"DROP TRIGGER validation_results_fts_{suffix}")
+        self._save(datetime.now().isoformat())
+
+        DatabaseManager(self.db_path)
+
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+            names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+        self.assertIn('validation_results_fts', names)
+        self.assertIn('validation_results_fts_ai', names)
+
+    def test_failed_validation_image_in_store(self):
+        """Testa att bilden för en underkänd validering sparas i ImageStore"""
+        store = ImageStore(str(Path(self.tmp_dir) / "failed"), tier='lossless')
+        db = DatabaseManager(self.db_path, image_store=store)
+        image = np.random.default_rng(0).integers(0, 255, (40, 60, 3), dtype=np.uint8)
+        result = {
+            'timestamp': datetime.now().isoformat(),
+            'label_name': 'TEST001',
+            'customer_id': 'Kund1',
+            'confidence': 0.2,
+            'image': image,
+            'roi': (10, 5, 50, 35)
+        }
+
+        failed_id = db.save_validation_result(dict(result, valid=False))
+        passed_id = db.save_validation_result(dict(result, valid=True))
+
+        with sqlite3.connect(self.db_path) as conn:
+            hashes = dict(conn.execute("SELECT id, image_hash FROM validation_results"))
+        self.assertIsNone(hashes[passed_id])
+        np.testing.assert_array_equal(store.get(hashes[failed_id]), image[5:35, 10:50])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Tester för export av inspektionshistorik"""
+
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from tools.export_history import WATERMARK_FILE, export_history
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+@unittest.skipIf(pq is None, "pyarrow saknas")
+class TestExportHistory(unittest.TestCase):
+    """Tester för export_history"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self._tmp.name)
+        self.db_path = str(self.base / "vision.db")
+        self.out = self.base / "export"
+        self.start_ms = int(datetime(2024, 1, 24, 12).timestamp() * 1000)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+            CREATE TABLE validation_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                customer_id TEXT NOT NULL,
+                is_valid BOOLEAN NOT NULL,
+                confidence REAL NOT NULL,
+                timestamp_ms INTEGER
+            )
+            """)
+        self._insert(6)
+        
+    def tearDown(self):
+        self._tmp.cleanup()
+        
+    def _insert(self, count: int, day: int = 0):
+        """Lägger in rader växelvis för två kunder på angiven dag"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO validation_results (customer_id, is_valid, confidence, timestamp_ms) "
+                "VALUES (?, ?, ?, ?)",
+                [(f"Kund{i % 2}", i % 3 != 0, 90.0, self.start_ms + day * DAY_MS + i)
+                 for i in range(count)]
+            )
+            
+    def _exported(self):
+        """Alla exporterade rader som (id, partitionskatalog)"""
+        rows = []
+        for path in (self.out / "validation_results").rglob("*.parquet"):
+            partition = path.parent.relative_to(self.out / "validation_results").as_posix()
+            rows.extend((row_id, partition) for row_id in pq.read_table(path)['id'].to_pylist())
+        return sorted(rows)
+        
+    def test_partitions_by_day_and_customer(self):
+        """Raderna hamnar i en katalog per dag och kund, även med små sidor"""
+        self._insert(4, day=1)
+        
+        counts = export_history(self.db_path, str(self.out), page_size=2)
+        
+        self.assertEqual(counts, {'validation_results': 10})
+        exported = self._exported()
+        self.assertEqual([row_id for row_id, _ in exported], list(range(1, 11)))
+        partitions = {partition for _, partition in exported}
+        self.assertEqual(partitions, {
+            "date=2024-01-24/customer_id=Kund0", "date=2024-01-24/customer_id=Kund1",
+            "date=2024-01-25/customer_id=Kund0", "date=2024-01-25/customer_id=Kund1",
+        })
+        self.assertEqual(list(self.out.rglob("*.tmp")), [])
+        
+    def test_watermark_exports_only_new_rows(self):
+        """Nästa körning exporterar bara rader efter vattenstämpeln"""
+        export_history(self.db_path, str(self.out))
+        self.assertEqual(export_history(self.db_path, str(self.out)), {'validation_results': 0})
+        
+        self._insert(3)
+        counts = export_history(self.db_path, str(self.out))
+        
+        self.assertEqual(counts, {'validation_results': 3})
+        self.assertEqual([row_id for row_id, _ in self._exported()], list(range(1, 10)))
+        self.assertTrue((self.out / WATERMARK_FILE).exists())
+        
+    def test_rows_without_timestamp_are_exported(self):
+        """Rader utan tidsstämpel exporteras och hoppas inte över av vattenstämpeln"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE validation_results SET timestamp_ms = NULL WHERE id IN (3, 4)")
+            
+        counts = export_history(self.db_path, str(self.out), page_size=2)
+        
+        self.assertEqual(counts, {'validation_results': 6})
+        self.assertEqual([row_id for row_id, _ in self._exported()], list(range(1, 7)))
+        self._insert(2)
+        self.assertEqual(export_history(self.db_path, str(self.out)), {'validation_results': 2})
+        
+    def test_full_replaces_earlier_parts(self):
+        """Full export ersätter tidigare filer i stället för att dubblera raderna"""
+        export_history(self.db_path, str(self.out))
+        self._insert(3)
+        export_history(self.db_path, str(self.out))
+        
+        counts = export_history(self.db_path, str(self.out), full=True)
+        
+        self.assertEqual(counts, {'validation_results': 9})
+        self.assertEqual([row_id for row_id, _ in self._exported()], list(range(1, 10)))
+
+if __name__ == '__main__':
+    unittest.main()
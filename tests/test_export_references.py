@@ -0,0 +1,72 @@
+"""Tester för export av referensetiketter"""
+
+import logging
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from tools.export_references import MANIFEST_FILE, export_labels
+
+def _fake_preview(source_file):
+    """Förhandsgranskning utan NiceLabel: filens innehåll med ett prefix"""
+    data = Path(source_file).read_bytes()
+    if data.startswith(b'trasig'):
+        raise ValueError("Kunde inte öppna etiketten")
+    return b'PNG:' + data
+
+class TestExportLabels(unittest.TestCase):
+    """Tester för export_labels"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.source = root / "Labels"
+        self.target = root / "References"
+        for customer in ("Baxt", "Schulstad"):
+            (self.source / customer).mkdir(parents=True)
+            for i in range(3):
+                (self.source / customer / f"{customer} {i}.nlbl").write_bytes(f"{customer}-{i}".encode())
+        self.logger = logging.getLogger(__name__)
+        
+    def tearDown(self):
+        self._tmp.cleanup()
+        
+    def _export(self, **kwargs):
+        return export_labels(str(self.source), str(self.target), self.logger, workers=2,
+                             reader=_fake_preview, **kwargs)
+                             
+    def test_exports_tree_and_writes_manifest(self):
+        """Alla etiketter exporteras med samma mappstruktur"""
+        counts = self._export()
+        
+        self.assertEqual(counts['exported'], 6)
+        self.assertEqual((self.target / "Baxt" / "Baxt 1.png").read_bytes(), b'PNG:Baxt-1')
+        self.assertTrue((self.target / MANIFEST_FILE).exists())
+        
+    def test_second_run_skips_unchanged(self):
+        """Oförändrade filer exporteras inte om, inte heller vid ny tidsstämpel"""
+        self._export()
+        touched = self.source / "Baxt" / "Baxt 0.nlbl"
+        os.utime(touched, ns=(1, 1))
+        (self.source / "Schulstad" / "Schulstad 2.nlbl").write_bytes(b"ny layout")
+        
+        counts = self._export()
+        
+        self.assertEqual(counts, {'exported': 1, 'unchanged': 5, 'failed': 0, 'removed': 0})
+        self.assertEqual((self.target / "Schulstad" / "Schulstad 2.png").read_bytes(), b'PNG:ny layout')
+        
+    def test_failures_are_retried_and_prune_removes(self):
+        """Misslyckade filer försöks igen nästa gång, borttagna källor rensas"""
+        (self.source / "Baxt" / "Baxt 1.nlbl").write_bytes(b"trasig")
+        self.assertEqual(self._export()['failed'], 1)
+        
+        (self.source / "Baxt" / "Baxt 1.nlbl").write_bytes(b"lagad")
+        (self.source / "Schulstad" / "Schulstad 0.nlbl").unlink()
+        counts = self._export(prune=True)
+        
+        self.assertEqual(counts['exported'], 1)
+        self.assertEqual(counts['removed'], 1)
+        self.assertFalse((self.target / "Schulstad" / "Schulstad 0.png").exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Tester för innehållsadresserad bildlagring"""
+
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+import numpy as np
+from database.image_store import ImageStore, image_digest
+
+class TestImageStore(unittest.TestCase):
+    """Tester för ImageStore"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name) / "store"
+        self.store = ImageStore(str(self.root), tier='lossless')
+        self.image = np.random.default_rng(1).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+        
+    def tearDown(self):
+        self.store.stop_compactor()
+        self._tmp.cleanup()
+        
+    def _loose_files(self):
+        return list(self.root.glob("??/??/*.*"))
+        
+    def test_put_and_get(self):
+        """En sparad bild läses tillbaka oförändrad under sin hash"""
+        digest = self.store.put(self.image)
+        
+        self.assertEqual(digest, image_digest(self.image))
+        np.testing.assert_array_equal(self.store.get(digest), self.image)
+        self.assertIsNone(self.store.get("0" * 40))
+        
+    def test_identical_images_stored_once(self):
+        """Identiska bilder och utsnitt lagras bara en gång"""
+        first = self.store.put(self.image)
+        second = self.store.put(self.image.copy())
+        crop = self.store.put(self.image, roi=(8, 4, 40, 30))
+        
+        self.assertEqual(first, second)
+        self.assertEqual(crop, image_digest(self.image[4:30, 8:40]))
+        self.assertEqual(len(self._loose_files()), 2)
+        self.assertIsNone(self.store.put(self.image, roi=(10, 10, 10, 10)))
+        
+    def test_compact_keeps_images_readable(self):
+        """Packade bilder läses via indexet och de lösa filerna tas bort"""
+        old = self.store.put(self.image)
+        new = self.store.put(self.image[::-1].copy())
+        stamp = time.time() - 10 * 24 * 60 * 60
+        os.utime(self.store.path_for(old), (stamp, stamp))
+        
+        self.assertEqual(self.store.compact(older_than_days=7), 1)
+        
+        self.assertIsNone(self.store.path_for(old))
+        self.assertIsNotNone(self.store.path_for(new))
+        self.assertTrue(self.store.contains(old))
+        np.testing.assert_array_equal(self.store.get(old), self.image)
+        self.assertEqual(self.store.put(self.image), old)
+        self.assertEqual({digest for digest, _ in self.store.list_images()}, {old, new})
+        
+    def test_from_config(self):
+        """Konfigurationen väljer katalog och nivå och kan stänga av lagringen"""
+        config = {'failed_validations_dir': str(self.root / "failed"),
+                  'failed_validations_tier': 'archive', 'compact_after_days': 3}
+                  
+        store = ImageStore.from_config(config, start_compactor=False)
+        
+        self.assertEqual((store.root, store.tier), (self.root / "failed", 'archive'))
+        self.assertIsNone(ImageStore.from_config(dict(config, save_failed_validations=False)))
+
+if __name__ == '__main__':
+    unittest.main()
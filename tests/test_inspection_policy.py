@@ -0,0 +1,41 @@
+"""Tester för beslutsregler vid inspektion"""
+
+import unittest
+from vision.inspection_policy import InspectionPolicy, gtin_is_valid, normalize_gtin
+
+class TestInspectionPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = InspectionPolicy()
+        self.reference = {'barcode': '4006381333931', 'text': 'Kanelbulle 90g'}
+        
+    def test_gtin_normalization(self):
+        """Testa kontrollsiffra och normalisering av GS1-koder"""
+        self.assertTrue(gtin_is_valid('4006381333931'))
+        self.assertFalse(gtin_is_valid('4006381333932'))
+        self.assertEqual(normalize_gtin('(01)04006381333931'), '04006381333931')
+        self.assertEqual(normalize_gtin('0104006381333931'), '04006381333931')
+        self.assertIsNone(normalize_gtin('ABC123'))
+        
+    def test_matching_barcode_skips_ocr(self):
+        """Testa att en stämmande streckkod räcker utan OCR"""
+        decision = self.policy.evaluate_barcode('(01)04006381333931', self.reference)
+        self.assertTrue(decision.matches)
+        self.assertFalse(decision.needs_ocr)
+        
+    def test_wrong_barcode_fails_without_ocr(self):
+        """Testa att fel streckkod underkänns direkt"""
+        decision = self.policy.evaluate_barcode('7310865004703', self.reference)
+        self.assertFalse(decision.matches)
+        self.assertFalse(decision.needs_ocr)
+        
+    def test_ocr_required(self):
+        """Testa när OCR ändå måste köras"""
+        self.assertTrue(self.policy.evaluate_barcode('', self.reference).needs_ocr)
+        self.assertTrue(self.policy.evaluate_barcode('4006381333931', {'text': 'x'}).needs_ocr)
+        
+        dated = dict(self.reference, text='Kanelbulle 90g Bäst före: 2024-12-31')
+        self.assertTrue(self.policy.evaluate_barcode('4006381333931', dated).needs_ocr)
+        self.assertFalse(self.policy.evaluate_barcode('4006381333931', dict(dated, require_text=False)).needs_ocr)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""Tester för inspektionstjänsten med dynamisk batchning"""
+
+import time
+import unittest
+import cv2
+import numpy as np
+from api import api_server
+from api.inspection_service import DeadlineExceeded, InspectionService
+
+class _FakeDetector:
+    """Registrerar batchstorlekar i stället för att köra YOLO"""
+    
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batch_sizes = []
+        
+    def detect_batch(self, images):
+        self.batch_sizes.append(len(images))
+        time.sleep(self.delay)
+        return [[{'class': 0, 'shape': image.shape}] for image in images]
+        
+    def inspect(self, image, objects):
+        return {'shape': list(image.shape), 'objects': len(objects)}
+
+class TestInspectionService(unittest.TestCase):
+    def test_concurrent_requests_are_batched(self):
+        """Testa att samtidiga förfrågningar körs i samma batch"""
+        detector = _FakeDetector()
+        service = InspectionService(detector.detect_batch, detector.inspect,
+                                    max_batch_size=8, max_wait_ms=50)
+        try:
+            futures = [service.submit(np.zeros((10, 10, 3), np.uint8)) for _ in range(6)]
+            results = [f.result(timeout=5) for f in futures]
+        finally:
+            service.close()
+            
+        self.assertEqual(len(results), 6)
+        self.assertLess(len(detector.batch_sizes), 6)
+        self.assertEqual(sum(detector.batch_sizes), 6)
+        self.assertEqual(service.metrics()['completed'], 6)
+        
+    def test_deadline_expires_in_queue(self):
+        """Testa att förfrågningar som väntat för länge avbryts"""
+        detector = _FakeDetector(delay=0.2)
+        service = InspectionService(detector.detect_batch, detector.inspect,
+                                    max_batch_size=1, max_wait_ms=0)
+        try:
+            blocker = service.submit(np.zeros((4, 4, 3), np.uint8))
+            time.sleep(0.02)
+            with self.assertRaises(DeadlineExceeded):
+                service.inspect_sync(np.zeros((4, 4, 3), np.uint8), timeout_ms=50)
+            blocker.result(timeout=5)
+        finally:
+            service.close()
+            
+    def test_detection_error_reaches_caller(self):
+        """Testa att ett fel i batchdetekteringen når förfrågan i stället för att sväljas"""
+        def detect_batch(images):
+            raise RuntimeError("GPU saknas")
+            
+        service = InspectionService(detect_batch, lambda image, objects: objects)
+        try:
+            with self.assertRaisesRegex(RuntimeError, "GPU saknas"):
+                service.inspect_sync(np.zeros((4, 4, 3), np.uint8), timeout_ms=1000)
+            self.assertEqual(service.metrics()['in_flight'], 0)
+        finally:
+            service.close()
+            
+    def test_raw_image_is_writable(self):
+        """Testa att råa pixlar avkodas till en skrivbar kopia"""
+        image = np.arange(24, dtype=np.uint8).reshape(2, 4, 3)
+        with api_server.app.test_request_context('/inspect', data=image.tobytes(),
+                                                 content_type='application/octet-stream',
+                                                 headers={'X-Image-Shape': '2,4,3'}):
+            decoded = api_server.decode_image(api_server.request)
+            
+        self.assertTrue(decoded.flags.writeable)
+        np.testing.assert_array_equal(decoded, image)
+        
+    def test_vision_system_per_thread(self):
+        """Testa att batchtråden och arbetstrådarna får egna VisionSystem"""
+        created = []
+        
+        class _FakeVisionSystem(_FakeDetector):
+            def __init__(self):
+                super().__init__()
+                self.inspected = 0
+                created.append(self)
+                
+            def detect_objects_batch(self, images):
+                return self.detect_batch(images)
+                
+            def inspect_image(self, image, objects=None):
+                self.inspected += 1
+                return self.inspect(image, objects)
+                
+        service = InspectionService.from_vision_system(_FakeVisionSystem, workers=2, max_wait_ms=20)
+        try:
+            futures = [service.submit(np.zeros((4, 4, 3), np.uint8)) for _ in range(8)]
+            for future in futures:
+                future.result(timeout=5)
+        finally:
+            service.close()
+            
+        detector, workers = created[0], created[1:]
+        self.assertEqual(sum(detector.batch_sizes), 8)
+        self.assertEqual(detector.inspected, 0)
+        self.assertTrue(1 <= len(workers) <= 2)
+        self.assertEqual(sum(w.inspected for w in workers), 8)
+        
+    def test_inspect_endpoint(self):
+        """Testa /inspect med PNG och råa pixlar"""
+        detector = _FakeDetector()
+        service = InspectionService(detector.detect_batch, detector.inspect)
+        api_server.set_inspection_service(service)
+        client = api_server.app.test_client()
+        image = np.zeros((20, 30, 3), np.uint8)
+        try:
+            png = cv2.imencode('.png', image)[1].tobytes()
+            response = client.post('/inspect', data=png, content_type='image/png')
+            self.assertEqual(response.get_json()['shape'], [20, 30, 3])
+            
+            response = client.post('/inspect', data=image.tobytes(),
+                                   content_type='application/octet-stream',
+                                   headers={'X-Image-Shape': '20,30,3'})
+            self.assertEqual(response.get_json()['objects'], 1)
+            
+            self.assertEqual(client.post('/inspect', data=b'xx', content_type='image/png').status_code, 400)
+            raw = {'data': image.tobytes(), 'content_type': 'application/octet-stream'}
+            for headers in ({'X-Image-Shape': '20,30,3', 'X-Deadline-Ms': 'snart'},
+                            {'X-Image-Shape': '20,30,3', 'X-Deadline-Ms': '-5'},
+                            {'X-Image-Shape': '20,30,3', 'X-Image-Dtype': 'pixel'},
+                            {'X-Image-Shape': '20,x,3'}):
+                self.assertEqual(client.post('/inspect', headers=headers, **raw).status_code, 400, headers)
+            self.assertIn('queue_depth', client.get('/inspect/metrics').get_json())
+        finally:
+            api_server.set_inspection_service(None)
+            service.close()
+
+if __name__ == '__main__':
+    unittest.main()
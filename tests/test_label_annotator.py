@@ -0,0 +1,67 @@
+"""Tester för förladdningen i annoteringsverktyget"""
+
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from tools.label_annotator import ImagePrefetcher, find_images
+
+class TestImagePrefetcher(unittest.TestCase):
+    """Tester för ImagePrefetcher"""
+    
+    def setUp(self):
+        self.files = [Path(f"{i}.jpg") for i in range(10)]
+        self.loaded = []
+        self._lock = threading.Lock()
+        
+    def _load(self, path):
+        time.sleep(0.01)
+        with self._lock:
+            self.loaded.append(path.name)
+        return path.name, None, 1.0
+        
+    def _wait_for(self, count):
+        deadline = time.monotonic() + 2.0
+        while len(self.loaded) < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+            
+    def test_neighbours_are_prefetched(self):
+        """Grannarna laddas i bakgrunden och nästa bild hämtas ur cachen"""
+        prefetcher = ImagePrefetcher(self.files, self._load, radius=2)
+        try:
+            self.assertEqual(prefetcher.get(3)[0], "3.jpg")
+            self._wait_for(5)
+            self.assertEqual(sorted(self.loaded), ["1.jpg", "2.jpg", "3.jpg", "4.jpg", "5.jpg"])
+            
+            self.assertEqual(prefetcher.get(4)[0], "4.jpg")
+            self._wait_for(6)
+            self.assertEqual(self.loaded.count("4.jpg"), 1)
+            self.assertIn("6.jpg", self.loaded)
+        finally:
+            prefetcher.stop()
+            
+    def test_each_image_loaded_once(self):
+        """En bild som förladdas just nu laddas inte en gång till"""
+        prefetcher = ImagePrefetcher(self.files, self._load, radius=1)
+        try:
+            prefetcher.get(0)
+            prefetcher.get(1)
+            self._wait_for(3)
+            self.assertEqual(sorted(self.loaded), ["0.jpg", "1.jpg", "2.jpg"])
+        finally:
+            prefetcher.stop()
+
+class TestFindImages(unittest.TestCase):
+    """Tester för find_images"""
+    
+    def test_supported_formats(self):
+        """PNG, JPEG och WebP hittas oavsett versaler, annat ignoreras"""
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("a.jpg", "b.PNG", "c.webp", "d.jpeg", "e.txt", "f.gif"):
+                Path(tmp, name).write_bytes(b"")
+                
+            self.assertEqual([p.name for p in find_images(tmp)], ["a.jpg", "b.PNG", "c.webp", "d.jpeg"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Tester för NiceLabel API-klienten"""
+
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from api.label_api import LabelAPI, APIError
+
+class _LabelHandler(BaseHTTPRequestHandler):
+    """Minimal etikettserver med ETag-stöd"""
+    
+    requests_seen = []
+    label = {"id": "101", "name": "226580 YD Vanilj-Kanelbulle"}
+    status = 200
+    
+    def do_GET(self):
+        self.requests_seen.append(self.headers.get('If-None-Match'))
+        if self.status != 200:
+            self.send_response(self.status)
+            self.end_headers()
+            return
+        if not self.path.endswith('/labels/101'):
+            self.send_response(404)
+            self.end_headers()
+            return
+            
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+            
+        body = json.dumps(self.label).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def log_message(self, *args):
+        pass
+
+class TestLabelAPI(unittest.TestCase):
+    def setUp(self):
+        """Starta en lokal testserver"""
+        _LabelHandler.requests_seen = []
+        _LabelHandler.status = 200
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _LabelHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/api"
+        
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        
+    def test_get_label_data_is_cached(self):
+        """Testa att etikettdata cachas inom TTL"""
+        with LabelAPI(self.base_url, cache_ttl=60) as api:
+            first = api.get_label_data("101")
+            first['name'] = "ändrad"
+            second = api.get_label_data("101")
+            
+        self.assertEqual(second['name'], "226580 YD Vanilj-Kanelbulle")
+        self.assertEqual(len(_LabelHandler.requests_seen), 1)
+        
+    def test_expired_entry_revalidated_with_etag(self):
+        """Testa att utgången cache valideras med If-None-Match"""
+        with LabelAPI(self.base_url, cache_ttl=60) as api:
+            api.get_label_data("101")
+            api._cache["101"] = (0.0,) + api._cache["101"][1:]
+            data = api.get_label_data("101")
+            
+        self.assertEqual(data['id'], "101")
+        self.assertEqual(_LabelHandler.requests_seen, [None, '"v1"'])
+        
+    def test_stale_entry_used_only_on_server_errors(self):
+        """Testa att utgången cache används vid 5xx men inte när etiketten tagits bort"""
+        with LabelAPI(self.base_url, cache_ttl=60, max_retries=0) as api:
+            api.get_label_data("101")
+            api._cache["101"] = (0.0,) + api._cache["101"][1:]
+            _LabelHandler.status = 503
+            self.assertEqual(api.get_label_data("101")['id'], "101")
+            
+            _LabelHandler.status = 404
+            with self.assertRaises(APIError) as raised:
+                api.get_label_data("101")
+            self.assertEqual(raised.exception.status_code, 404)
+            self.assertNotIn("101", api._cache)
+            
+    def test_missing_label_raises_api_error(self):
+        """Testa att 404 ger APIError"""
+        with LabelAPI(self.base_url, cache_ttl=0, max_retries=0) as api:
+            with self.assertRaises(APIError):
+                api.get_label_data("999")
+                
+    def test_unreachable_server_raises_api_error(self):
+        """Testa timeout/anslutningsfel utan cache"""
+        with LabelAPI("http://127.0.0.1:9/api", timeout=0.5, max_retries=0) as api:
+            with self.assertRaises(APIError):
+                api.get_label_data("101")
+
+if __name__ == '__main__':
+    unittest.main()
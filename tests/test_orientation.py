@@ -0,0 +1,93 @@
+"""Tester för orienteringsbestämning"""
+
+import unittest
+import cv2
+import numpy as np
+from vision.orientation import Orientation, OrientationEstimator, estimate_skew
+
+def _label(angle):
+    """Etikett med några textrader roterad angle grader moturs"""
+    image = np.full((600, 900, 3), 240, np.uint8)
+    lines = ["Kanelbulle 226580", "Vikt 100g Bast fore 2024-12-31",
+             "Ingredienser: vetemjol socker", "smor kanel jast salt", "Forvaras torrt"]
+    for i, line in enumerate(lines):
+        cv2.putText(image, line, (60, 120 + i * 70), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (20, 20, 20), 2)
+    rotation = cv2.getRotationMatrix2D((450, 300), angle, 1.0)
+    return cv2.warpAffine(image, rotation, (900, 600), borderValue=(240, 240, 240))
+
+class TestEstimateSkew(unittest.TestCase):
+    """Tester för den geometriska uppskattningen"""
+    
+    def test_skew_angles(self):
+        """Lutningen räknas fram inom en grad och med hög konfidens"""
+        for angle in (0, 7, -12, 30, -40):
+            skew, confidence = estimate_skew(_label(angle))
+            self.assertAlmostEqual(skew, -angle, delta=1.0, msg=f"vinkel {angle}")
+            self.assertGreater(confidence, 0.8)
+            
+    def test_blank_image(self):
+        """En tom bild ger ingen rotation och ingen konfidens"""
+        self.assertEqual(estimate_skew(np.full((200, 300), 255, np.uint8)), (0.0, 0.0))
+
+class TestOrientationEstimator(unittest.TestCase):
+    """Tester för OrientationEstimator"""
+    
+    def test_geometry_skips_osd(self):
+        """OSD körs inte när den geometriska uppskattningen är säker"""
+        calls = []
+        estimator = OrientationEstimator(osd=lambda image: calls.append(1) or 0)
+        
+        orientation = estimator.estimate(_label(10))
+        
+        self.assertEqual(orientation.source, "geometry")
+        self.assertAlmostEqual(orientation.angle, -10, delta=1.0)
+        self.assertEqual(calls, [])
+        
+    def test_vertical_text_uses_osd_for_direction(self):
+        """Lodrät text: OSD avgör om texten står upp eller på huvudet"""
+        # Efter upprätning står texten på huvudet, Tesseract vill rotera 180 medurs
+        estimator = OrientationEstimator(osd=lambda image: 180)
+        
+        orientation = estimator.estimate(_label(90))
+        
+        self.assertEqual(orientation.source, "geometry+osd")
+        self.assertAlmostEqual(orientation.angle, -90, delta=1.0)
+        
+    def test_cached_per_track(self):
+        """Samma spår återanvänder resultatet, andra spår räknas om"""
+        estimator = OrientationEstimator()
+        first = estimator.estimate(_label(15), track_id=1)
+        
+        self.assertIs(estimator.estimate(_label(0), track_id=1), first)
+        self.assertAlmostEqual(estimator.estimate(_label(0), track_id=2).angle, 0, delta=1.0)
+        
+        estimator.invalidate(1)
+        self.assertAlmostEqual(estimator.estimate(_label(0), track_id=1).angle, 0, delta=1.0)
+        
+    def test_osd_failure_falls_back(self):
+        """Ett fel i OSD ger den geometriska uppskattningen"""
+        def failing(image):
+            raise RuntimeError("tesseract saknas")
+            
+        orientation = OrientationEstimator(osd=failing, min_confidence=1.01).estimate(_label(5))
+        
+        self.assertEqual(orientation.source, "geometry")
+        self.assertEqual(orientation.angle, 0.0)
+
+class TestOrientation(unittest.TestCase):
+    """Tester för Orientation"""
+    
+    def test_apply_keeps_content_and_maps_boxes(self):
+        """Rotation 90 grader byter bredd och höjd, rutor följer med"""
+        image = np.zeros((100, 200), np.uint8)
+        image[10:20, 30:60] = 255
+        orientation = Orientation(90.0)
+        
+        rotated = orientation.apply(image)
+        x1, y1, x2, y2 = orientation.map_box(image.shape, (30, 10, 60, 20))
+        
+        self.assertEqual(rotated.shape, (200, 100))
+        self.assertGreater(rotated[y1:y2, x1:x2].mean(), 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""Tester för utkorgen för inspektionsrapporter"""
+
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from api.label_api import APIError
+from api.outbox import InspectionOutbox
+
+class _FakeAPI:
+    """Ersätter LabelAPI, misslyckas de första anropen och avvisar vissa etiketter"""
+    
+    def __init__(self, failures=0, rejected=()):
+        self.failures = failures
+        self.rejected = set(rejected)
+        self.received = []
+        self.calls = 0
+        
+    def report_inspections(self, inspections):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise APIError("Servern svarar inte")
+        if any(r.get('label_id') in self.rejected for r in inspections):
+            raise APIError("422 Unprocessable Entity", 422)
+        self.received.extend(inspections)
+        return {"accepted": len(inspections)}
+
+class TestInspectionOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = str(Path(self.tmp_dir) / "outbox.db")
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        
+    def test_flush_sends_in_batches(self):
+        """Testa att köade rapporter skickas i batchar"""
+        api = _FakeAPI()
+        outbox = InspectionOutbox(api, self.db_path, batch_size=3)
+        keys = [outbox.enqueue({'label_id': str(i), 'status': 'OK'}) for i in range(7)]
+        
+        self.assertEqual(outbox.flush(), 7)
+        self.assertEqual([r['idempotency_key'] for r in api.received], keys)
+        self.assertEqual(outbox.pending_count(), 0)
+        
+    def test_failed_send_is_retried_with_same_key(self):
+        """Testa att misslyckade rapporter ligger kvar och behåller nyckeln"""
+        api = _FakeAPI(failures=1)
+        outbox = InspectionOutbox(api, self.db_path, min_backoff=0.0)
+        key = outbox.enqueue({'label_id': '101', 'status': 'OK'})
+        
+        self.assertEqual(outbox.flush(), 0)
+        self.assertEqual(outbox.pending_count(), 1)
+        
+        self.assertEqual(outbox.flush(), 1)
+        self.assertEqual(api.received[0]['idempotency_key'], key)
+        
+    def test_full_outbox_rejects_without_blocking(self):
+        """Testa att en full kö avvisar nya rapporter"""
+        outbox = InspectionOutbox(_FakeAPI(), self.db_path, max_pending=1)
+        
+        self.assertIsNotNone(outbox.enqueue({'status': 'OK'}))
+        self.assertIsNone(outbox.enqueue({'status': 'OK'}))
+
+    def test_rejected_report_is_dead_lettered_alone(self):
+        """Testa att en avvisad batch skickas en och en och bara den felaktiga rapporten hamnar i dödkön"""
+        api = _FakeAPI(rejected={'2'})
+        outbox = InspectionOutbox(api, self.db_path, batch_size=5)
+        for i in range(4):
+            outbox.enqueue({'label_id': str(i), 'status': 'OK'})
+            
+        self.assertEqual(outbox.flush(), 3)
+        self.assertEqual(sorted(r['label_id'] for r in api.received), ['0', '1', '3'])
+        self.assertEqual(outbox.pending_count(), 0)
+        self.assertEqual([d['payload']['label_id'] for d in outbox.dead_letters()], ['2'])
+        
+        api.rejected.clear()
+        self.assertEqual(outbox.retry_dead_letters(), 1)
+        self.assertEqual(outbox.flush(), 1)
+        self.assertEqual(outbox.dead_letter_count(), 0)
+        
+    def test_dead_letter_after_max_attempts(self):
+        """Testa att en rapport som misslyckas max_attempts gånger flyttas till dödkön"""
+        api = _FakeAPI(failures=10)
+        outbox = InspectionOutbox(api, self.db_path, max_pending=1, min_backoff=0.0, max_attempts=2)
+        outbox.enqueue({'label_id': '101', 'status': 'OK'})
+        
+        outbox.flush()
+        self.assertEqual(outbox.pending_count(), 1)
+        outbox.flush()
+        
+        self.assertEqual(outbox.pending_count(), 0)
+        self.assertEqual(outbox.dead_letters()[0]['attempts'], 2)
+        self.assertIsNotNone(outbox.enqueue({'status': 'OK'}))
+        
+    def test_sender_does_not_spin_while_server_is_down(self):
+        """Testa att sändartråden väntar mellan försöken även utan flush_interval"""
+        api = _FakeAPI(failures=1000)
+        outbox = InspectionOutbox(api, self.db_path, flush_interval=0.0, min_backoff=0.0)
+        outbox.enqueue({'label_id': '101', 'status': 'OK'})
+        
+        outbox.start()
+        time.sleep(0.3)
+        outbox.stop()
+        
+        self.assertLessEqual(api.calls, 5)
+
+if __name__ == '__main__':
+    unittest.main()
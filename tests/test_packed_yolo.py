@@ -0,0 +1,54 @@
+"""Tester för YOLO-träning från packade shards"""
+
+import tempfile
+import unittest
+from pathlib import Path
+import cv2
+import numpy as np
+from utils.dataset_shards import label_path_for, pack_training_split
+
+try:
+    from ultralytics.cfg import get_cfg
+    from utils.packed_yolo import PackedYOLODataset
+except ImportError:
+    PackedYOLODataset = None
+
+@unittest.skipIf(PackedYOLODataset is None, "ultralytics är inte installerat")
+class TestPackedYOLODataset(unittest.TestCase):
+    """Tester för PackedYOLODataset"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = Path(self._tmp.name)
+        images = root / "images" / "val"
+        images.mkdir(parents=True)
+        # Olika bildformat så att rect-läget sorterar om bilderna; klass i = ljushet i * 20
+        self.sizes = sizes = [(400, 800), (800, 400), (600, 600), (300, 900), (900, 300), (500, 700)]
+        for i, (height, width) in enumerate(sizes):
+            cv2.imwrite(str(images / f"{i}.png"), np.full((height, width, 3), i * 20, np.uint8))
+            label_path = label_path_for(images / f"{i}.png")
+            label_path.parent.mkdir(parents=True, exist_ok=True)
+            label_path.write_text(f"{i} 0.5 0.5 0.2 0.2\n")
+        self.shard = root / "val.320.shard"
+        pack_training_split(images, self.shard, imgsz=320, workers=1)
+        
+    def tearDown(self):
+        self._tmp.cleanup()
+        
+    def test_rect_mode_keeps_images_and_labels_paired(self):
+        """Med rect=True hör bild, storlek och annotering fortfarande ihop"""
+        dataset = PackedYOLODataset(img_path=str(self.shard), imgsz=320, batch_size=2, augment=False,
+                                    hyp=get_cfg(), rect=True, cache=False, stride=32, pad=0.5,
+                                    data={'names': {i: str(i) for i in range(6)}, 'nc': 6})
+                                    
+        self.assertNotEqual([Path(f).stem for f in dataset.im_files], [str(i) for i in range(6)])
+        for i, label in enumerate(dataset.labels):
+            image, original, resized = dataset.load_image(i)
+            cls = int(label['cls'][0, 0])
+            self.assertEqual(Path(dataset.im_files[i]).stem, str(cls))
+            self.assertEqual(int(image[0, 0, 0]), cls * 20)
+            self.assertEqual(original, self.sizes[cls])
+            self.assertEqual(max(resized), 320)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Tester för förberedelse av datasetet"""
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+import cv2
+import numpy as np
+from prepare_dataset import MANIFEST_FILE, DatasetPreparer
+
+class TestDatasetPreparer(unittest.TestCase):
+    """Tester för DatasetPreparer"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self._tmp.name)
+        for customer in ("Baxt", "Schulstad"):
+            folder = self.base / "Labels" / customer
+            folder.mkdir(parents=True)
+            for i in range(10):
+                image = np.full((600, 1600, 3), i * 20, np.uint8)
+                cv2.imwrite(str(folder / f"{i}.jpg"), image)
+                
+    def tearDown(self):
+        self._tmp.cleanup()
+        
+    def _preparer(self, seed=0):
+        return DatasetPreparer(self.base, max_size=400, seed=seed, workers=2)
+        
+    def _splits(self):
+        manifest = json.loads((self.base / "dataset" / MANIFEST_FILE).read_text())
+        return {relative: entry['split'] for relative, entry in manifest['files'].items()}
+        
+    def test_prepares_resized_and_skips_unchanged(self):
+        """Bilderna skalas ner en gång, andra körningen gör ingenting om"""
+        counts = self._preparer().build()
+        
+        self.assertEqual(counts['prepared'], 20)
+        written = list((self.base / "dataset" / "images").rglob("*.jpg"))
+        self.assertEqual(len(written), 20)
+        self.assertEqual(cv2.imread(str(written[0])).shape[:2], (150, 400))
+        
+        touched = self.base / "Labels" / "Baxt" / "3.jpg"
+        os.utime(touched, ns=(1, 1))
+        counts = self._preparer().build()
+        self.assertEqual(counts, {'prepared': 0, 'unchanged': 20, 'failed': 0, 'removed': 0})
+        
+    def test_split_is_stable(self):
+        """Samma seed ger samma uppdelning, nya bilder flyttar inte de gamla"""
+        preparer = self._preparer()
+        preparer.build()
+        before = self._splits()
+        cv2.imwrite(str(self.base / "Labels" / "Baxt" / "ny.jpg"), np.zeros((50, 50, 3), np.uint8))
+        preparer.build()
+        
+        after = self._splits()
+        
+        self.assertEqual({k: after[k] for k in before}, before)
+        self.assertEqual(set(before.values()) | set(after.values()), {'train', 'val', 'test'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""Tester för upprätning av etiketter"""
+
+import unittest
+import cv2
+import numpy as np
+from vision.rectification import LabelRectifier, order_corners, refine_corners
+
+CORNERS = np.float32([[300, 150], [950, 190], [930, 600], [320, 560]])
+
+def _scene():
+    """Etikett i perspektiv på en mörkare bakgrund, samt själva etiketten"""
+    label = np.full((500, 800, 3), 245, np.uint8)
+    for i in range(6):
+        cv2.putText(label, "Kanelbulle 226580 vikt", (40, 80 + i * 70),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 2)
+    source = np.float32([[0, 0], [799, 0], [799, 499], [0, 499]])
+    matrix = cv2.getPerspectiveTransform(source, CORNERS)
+    scene = np.full((720, 1280, 3), (90, 110, 100), np.uint8)
+    cv2.warpPerspective(label, matrix, (1280, 720), dst=scene, borderMode=cv2.BORDER_TRANSPARENT)
+    return scene, label
+
+def _bounding_box():
+    x, y, w, h = cv2.boundingRect(CORNERS.astype(np.int32))
+    return (x, y, x + w, y + h)
+
+class TestRefineCorners(unittest.TestCase):
+    """Tester för hörnförfining"""
+    
+    def test_order_corners(self):
+        """Hörnen sorteras medurs från övre vänster"""
+        shuffled = CORNERS[[2, 0, 3, 1]]
+        np.testing.assert_array_equal(order_corners(shuffled), CORNERS)
+        
+    def test_refines_loose_box(self):
+        """En slarvig detektorruta förfinas till etikettens verkliga hörn"""
+        scene, _ = _scene()
+        x1, y1, x2, y2 = _bounding_box()
+        
+        corners = refine_corners(scene, (x1 + 10, y1 - 5, x2 - 15, y2 + 5))
+        
+        self.assertIsNotNone(corners)
+        self.assertLess(np.abs(corners - CORNERS).max(), 5.0)
+        
+    def test_no_label(self):
+        """En jämn bild ger inga hörn"""
+        self.assertIsNone(refine_corners(np.full((200, 300, 3), 128, np.uint8)))
+
+class TestLabelRectifier(unittest.TestCase):
+    """Tester för LabelRectifier"""
+    
+    def test_warps_to_canonical_size(self):
+        """Etiketten räknas om till etikettypens storlek och liknar originalet"""
+        scene, label = _scene()
+        rectifier = LabelRectifier({'kartong': (800, 500)})
+        
+        warped = rectifier.warp(scene, _bounding_box(), 'kartong')
+        
+        self.assertEqual(warped.shape, (500, 800, 3))
+        self.assertLess(np.abs(warped.astype(int) - label).mean(), 20)
+        
+    def test_learns_size_per_label_type(self):
+        """Utan angiven storlek bestäms den av första etiketten av typen"""
+        scene, _ = _scene()
+        rectifier = LabelRectifier(long_side=600)
+        
+        first = rectifier.rectify(scene, _bounding_box(), 'pall')
+        second = rectifier.rectify(scene[:, ::-1].copy(), None, 'pall')
+        
+        self.assertEqual(max(first.size), 600)
+        self.assertEqual(second.size, first.size)
+        
+    def test_unknown_type_keeps_own_proportions(self):
+        """Utan etikettyp sparas ingen storlek som låser följande etiketter"""
+        image = np.full((600, 800, 3), 128, np.uint8)
+        rectifier = LabelRectifier(long_side=400)
+        
+        wide = rectifier.rectify(image, (0, 0, 400, 100), refine=False)
+        tall = rectifier.rectify(image, (0, 0, 100, 400), refine=False)
+        
+        self.assertEqual(wide.size, (400, 100))
+        self.assertEqual(tall.size, (100, 400))
+        self.assertNotIn('', rectifier.canonical_sizes)
+        
+    def test_reuses_transform_while_stable(self):
+        """Transformen återanvänds när rutan står still och räknas om när den flyttas"""
+        scene, _ = _scene()
+        rectifier = LabelRectifier()
+        box = _bounding_box()
+        
+        first = rectifier.rectify(scene, box, track_id=1)
+        moved = tuple(v + 2 for v in box)
+        self.assertIs(rectifier.rectify(scene, moved, track_id=1), first)
+        
+        far = tuple(v + 80 for v in box)
+        self.assertIsNot(rectifier.rectify(scene, far, track_id=1), first)
+        
+    def test_track_cache_is_bounded(self):
+        """Bara de senast använda spåren sparas"""
+        scene, _ = _scene()
+        rectifier = LabelRectifier(max_entries=2)
+        box = _bounding_box()
+        
+        first = rectifier.rectify(scene, box, track_id=1)
+        rectifier.rectify(scene, box, track_id=2)
+        self.assertIs(rectifier.rectify(scene, box, track_id=1), first)
+        rectifier.rectify(scene, box, track_id=3)
+        
+        self.assertEqual(list(rectifier._tracks), [1, 3])
+        
+    def test_falls_back_to_box(self):
+        """Hittas ingen kontur används detektorns ruta"""
+        image = np.full((300, 400, 3), 128, np.uint8)
+        rectification = LabelRectifier({'kartong': (200, 100)}).rectify(image, (50, 50, 250, 150), 'kartong')
+        
+        self.assertFalse(rectification.refined)
+        np.testing.assert_allclose(rectification.to_image([(0, 0), (199, 99)]), [(50, 50), (250, 150)], atol=1e-3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+"""Tester för identifiering av etiketter via textindex"""
+
+import unittest
+from vision.reference_index import ReferenceIndex, char_ngrams
+
+class TestReferenceIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ReferenceIndex()
+        self.index.add_many([
+            ("101", "Vanilj-Kanelbulle Vikt: 100g Bäst före: 2024-12-31"),
+            ("102", "Kanelbulle Vikt: 90g Bäst före: 2024-12-31"),
+            ("201", "Skillingsbolle Vekt: 95g Best før: 2024-12-31"),
+            ("401", "Cinnamon Roll Weight: 95g Best before: 2024-12-31"),
+        ])
+        
+    def test_identifies_label_despite_ocr_errors(self):
+        """Testa att rätt produkt hittas trots felläst text"""
+        results = self.index.search("Skil1ingsbolle Vekt 95g Best for 2024-12-31", top_k=2)
+        self.assertEqual(results[0][0], "201")
+        self.assertGreater(results[0][1], results[1][1])
+        
+    def test_candidates_only_share_grams(self):
+        """Testa att referenser utan gemensamma n-gram inte blir kandidater"""
+        self.assertEqual(self.index.search("xyzzy qwerty"), [])
+        self.assertIn(" ka", char_ngrams("Kanel"))
+        
+    def test_min_score_and_top_k(self):
+        """Testa att top_k och min_score begränsar resultatet"""
+        results = self.index.search("Kanelbulle Vikt: 90g", top_k=1, min_score=0.5)
+        self.assertEqual([r[0] for r in results], ["102"])
+
+if __name__ == '__main__':
+    unittest.main()
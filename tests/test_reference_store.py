@@ -0,0 +1,114 @@
+"""Tester för lagret med referenssärdrag"""
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+import cv2
+import numpy as np
+from vision.reference_store import ReferenceStore, discover_references, hamming_distances, perceptual_hash
+
+def _reference(seed):
+    """Referensetikett med unik text och grafik"""
+    rng = np.random.default_rng(seed)
+    image = np.full((400, 600), 255, np.uint8)
+    for row in range(6):
+        cv2.putText(image, f"Produkt {seed} rad {row} {rng.integers(1e6)}", (20, 50 + row * 55),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    cv2.circle(image, (int(rng.integers(100, 500)), int(rng.integers(100, 300))), int(rng.integers(20, 60)), 0, 3)
+    return image
+
+class TestReferenceStore(unittest.TestCase):
+    """Tester för ReferenceStore"""
+    
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.refs = self.root / "refs" / "schulstad"
+        self.refs.mkdir(parents=True)
+        for i in range(8):
+            cv2.imwrite(str(self.refs / f"{62860 + i}_kartong.png"), _reference(i))
+        (self.refs / "62863_kartong.zones.json").write_text(json.dumps([
+            {'name': 'bast_fore', 'box': [20, 300, 300, 350], 'kind': 'date', 'expected': ''}
+        ]))
+        (self.refs / "62863_kartong.txt").write_text("Donut Hallon", encoding='utf-8')
+        self.store_dir = self.root / "store"
+        
+    def tearDown(self):
+        self._tmp.cleanup()
+        
+    def _build(self):
+        return ReferenceStore(self.store_dir).build(discover_references([self.root / "refs"]))
+        
+    def test_build_and_load_memory_mapped(self):
+        """Lagret byggs en gång och laddas sedan minnesmappat"""
+        self.assertEqual(self._build()['added'], 8)
+        
+        store = ReferenceStore(self.store_dir)
+        self.assertTrue(store.load())
+        self.assertEqual(len(store), 8)
+        self.assertIsInstance(store.descriptors, np.memmap)
+        reference = store.get("schulstad/62863_kartong")
+        self.assertEqual(reference.text, "Donut Hallon")
+        self.assertEqual(store.zone_mask("schulstad/62863_kartong")[320, 100], 255)
+        
+    def test_incremental_rebuild(self):
+        """Bara ändrade referenser räknas om, borttagna försvinner"""
+        self._build()
+        path = self.refs / "62861_kartong.png"
+        cv2.imwrite(str(path), _reference(99))
+        os.utime(path, ns=(1, 1))
+        (self.refs / "62867_kartong.png").unlink()
+        
+        counts = self._build()
+        
+        self.assertEqual(counts, {'added': 0, 'updated': 1, 'unchanged': 6, 'removed': 1})
+        self.assertEqual(sorted(p.name for p in self.store_dir.glob('*.npy')),
+                         ['descriptors.2.npy', 'owners.2.npy', 'phashes.2.npy', 'points.2.npy'])
+                         
+    def test_lookup_identifies_reference(self):
+        """En roterad och skalad bild identifieras med deskriptorröstning"""
+        self._build()
+        store = ReferenceStore(self.store_dir)
+        store.load()
+        rotation = cv2.getRotationMatrix2D((300, 200), 8, 0.9)
+        captured = cv2.warpAffine(_reference(5), rotation, (600, 400), borderValue=255)
+        
+        best, votes = store.lookup(captured)[0]
+        
+        self.assertEqual(best, "schulstad/62865_kartong")
+        self.assertGreater(votes, 10)
+        self.assertEqual(store.identify(captured, min_votes=10), best)
+        self.assertIsNone(store.identify(np.full((400, 600), 255, np.uint8)))
+        
+    def test_template_uses_stored_features(self):
+        """Mallen får lagrade punkter och zoner utan att räkna om särdragen"""
+        self._build()
+        store = ReferenceStore(self.store_dir)
+        store.load()
+        
+        template = store.template("schulstad/62863_kartong")
+        
+        reference = store.get("schulstad/62863_kartong")
+        self.assertEqual(len(template.descriptors), reference.count)
+        self.assertEqual(template.zones[0].kind, 'date')
+        self.assertIs(store.template("schulstad/62863_kartong"), template)
+        self.assertIsNone(store.template("saknas"))
+
+class TestPerceptualHash(unittest.TestCase):
+    """Tester för perceptuell hash"""
+    
+    def test_similar_images_are_close(self):
+        """Lätt brus ändrar hashen lite, en annan etikett mycket"""
+        image = _reference(1)
+        noisy = cv2.add(image, np.random.default_rng(0).integers(0, 20, image.shape, dtype=np.uint8))
+        hashes = np.array([perceptual_hash(noisy), perceptual_hash(_reference(2))], dtype=np.uint64)
+        
+        near, far = hamming_distances(hashes, perceptual_hash(image))
+        
+        self.assertLess(near, 6)
+        self.assertGreater(far, near)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Tester för registrering mot referensetiketter"""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+import cv2
+import numpy as np
+from vision.registration import TemplateRegistration, Zone, load_zones
+
+ZONES = [Zone('bast_fore', (30, 330, 400, 380), 'date'),
+         Zone('batch', (30, 400, 400, 450), 'batch')]
+
+def _reference():
+    """Renderad referensetikett med statisk layout och tomma fält"""
+    image = np.full((500, 800), 255, np.uint8)
+    cv2.putText(image, "Schulstad", (30, 60), cv2.FONT_HERSHEY_DUPLEX, 1.6, 0, 3)
+    cv2.rectangle(image, (20, 20), (780, 480), 0, 3)
+    for i in range(5):
+        cv2.putText(image, f"Ingredienser {i}: vetemjol socker smor", (30, 120 + i * 35),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+    cv2.circle(image, (680, 100), 50, 0, 4)
+    return image
+
+def _captured(label):
+    """Fyll i fälten och fotografera etiketten snett med annan belysning"""
+    label = label.copy()
+    cv2.putText(label, "2025-01-31", (40, 370), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    cv2.putText(label, "Batch 250421", (40, 440), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    source = np.float32([[0, 0], [799, 0], [799, 499], [0, 499]])
+    target = np.float32([[100, 80], [980, 120], [950, 640], [130, 600]])
+    scene = np.full((720, 1100), 120, np.uint8)
+    cv2.warpPerspective(label, cv2.getPerspectiveTransform(source, target), (1100, 720),
+                        dst=scene, borderMode=cv2.BORDER_TRANSPARENT)
+    return cv2.convertScaleAbs(scene, alpha=0.8, beta=20)
+
+class TestTemplateRegistration(unittest.TestCase):
+    """Tester för TemplateRegistration"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.registration = TemplateRegistration()
+        cls.template = cls.registration.template('62865_kartong', _reference(), ZONES)
+        
+    def test_registers_and_reads_only_zones(self):
+        """Etiketten registreras och OCR körs bara på zonerna"""
+        crops = []
+        
+        def read_text(crop):
+            crops.append(crop.shape)
+            return "2025-01-31" if len(crops) == 1 else "Batch 250421"
+            
+        result = self.registration.inspect(_captured(_reference()), self.template, read_text)
+        
+        self.assertTrue(result.registered)
+        self.assertTrue(result.static_ok, result.static_diff)
+        self.assertTrue(result.passed, result.error)
+        self.assertEqual(crops, [(50, 370), (50, 370)])
+        
+    def test_changed_artwork_fails(self):
+        """Ändrad statisk layout upptäcks med bilddiffen"""
+        changed = _reference()
+        cv2.putText(changed, "FEL", (500, 300), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+        
+        result = self.registration.inspect(_captured(changed), self.template, lambda crop: "2025-01-31")
+        
+        self.assertTrue(result.registered)
+        self.assertFalse(result.static_ok)
+        self.assertFalse(result.passed)
+        
+    def test_missing_date_fails_zone(self):
+        """Ett datumfält utan datum underkänns"""
+        result = self.registration.inspect(_captured(_reference()), self.template, lambda crop: "")
+        
+        self.assertEqual([z.passed for z in result.zones], [False, False])
+        self.assertIn("bast_fore", result.error)
+        
+    def test_unrelated_image_not_registered(self):
+        """En bild utan etiketten kan inte registreras"""
+        noise = np.random.default_rng(0).integers(0, 255, (480, 640), dtype=np.uint8)
+        result = self.registration.inspect(noise, self.template)
+        
+        self.assertFalse(result.registered)
+        self.assertFalse(result.passed)
+
+class TestLoadZones(unittest.TestCase):
+    """Tester för zonfiler"""
+    
+    def test_load_template_with_zones(self):
+        """Referens-PNG läses tillsammans med sin zonfil"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "62865_kartong.png"
+            cv2.imwrite(str(path), _reference())
+            path.with_suffix('.zones.json').write_text(json.dumps({'zones': [
+                {'name': 'ean', 'box': [500, 380, 760, 470], 'kind': 'barcode', 'expected': '7310865004703'}
+            ]}))
+            
+            template = TemplateRegistration().load_template(str(path))
+            
+        self.assertEqual(template.label_id, "62865_kartong")
+        self.assertEqual(template.zones[0].kind, 'barcode')
+        self.assertGreater(len(template.points), 100)
+        
+    def test_unknown_kind(self):
+        """Okända zontyper avvisas"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "zones.json"
+            path.write_text(json.dumps([{'name': 'x', 'box': [0, 0, 1, 1], 'kind': 'logo'}]))
+            with self.assertRaises(ValueError):
+                load_zones(path)
+
+if __name__ == '__main__':
+    unittest.main()
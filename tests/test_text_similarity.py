@@ -0,0 +1,57 @@
+"""Tester för textlikhet"""
+
+import unittest
+from vision.text_similarity import (ReferenceMatcher, levenshtein, levenshtein_ratio,
+                                    text_similarity)
+
+def _reference_distance(a, b):
+    """Klassisk DP att jämföra mot"""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+class TestTextSimilarity(unittest.TestCase):
+    def test_levenshtein_matches_reference(self):
+        """Testa avståndet mot klassisk DP, med och utan gräns"""
+        pairs = [("", "abc"), ("kanelbulle", "kanelbu11e"), ("bäst före", "bast fore"),
+                 ("donut hallon", "hallon donut"), ("a" * 70, "a" * 65 + "b" * 5)]
+        for a, b in pairs:
+            distance = _reference_distance(a, b)
+            self.assertEqual(levenshtein(a, b), distance)
+            self.assertEqual(levenshtein(a, b, max_distance=1), min(distance, 2))
+            
+    def test_ocr_errors_and_word_order(self):
+        """Testa att OCR-fel och annan ordföljd ger hög likhet"""
+        reference = "Vanilj-Kanelbulle\nVikt: 100g\nBäst före: 2024-12-31"
+        self.assertGreater(text_similarity("Vani1j-Kanelbulle Vikt: 100g Bäst före: 2024-12-31", reference), 0.9)
+        self.assertEqual(text_similarity("Donut Hallon Vadelmadonitsi", "Vadelmadonitsi / Donut Hallon"), 1.0)
+        self.assertLess(text_similarity("Skillingsbolle 95g", reference), 0.5)
+        self.assertEqual(levenshtein_ratio("abcdef", "uvwxyz", min_score=0.8), 0.0)
+        
+    def test_partial_read_is_not_a_match(self):
+        """Testa att en avläsning av bara en del av referensen underkänns"""
+        reference = "Vanilj-Kanelbulle\nVikt: 100g\nBäst före: 2024-12-31"
+        self.assertLess(text_similarity("Kanelbulle", reference), 0.8)
+        self.assertLess(text_similarity("2024", reference), 0.8)
+        
+        other_product = "Kanelbulle Vikt: 100g Bäst före: 2024-12-31"
+        self.assertLess(text_similarity(other_product, reference), 0.9)
+        scores = ReferenceMatcher([reference]).scores("Kanelbulle")
+        self.assertLess(scores[0], 0.8)
+        
+    def test_one_against_many(self):
+        """Testa att rätt referens väljs bland flera"""
+        references = ["Kanelbulle Vikt: 90g", "Vanilj-Kanelbulle Vikt: 100g", "Cinnamon Roll Weight: 95g"]
+        matcher = ReferenceMatcher(references)
+        scores = matcher.scores("Vanilj-Kane1bulle Vikt: 100g")
+        self.assertEqual(len(scores), 3)
+        self.assertEqual(matcher.best("Vanilj-Kane1bulle Vikt: 100g", min_score=0.8)[0], 1)
+        self.assertEqual(matcher.best("helt annan text", min_score=0.8), (-1, 0.0))
+
+if __name__ == '__main__':
+    unittest.main()
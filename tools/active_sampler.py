@@ -0,0 +1,316 @@
+"""Väljer vilka bilder som ska annoteras härnäst
+
+Oannoterade bilder från inspelningsmappar och lagringen för underkända
+valideringar poängsätts efter hur mycket de väntas lära modellen:
+
+1. Nästan identiska bildrutor slås ihop med perceptuell hash, även mot
+   redan annoterade bilder, innan något dyrare körs.
+2. Detektorns osäkerhet (boxar med konfidens nära 0.5) och OCR:ens
+   osäkerhet räknas fram parallellt, en modell per process.
+3. Urvalet görs girigt: varje ny bild väljs efter sin osäkerhet och sitt
+   avstånd i en enkel bildinbäddning till allt som redan valts eller
+   annoterats, så att urvalet inte fylls med varianter av samma scen.
+
+De valda bilderna kopieras till en mapp som öppnas i label_annotator.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+
+# Gör projektroten importerbar när skriptet körs direkt (python tools/...)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from database.image_store import ImageStore
+from tools.auto_annotator import DEFAULT_MODEL, Detection, yolo_predictor
+from utils.dataset_shards import TRAINING_EXTENSIONS, label_path_for
+from vision.reference_store import hamming_distances, perceptual_hash
+
+# Prefix för bilder som ligger i en ImageStore, följt av rot och hash
+STORE_PREFIX = 'store:'
+
+@dataclass
+class Candidate:
+    """En bild som kan väljas för annotering"""
+    key: str
+    phash: int = 0
+    embedding: Optional[np.ndarray] = field(default=None, repr=False)
+    detector: Optional[float] = None
+    ocr: Optional[float] = None
+    score: float = 0.0
+    labeled: bool = False
+
+def store_key(root: str, digest: str, ext: str) -> str:
+    """Nyckel för en bild i en ImageStore"""
+    return f"{STORE_PREFIX}{root}|{digest}{ext}"
+
+_stores: Dict[str, ImageStore] = {}
+
+def _read_stored(key: str) -> Tuple[str, Optional[bytes]]:
+    """Filnamn och kodad bild för en nyckel i en ImageStore, en instans per rot och process"""
+    root, name = key[len(STORE_PREFIX):].split('|')
+    if root not in _stores:
+        _stores[root] = ImageStore(root)
+    return name, _stores[root].read_bytes(Path(name).stem)
+
+def _read(key: str, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+    """Läser en bild från fil eller ImageStore"""
+    if not key.startswith(STORE_PREFIX):
+        return cv2.imread(key, flags)
+    _, data = _read_stored(key)
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flags) if data else None
+
+def embed(gray: np.ndarray) -> np.ndarray:
+    """Enkel bildinbäddning: normaliserad 16x16-nedskalning, 256 dimensioner"""
+    small = cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32).flatten()
+    small -= small.mean()
+    return small / (np.linalg.norm(small) + 1e-6)
+
+def _fingerprint(key: str) -> Tuple[str, Optional[int], Optional[np.ndarray]]:
+    """Perceptuell hash och inbäddning, avkodat i fjärdedels storlek"""
+    gray = _read(key, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return key, None, None
+    return key, perceptual_hash(gray), embed(gray)
+
+def detector_uncertainty(detections: List[Detection]) -> float:
+    """Största osäkerheten bland boxarna, 1 för konfidens 0.5 och 0 för 0 eller 1
+    
+    En bild utan detektioner får 0.5, den kan vara tom eller helt missad.
+    """
+    if not detections:
+        return 0.5
+    return max(1.0 - abs(2.0 * d.confidence - 1.0) for d in detections)
+
+def tesseract_confidence(image: np.ndarray) -> Optional[float]:
+    """Medelkonfidens 0-100 för orden Tesseract hittar, None utan text"""
+    import pytesseract
+    data = pytesseract.image_to_data(image, config='--oem 3 --psm 6 -l swe+eng',
+                                     output_type=pytesseract.Output.DICT)
+    confidences = [float(c) for c, text in zip(data['conf'], data['text']) if float(c) >= 0 and text.strip()]
+    return sum(confidences) / len(confidences) if confidences else None
+
+def default_scorers(model_path: str = DEFAULT_MODEL, imgsz: int = 640, threads: int = 1,
+                    use_ocr: bool = True) -> Tuple[Optional[Callable], Optional[Callable]]:
+    """Detektor och OCR för arbetsprocesserna, None för det som saknas"""
+    detector = yolo_predictor(model_path, imgsz, 0.05, threads) if model_path else None
+    ocr = None
+    if use_ocr:
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+            ocr = tesseract_confidence
+        except Exception:
+            ocr = None
+    return detector, ocr
+
+_detector: Optional[Callable] = None
+_ocr: Optional[Callable] = None
+
+def _init_worker(factory: Callable, args: Tuple):
+    """Laddar detektor och OCR en gång per arbetsprocess"""
+    global _detector, _ocr
+    _detector, _ocr = factory(*args)
+
+def _score_batch(keys: Sequence[str]) -> List[Tuple[str, Optional[float], Optional[float]]]:
+    """Detektorns och OCR:ens osäkerhet (0-1) för en batch bilder"""
+    images = [(key, _read(key)) for key in keys]
+    images = [(key, image) for key, image in images if image is not None]
+    detections = _detector([image for _, image in images]) if _detector and images else None
+    
+    results = []
+    for i, (key, image) in enumerate(images):
+        detector = detector_uncertainty(detections[i]) if detections is not None else None
+        ocr = None
+        if _ocr is not None:
+            try:
+                confidence = _ocr(image)
+                ocr = 1.0 - confidence / 100.0 if confidence is not None else None
+            except Exception:
+                ocr = None
+        results.append((key, detector, ocr))
+    return results
+
+def collect_candidates(image_dirs: Iterable[str], store_roots: Iterable[str] = ()) -> Tuple[List[str], List[str]]:
+    """Oannoterade och annoterade bilder i mappar och ImageStore-lagringar
+    
+    Returns:
+        (oannoterade, annoterade) som nycklar för _read
+    """
+    unlabeled, labeled = [], []
+    for directory in image_dirs:
+        for path in sorted(Path(directory).rglob('*')):
+            if path.suffix.lower() not in TRAINING_EXTENSIONS or not path.is_file():
+                continue
+            label_path = label_path_for(path)
+            if label_path.exists() and label_path.stat().st_size > 0:
+                labeled.append(str(path))
+            else:
+                unlabeled.append(str(path))
+    for root in store_roots:
+        if (Path(root) / "index.db").exists():
+            unlabeled.extend(store_key(str(root), digest, ext) for digest, ext in ImageStore(root).list_images())
+    return unlabeled, labeled
+
+def deduplicate(candidates: List[Candidate], max_distance: int = 6) -> List[Candidate]:
+    """Tar bort bilder vars hash ligger nära en annoterad eller redan behållen bild"""
+    kept = []
+    hashes = np.array([c.phash for c in candidates if c.labeled], dtype=np.uint64)
+    for candidate in candidates:
+        if candidate.labeled:
+            continue
+        if len(hashes) and hamming_distances(hashes, candidate.phash).min() <= max_distance:
+            continue
+        kept.append(candidate)
+        hashes = np.append(hashes, np.uint64(candidate.phash))
+    return kept
+
+def select_diverse(candidates: List[Candidate], labeled: List[Candidate], count: int,
+                   diversity: float = 0.3) -> List[Candidate]:
+    """Girigt urval som väger osäkerhet mot avstånd till det redan valda
+    
+    Args:
+        candidates: Poängsatta kandidater
+        labeled: Annoterade bilder, räknas som redan valda
+        count: Antal bilder att välja
+        diversity: Vikt 0-1 för avståndet i inbäddningen
+    """
+    if not candidates:
+        return []
+    embeddings = np.stack([c.embedding for c in candidates])
+    scores = np.array([c.score for c in candidates])
+    nearest = np.ones(len(candidates))
+    for reference in labeled:
+        nearest = np.minimum(nearest, np.linalg.norm(embeddings - reference.embedding, axis=1) / 2.0)
+        
+    selected = []
+    available = np.ones(len(candidates), dtype=bool)
+    for _ in range(min(count, len(candidates))):
+        total = np.where(available, (1.0 - diversity) * scores + diversity * nearest, -np.inf)
+        best = int(np.argmax(total))
+        selected.append(candidates[best])
+        available[best] = False
+        nearest = np.minimum(nearest, np.linalg.norm(embeddings - embeddings[best], axis=1) / 2.0)
+    return selected
+
+def sample(image_dirs: Iterable[str], count: int, store_roots: Iterable[str] = (), batch: int = 8,
+           workers: Optional[int] = None, detector_weight: float = 0.7, diversity: float = 0.3,
+           max_distance: int = 6, factory: Callable = default_scorers,
+           factory_args: Optional[Tuple] = None) -> List[Candidate]:
+    """Väljer de count mest informativa oannoterade bilderna
+    
+    Args:
+        image_dirs: Mappar med bilder, t.ex. captured_images och dataset/images/train
+        count: Antal bilder att välja
+        store_roots: Rotkataloger för ImageStore, t.ex. data/failed_validations
+        batch: Bilder per detektoranrop
+        workers: Antal processer, None för halva antalet kärnor
+        detector_weight: Vikt för detektorn mot OCR när båda finns
+        diversity: Vikt 0-1 för spridning i urvalet
+        max_distance: Största hammingavstånd som räknas som samma bildruta
+        factory: Ger (detektor, ocr) i varje arbetsprocess, måste gå att pickla
+        factory_args: Argument till factory
+        
+    Returns:
+        Valda kandidater i urvalsordning
+    """
+    unlabeled, labeled_keys = collect_candidates(image_dirs, store_roots)
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    start = time.monotonic()
+    
+    # Billigt pass: hash och inbäddning för alla bilder
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        fingerprints = list(pool.map(_fingerprint, unlabeled + labeled_keys, chunksize=16))
+    labeled_set = set(labeled_keys)
+    everything = [Candidate(key, phash, embedding, labeled=key in labeled_set)
+                  for key, phash, embedding in fingerprints if phash is not None]
+    labeled = [c for c in everything if c.labeled]
+    candidates = deduplicate(everything, max_distance)
+    print(f"{len(unlabeled)} oannoterade bilder, {len(candidates)} efter dubblettrensning "
+          f"({time.monotonic() - start:.1f} s)")
+          
+    # Dyrt pass: detektor och OCR bara på de unika bilderna
+    args = factory_args if factory_args is not None else (
+        DEFAULT_MODEL, 640, max(1, (os.cpu_count() or 1) // workers))
+    by_key = {c.key: c for c in candidates}
+    chunks = [[c.key for c in candidates[i:i + batch]] for i in range(0, len(candidates), batch)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(factory, args)) as pool:
+        for results in pool.map(_score_batch, chunks):
+            for key, detector, ocr in results:
+                by_key[key].detector, by_key[key].ocr = detector, ocr
+                
+    for candidate in candidates:
+        terms = [(detector_weight, candidate.detector), (1.0 - detector_weight, candidate.ocr)]
+        terms = [(weight, value) for weight, value in terms if value is not None and weight > 0]
+        weight = sum(w for w, _ in terms)
+        candidate.score = sum(w * v for w, v in terms) / weight if weight else 0.0
+        
+    selected = select_diverse(candidates, labeled, count, diversity)
+    print(f"Valde {len(selected)} bilder på {time.monotonic() - start:.1f} s")
+    return selected
+
+def export_selection(selected: List[Candidate], output_dir: Path) -> Path:
+    """Kopierar de valda bilderna till output_dir/images för label_annotator
+    
+    Returns:
+        Mappen med bilderna
+    """
+    images_dir = Path(output_dir) / "images"
+    images_dir.mkdir(parents=True, exist_ok=True)
+    ranking = []
+    for rank, candidate in enumerate(selected):
+        if candidate.key.startswith(STORE_PREFIX):
+            name, data = _read_stored(candidate.key)
+            if data is None:
+                continue
+            target = images_dir / f"failed_{name}"
+            target.write_bytes(data)
+        else:
+            source = Path(candidate.key)
+            target = images_dir / f"{source.parent.name}_{source.name}"
+            shutil.copy2(source, target)
+        ranking.append({'rank': rank, 'image': target.name, 'source': candidate.key,
+                        'score': round(candidate.score, 4), 'detector': candidate.detector, 'ocr': candidate.ocr})
+    (Path(output_dir) / "selection.json").write_text(json.dumps(ranking, indent=1), encoding='utf-8')
+    return images_dir
+
+def main():
+    base_dir = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description="Väljer vilka bilder som ska annoteras härnäst")
+    parser.add_argument('dirs', nargs='*', default=[str(base_dir / 'captured_images'),
+                                                    str(base_dir / 'dataset' / 'images' / 'train')],
+                        help="Mappar med bilder")
+    parser.add_argument('--store', action='append', default=None,
+                        help="ImageStore-rot med underkända valideringar (kan anges flera gånger)")
+    parser.add_argument('-n', '--count', type=int, default=100, help="Antal bilder att välja")
+    parser.add_argument('--output', default=str(base_dir / 'dataset' / 'to_label'), help="Mapp för urvalet")
+    parser.add_argument('--model', default=str(base_dir / DEFAULT_MODEL), help="Detektorns vikter")
+    parser.add_argument('--no-ocr', action='store_true', help="Hoppa över OCR-osäkerheten")
+    parser.add_argument('--workers', type=int, default=None, help="Antal processer")
+    parser.add_argument('--diversity', type=float, default=0.3, help="Vikt 0-1 för spridning")
+    args = parser.parse_args()
+    
+    stores = args.store if args.store is not None else [str(base_dir / 'data' / 'failed_validations')]
+    model = args.model if Path(args.model).exists() else None
+    if model is None:
+        print(f"Hittade inte modellen {args.model}, väljer utan detektorosäkerhet")
+    workers = args.workers or max(1, (os.cpu_count() or 2) // 2)
+    factory_args = (model, 640, max(1, (os.cpu_count() or 1) // workers), not args.no_ocr)
+    
+    selected = sample(args.dirs, args.count, stores, workers=workers, diversity=args.diversity,
+                      factory_args=factory_args)
+    images_dir = export_selection(selected, Path(args.output))
+    print(f"Öppna {images_dir} i label_annotator")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,98 +1,238 @@
+"""Förannoterar bilder med den aktuella detektorn
+
+Alla oannoterade bilder körs genom best.pt i batcher, parallellt i en
+processpool med en modell per process. Detektionerna skrivs som vanliga
+YOLO-annoteringar. Konfidenserna sparas i ett manifest bredvid
+labels-mappen (<set>_auto.json), eftersom ultralytics avvisar .txt-filer
+med en sjätte kolumn. Bilder utan detektioner eller med osäkra detektioner
+listas i <set>_review.txt för manuell granskning i label_annotator.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 import cv2
 import numpy as np
-from pathlib import Path
-import random
-import shutil
-
-def load_existing_annotations(labels_dir):
-    """Ladda existerande annoteringar för att lära sig mönster"""
-    patterns = []
-    for label_file in labels_dir.glob('*.txt'):
-        if label_file.stat().st_size > 0:  # Skippa tomma filer
-            with open(label_file, 'r') as f:
-                boxes = []
-                for line in f:
-                    class_id, x_center, y_center, width, height = map(float, line.strip().split())
-                    boxes.append({
-                        'class_id': int(class_id),
-                        'width': width,
-                        'height': height
-                    })
-                if boxes:  # Bara spara om det finns annoteringar
-                    patterns.append(boxes)
-    return patterns
-
-def auto_annotate_image(image_path, patterns, labels_dir):
-    """Automatiskt annotera en bild baserat på tidigare mönster"""
-    if not patterns:
-        return False
-        
-    # Välj ett slumpmässigt mönster att applicera
-    pattern = random.choice(patterns)
+
+# Gör projektroten importerbar när skriptet körs direkt (python tools/...)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from utils.dataset_shards import TRAINING_EXTENSIONS, label_path_for
+
+DEFAULT_MODEL = 'runs/detect/label_detection/weights/best.pt'
+
+@dataclass
+class Detection:
+    """En detektion i YOLO-format, normaliserad till bildens storlek"""
+    class_id: int
+    x: float
+    y: float
+    width: float
+    height: float
+    confidence: float
     
-    # Läs bilden för att få dimensioner
-    img = cv2.imread(str(image_path))
-    if img is None:
-        return False
+    def to_line(self) -> str:
+        return f"{self.class_id} {self.x:.6f} {self.y:.6f} {self.width:.6f} {self.height:.6f}"
+
+Predictor = Callable[[List[np.ndarray]], List[List[Detection]]]
+
+def yolo_predictor(model_path: str = DEFAULT_MODEL, imgsz: int = 640, conf: float = 0.1,
+                   threads: int = 1) -> Predictor:
+    """Laddar YOLO-modellen och ger en funktion som detekterar en hel batch åt gången
     
-    img_height, img_width = img.shape[:2]
+    Args:
+        model_path: Sökväg till vikterna
+        imgsz: Bildstorlek vid inferens
+        conf: Lägsta konfidens som tas med
+        threads: Antal torch-trådar i processen
+    """
+    import torch
+    from ultralytics import YOLO
+    torch.set_num_threads(threads)
+    model = YOLO(model_path)
     
-    # Skapa label-fil
-    label_path = labels_dir / (image_path.stem + '.txt')
+    def predict(images: List[np.ndarray]) -> List[List[Detection]]:
+        results = model.predict(images, imgsz=imgsz, conf=conf, verbose=False)
+        detections = []
+        for result in results:
+            boxes = result.boxes
+            detections.append([
+                Detection(int(c), *map(float, box), float(p))
+                for box, c, p in zip(boxes.xywhn.cpu().numpy(), boxes.cls.cpu().numpy(),
+                                     boxes.conf.cpu().numpy())
+            ])
+        return detections
+        
+    return predict
+
+def needs_review(detections: List[Detection], review_conf: float) -> bool:
+    """Bilden ska granskas om inget hittades eller någon detektion är osäker"""
+    return not detections or min(d.confidence for d in detections) < review_conf
+
+def find_unannotated(images_dir: Path) -> List[Path]:
+    """Alla bilder som saknar annotering eller har en tom annoteringsfil"""
+    unannotated = []
+    for image_path in sorted(images_dir.rglob('*')):
+        if image_path.suffix.lower() not in TRAINING_EXTENSIONS or not image_path.is_file():
+            continue
+        label_path = label_path_for(image_path)
+        if not label_path.exists() or label_path.stat().st_size == 0:
+            unannotated.append(image_path)
+    return unannotated
+
+_predictor: Optional[Predictor] = None
+
+def _init_worker(factory: Callable[..., Predictor], args: Tuple):
+    """Laddar modellen en gång per arbetsprocess"""
+    global _predictor
+    _predictor = factory(*args)
+
+def _annotate_batch(paths: Sequence[str]) -> List[Tuple[str, Optional[List[Dict]], Optional[str]]]:
+    """Detekterar en batch bilder och skriver deras annoteringar
     
-    # Applicera mönstret med lite slumpmässig variation
-    with open(label_path, 'w') as f:
-        for box in pattern:
-            # Lägg till lite slumpmässig variation i position och storlek
-            x_center = random.uniform(0.2, 0.8)
-            y_center = random.uniform(0.2, 0.8)
-            width = box['width'] * random.uniform(0.9, 1.1)  # ±10% variation
-            height = box['height'] * random.uniform(0.9, 1.1)  # ±10% variation
-            
-            # Säkerställ att boxen är inom bilden
-            width = min(width, 2 * min(x_center, 1 - x_center))
-            height = min(height, 2 * min(y_center, 1 - y_center))
-            
-            f.write(f"{box['class_id']} {x_center} {y_center} {width} {height}\n")
+    Bilder utan detektioner får ingen annoteringsfil, så de räknas
+    fortfarande som oannoterade.
     
-    return True
+    Returns:
+        (bild, detektioner, felmeddelande) per bild
+    """
+    images, readable, results = [], [], []
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            results.append((path, None, "Kunde inte läsa bilden"))
+        else:
+            images.append(image)
+            readable.append(path)
+    if not images:
+        return results
+        
+    try:
+        batch = _predictor(images)
+    except Exception as e:
+        return results + [(path, None, str(e)) for path in readable]
+        
+    for path, detections in zip(readable, batch):
+        if detections:
+            label_path = label_path_for(path)
+            label_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = label_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text('\n'.join(d.to_line() for d in detections) + '\n', encoding='utf-8')
+            os.replace(tmp, label_path)
+        results.append((path, [asdict(d) for d in detections], None))
+    return results
 
-def main():
-    # Sökvägar
-    base_dir = Path(__file__).parent.parent.parent
-    dataset_dir = base_dir / 'dataset'
-    images_dir = dataset_dir / 'images' / 'train'
-    labels_dir = dataset_dir / 'labels' / 'train'
+def _label_mtime(image_path) -> Optional[int]:
+    try:
+        return label_path_for(image_path).stat().st_mtime_ns
+    except OSError:
+        return None
+
+def _sidecar(labels_dir: Path, suffix: str) -> Path:
+    return labels_dir.with_name(labels_dir.name + suffix)
+
+def auto_annotate(images_dir: Path, model_path: str = DEFAULT_MODEL, batch: int = 8,
+                  workers: Optional[int] = None, review_conf: float = 0.5, imgsz: int = 640,
+                  conf: float = 0.1, factory: Callable[..., Predictor] = yolo_predictor,
+                  factory_args: Optional[Tuple] = None) -> Dict[str, int]:
+    """Förannoterar alla oannoterade bilder i en mapp
     
-    # Ladda existerande annoteringsmönster
-    patterns = load_existing_annotations(labels_dir)
-    if not patterns:
-        print("Inga existerande annoteringar hittades att basera på")
-        return
+    Args:
+        images_dir: Mapp med bilder, t.ex. dataset/images/train
+        model_path: Detektorns vikter
+        batch: Antal bilder per inferensanrop
+        workers: Antal processer, None för halva antalet kärnor
+        review_conf: Detektioner under denna konfidens flaggar bilden för granskning
+        imgsz: Bildstorlek vid inferens
+        conf: Lägsta konfidens för att en detektion ska skrivas
+        factory: Skapar predictor i varje arbetsprocess, måste gå att pickla
+        factory_args: Argument till factory, standard är (model_path, imgsz, conf, trådar)
         
-    # Hitta alla oannoterade bilder
-    unannotated_images = []
-    for img_path in images_dir.glob('*.jpg'):
-        label_path = labels_dir / (img_path.stem + '.txt')
-        if not label_path.exists() or label_path.stat().st_size == 0:
-            unannotated_images.append(img_path)
+    Returns:
+        Antal annoterade, flaggade och misslyckade bilder
+    """
+    images_dir = Path(images_dir)
+    labels_dir = label_path_for(images_dir / "x").parent
+    manifest_path = _sidecar(labels_dir, '_auto.json')
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        manifest = {}
+        
+    images = find_unannotated(images_dir)
+    counts = {'annotated': 0, 'review': 0, 'failed': 0}
+    print(f"{len(images)} oannoterade bilder i {images_dir}")
+    if not images:
+        return counts
+        
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    args = factory_args if factory_args is not None else (model_path, imgsz, conf, threads)
+    chunks = [[str(p) for p in images[i:i + batch]] for i in range(0, len(images), batch)]
     
-    if not unannotated_images:
-        print("Inga oannoterade bilder hittades")
-        return
+    start = time.monotonic()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(factory, args)) as pool:
+        for future in as_completed([pool.submit(_annotate_batch, chunk) for chunk in chunks]):
+            for path, detections, error in future.result():
+                done += 1
+                if detections is None:
+                    counts['failed'] += 1
+                    print(f"\nFel vid annotering av {path}: {error}")
+                    continue
+                    
+                review = needs_review([Detection(**d) for d in detections], review_conf)
+                counts['review' if review else 'annotated'] += 1
+                manifest[Path(path).relative_to(images_dir).as_posix()] = {
+                    'model': str(model_path),
+                    'classes': [d['class_id'] for d in detections],
+                    'confidences': [round(d['confidence'], 4) for d in detections],
+                    'review': review,
+                    'label_mtime': _label_mtime(path),
+                }
+                
+            rate = done / max(time.monotonic() - start, 1e-6)
+            print(f"\rFramsteg: {done}/{len(images)} {rate:.1f} bilder/s", end='', flush=True)
+    print()
     
-    # Välj slumpmässiga bilder att annotera
-    num_to_annotate = min(len(unannotated_images), 100)  # Max 100 bilder
-    selected_images = random.sample(unannotated_images, num_to_annotate)
+    labels_dir.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding='utf-8')
     
-    # Annotera bilderna
-    success_count = 0
-    for img_path in selected_images:
-        if auto_annotate_image(img_path, patterns, labels_dir):
-            success_count += 1
-            print(f"Annoterade: {img_path.name}")
+    # Osäkraste bilderna först, utom de som redan rättats för hand
+    flagged = sorted((min(entry['confidences'], default=0.0), name)
+                     for name, entry in manifest.items()
+                     if entry['review'] and _label_mtime(images_dir / name) == entry['label_mtime'])
+    _sidecar(labels_dir, '_review.txt').write_text(
+        ''.join(f"{name}\n" for _, name in flagged), encoding='utf-8')
+    return counts
+
+def main():
+    base_dir = Path(__file__).parent.parent
+    parser = argparse.ArgumentParser(description="Förannoterar bilder med den aktuella detektorn")
+    parser.add_argument('--images', default=str(base_dir / 'dataset' / 'images' / 'train'), help="Mapp med bilder")
+    parser.add_argument('--model', default=str(base_dir / DEFAULT_MODEL), help="Detektorns vikter")
+    parser.add_argument('--batch', type=int, default=8, help="Bilder per inferensanrop")
+    parser.add_argument('--workers', type=int, default=None, help="Antal processer")
+    parser.add_argument('--review-conf', type=float, default=0.5, help="Konfidens under vilken bilden granskas")
+    parser.add_argument('--conf', type=float, default=0.1, help="Lägsta konfidens för en detektion")
+    parser.add_argument('--imgsz', type=int, default=640, help="Bildstorlek vid inferens")
+    args = parser.parse_args()
     
-    print(f"\nKlar! Annoterade {success_count} av {num_to_annotate} bilder")
+    if not Path(args.model).exists():
+        print(f"Hittade inte modellen {args.model}")
+        return 1
+        
+    counts = auto_annotate(Path(args.images), args.model, args.batch, args.workers,
+                           args.review_conf, args.imgsz, args.conf)
+    print(f"\nKlar! {counts['annotated']} annoterade, {counts['review']} att granska, "
+          f"{counts['failed']} misslyckade")
+    return 1 if counts['failed'] else 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
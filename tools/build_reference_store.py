@@ -0,0 +1,49 @@
+"""Bygger referenslagret från exporterade referensbilder
+
+Körs efter export_references.py. Lagret innehåller ORB-särdrag,
+perceptuella hashar, zoner och förväntad text för varje referens och
+läses minnesmappat av inspektionen. Bygget är inkrementellt, bara nya och
+ändrade referenser räknas om.
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+# Gör projektroten importerbar när skriptet körs direkt (python tools/...)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from vision.reference_store import ReferenceStore, discover_references
+
+DEFAULT_STORE = 'data/reference_store'
+
+def build_store(references, store_dir: str = DEFAULT_STORE):
+    """Bygger eller uppdaterar lagret från en eller flera referensmappar
+    
+    Returns:
+        Antal tillagda, uppdaterade, oförändrade och borttagna referenser
+    """
+    return ReferenceStore(store_dir).build(discover_references(references))
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Bygger referenslagret från exporterade referensbilder")
+    parser.add_argument('--references', action='append', default=None,
+                        help="Mapp med referens-PNG:er (kan anges flera gånger, standard References)")
+    parser.add_argument('--store', default=DEFAULT_STORE, help="Katalog för referenslagret")
+    args = parser.parse_args()
+    
+    references = args.references or ['References']
+    missing = [r for r in references if not Path(r).is_dir()]
+    if missing:
+        print(f"Hittade inte referensmappen {', '.join(missing)}")
+        return 1
+        
+    counts = build_store(references, args.store)
+    print(f"Klar! {counts['added']} tillagda, {counts['updated']} uppdaterade, "
+          f"{counts['unchanged']} oförändrade, {counts['removed']} borttagna")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""Exporterar inspektionshistorik till kolumnformat (Parquet/Arrow IPC)
+
+Tabellerna strömmas i sidor från en skrivskyddad anslutning och skrivs
+partitionerade per dag (och kund för validation_results):
+
+    <utmapp>/<tabell>/date=2024-01-24/customer_id=Kund1/part-<databas>-<första id>-<sista id>.parquet
+
+En vattenstämpel (högsta exporterade id per tabell) sparas i
+<utmapp>/_watermarks.json så att nästa körning bara exporterar nya rader.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Gör projektroten importerbar när skriptet körs direkt (python tools/...)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from database.history import iter_history
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Tabeller som kan exporteras och deras partitionskolumner utöver datum
+TABLES = {
+    'validation_results': ('customer_id',),
+    'inspections': (),
+}
+
+FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+WATERMARK_FILE = '_watermarks.json'
+
+
+def arrow_type(declared: str):
+    """Översätt SQLite-deklarerad typ till Arrow-typ"""
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return pa.int64()
+    if 'REAL' in declared or 'FLOA' in declared or 'DOUB' in declared:
+        return pa.float64()
+    if 'BOOL' in declared:
+        return pa.bool_()
+    return pa.string()
+
+
+def table_schema(conn: sqlite3.Connection, table: str):
+    """Bygg Arrow-schema från tabellens kolumner"""
+    columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return pa.schema([(row[1], arrow_type(row[2])) for row in columns])
+
+
+def load_watermarks(out_dir: Path) -> Dict[str, int]:
+    """Läs högsta exporterade id per databas och tabell"""
+    path = out_dir / WATERMARK_FILE
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_watermarks(out_dir: Path, watermarks: Dict[str, int]):
+    """Spara vattenstämplar atomiskt"""
+    path = out_dir / WATERMARK_FILE
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, indent=4)
+    os.replace(tmp, path)
+
+
+def _partition_value(value) -> str:
+    """Gör ett värde säkert att använda i ett katalognamn"""
+    text = str(value) if value not in (None, '') else '__null__'
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in text)
+
+
+class PartitionWriters:
+    """Skrivare per partition under en exportkörning
+
+    Filerna skrivs som temporärfiler och flyttas på plats först när hela
+    körningen lyckats. Partitioner som är klara kan stängas under körningen
+    så att bara den aktuella dagens skrivare hålls öppna.
+    """
+
+    def __init__(self, out_dir: Path, table: str, schema, fmt: str, run_id: str):
+        self.out_dir = out_dir / table
+        self.schema = schema
+        self.fmt = fmt
+        self.run_id = run_id
+        self.writers = {}
+        self.files: List[Tuple[Path, Path]] = []
+
+    def write(self, partition: Tuple[str, ...], rows: List[Dict]):
+        writer = self.writers.get(partition)
+        if writer is None:
+            directory = self.out_dir.joinpath(*partition)
+            directory.mkdir(parents=True, exist_ok=True)
+            final = directory / f"part-{self.run_id}{FORMATS[self.fmt]}"
+            tmp = final.with_suffix(final.suffix + '.tmp')
+            if self.fmt == 'parquet':
+                writer = pq.ParquetWriter(str(tmp), self.schema, compression='zstd')
+            else:
+                writer = pa_ipc.new_file(str(tmp), self.schema)
+            self.writers[partition] = writer
+            self.files.append((tmp, final))
+
+        writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=self.schema))
+
+    def finish(self, partitions):
+        """Stäng skrivarna för partitioner som inte får fler rader"""
+        for partition in list(partitions):
+            writer = self.writers.pop(partition, None)
+            if writer is not None:
+                writer.close()
+
+    def close(self, commit: bool = True):
+        """Stäng skrivarna och flytta filerna på plats (eller kasta dem)"""
+        self.finish(self.writers)
+        for tmp, final in self.files:
+            if commit:
+                os.replace(tmp, final)
+            elif tmp.exists():
+                tmp.unlink()
+
+    def remove_others(self, prefix: str):
+        """Ta bort tidigare exportfiler med prefixet som inte skrevs nu"""
+        written = {final for _, final in self.files}
+        for ext in FORMATS.values():
+            for path in self.out_dir.rglob(f"part-{prefix}-*{ext}"):
+                if path not in written:
+                    path.unlink()
+
+
+def export_table(db_path: str, table: str, out_dir: Path, fmt: str = 'parquet',
+                 since_id: int = 0, page_size: int = 10000,
+                 replace: bool = False) -> Tuple[int, int]:
+    """Exportera nya rader i en tabell
+
+    Raderna läses i tidsordning, så när dagen byts skrivs buffrarna ut och
+    föregående dags filer stängs. Högst page_size rader buffras totalt.
+    Vattenstämpeln blir högsta id bland de skrivna raderna, och exporten
+    avbryts utan att något flyttas på plats om inte alla rader i
+    id-intervallet lästes.
+
+    Args:
+        db_path: Sökväg till SQLite-databasen
+        table: Tabell att exportera
+        out_dir: Rotkatalog för exporten
+        fmt: 'parquet' eller 'arrow'
+        since_id: Exportera endast rader med id större än detta
+        page_size: Antal rader per läst sida och största antal buffrade rader
+        replace: Ta bort databasens tidigare exportfiler för tabellen när
+            exporten lyckats, används vid full export
+
+    Returns:
+        (antal exporterade rader, ny vattenstämpel)
+    """
+    def connect():
+        # Skrivskyddad anslutning så att exporten aldrig låser livedatabasen
+        return sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True)
+
+    with connect() as conn:
+        schema = table_schema(conn, table)
+        max_id, expected = conn.execute(
+            f"SELECT COALESCE(MAX(id), 0), COUNT(*) FROM {table} WHERE id > ?", (since_id,)
+        ).fetchone()
+
+    if max_id <= since_id and not replace:
+        return 0, since_id
+
+    # Filnamn efter databas och id-intervall gör att körningar aldrig skriver över varandra
+    prefix = _partition_value(Path(db_path).stem)
+    run_id = f"{prefix}-{since_id + 1:012d}-{max_id:012d}"
+    writers = PartitionWriters(out_dir, table, schema, fmt, run_id)
+    partition_columns = TABLES[table]
+    # SQLite lagrar BOOLEAN som heltal
+    bool_columns = [f.name for f in schema if pa.types.is_boolean(f.type)]
+    exported = 0
+    last_id = since_id
+    buffered = 0
+    current_day = None
+    buffers: Dict[Tuple[str, ...], List[Dict]] = {}
+
+    def flush():
+        for partition, buffer in buffers.items():
+            if buffer:
+                writers.write(partition, buffer)
+        buffers.clear()
+
+    try:
+        # Övre gräns på id gör körningen till en konsistent ögonblicksbild
+        for record in iter_history(connect, table,
+                                   where=["id > ?", "id <= ?"],
+                                   params=[since_id, max_id],
+                                   page_size=page_size,
+                                   descending=False):
+            row = record.raw()
+            for col in bool_columns:
+                if row[col] is not None:
+                    row[col] = bool(row[col])
+
+            day = datetime.fromtimestamp((row['timestamp_ms'] or 0) / 1000).strftime('%Y-%m-%d')
+            if day != current_day:
+                # Föregående dag får inga fler rader
+                flush()
+                buffered = 0
+                writers.finish(writers.writers)
+                current_day = day
+
+            partition = (f"date={day}",) + tuple(
+                f"{col}={_partition_value(row[col])}" for col in partition_columns
+            )
+            buffers.setdefault(partition, []).append(row)
+            exported += 1
+            last_id = max(last_id, row['id'])
+            buffered += 1
+
+            if buffered >= page_size:
+                flush()
+                buffered = 0
+
+        flush()
+        # Vattenstämpeln får bara flyttas förbi rader som faktiskt skrivits
+        if exported != expected:
+            raise RuntimeError(f"{table}: läste {exported} av {expected} rader med id "
+                               f"{since_id + 1}..{max_id}, exporten avbryts")
+        writers.close(commit=True)
+
+    except Exception:
+        writers.close(commit=False)
+        raise
+
+    if replace:
+        writers.remove_others(prefix)
+
+    logger.info(f"Exported {exported} rows from {table} (id {since_id + 1}..{last_id})")
+    return exported, last_id
+
+
+def export_history(db_path: str, out_dir: str, tables: Optional[List[str]] = None,
+                   fmt: str = 'parquet', full: bool = False,
+                   page_size: int = 10000) -> Dict[str, int]:
+    """Exportera en eller flera tabeller inkrementellt
+
+    Med full=True exporteras allt på nytt och databasens tidigare
+    exportfiler ersätts, så att inga rader finns dubbelt.
+
+    Returns:
+        Antal exporterade rader per tabell
+    """
+    if pa is None:
+        raise ImportError("pyarrow krävs för export: pip install pyarrow")
+    if fmt not in FORMATS:
+        raise ValueError(f"Okänt format: {fmt}")
+
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    watermarks = {} if full else load_watermarks(out_path)
+
+    with sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True) as conn:
+        existing = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )}
+
+    counts = {}
+    for table in tables or list(TABLES):
+        if table not in existing:
+            continue
+        key = f"{Path(db_path).name}:{table}"
+        count, watermark = export_table(
+            db_path, table, out_path, fmt=fmt,
+            since_id=watermarks.get(key, 0), page_size=page_size, replace=full
+        )
+        watermarks[key] = watermark
+        save_watermarks(out_path, watermarks)
+        counts[table] = count
+
+    return counts
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('databases', nargs='+', help="SQLite-databaser att exportera")
+    parser.add_argument('--out', default='export', help="Utmapp")
+    parser.add_argument('--format', choices=list(FORMATS), default='parquet')
+    parser.add_argument('--table', action='append', choices=list(TABLES),
+                        help="Tabell att exportera (standard: alla)")
+    parser.add_argument('--full', action='store_true',
+                        help="Exportera allt på nytt och ersätt tidigare exportfiler")
+    parser.add_argument('--page-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    for db_path in args.databases:
+        counts = export_history(db_path, args.out, tables=args.table, fmt=args.format,
+                                full=args.full, page_size=args.page_size)
+        for table, count in counts.items():
+            print(f"{db_path}: {table}: {count} rader exporterade")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,27 @@
-import os
-import shutil
+"""Exporterar NiceLabel-etiketter (.nlbl) som PNG-referenser
+
+Exporten körs parallellt i en processpool och är inkrementell: ett
+manifest i målmappen (.export_manifest.json) håller ändringstid, storlek
+och innehållshash för varje källfil, så bara nya och ändrade etiketter
+exporteras om. PNG-filerna skrivs atomiskt.
+"""
+
+import argparse
+import hashlib
+import json
 import logging
-from src.models.nicelabel_manager import NiceLabelManager
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, Tuple
+
+MANIFEST_FILE = '.export_manifest.json'
+
+# Sparar manifestet med jämna mellanrum så att en avbruten körning kan återupptas
+SAVE_EVERY = 50
+
+_manager = None
 
 def setup_logging():
     """Konfigurerar loggning"""
@@ -15,69 +35,187 @@ def setup_logging():
     )
     return logging.getLogger(__name__)
 
-def export_labels(source_dir: str, target_dir: str, logger: logging.Logger):
-    """Exporterar alla .nlbl filer som PNG-bilder
+def read_preview(source_file: str) -> Optional[bytes]:
+    """Läser etikettens förhandsgranskning med NiceLabel, en instans per process"""
+    global _manager
+    if _manager is None:
+        from src.models.nicelabel_manager import NiceLabelManager
+        _manager = NiceLabelManager()
+    return _manager.read_label_preview(source_file)
+
+def file_digest(path: str) -> str:
+    """Innehållshash för en fil"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_atomic(path: str, data: bytes):
+    """Skriver en fil via en temporärfil så att den aldrig blir halvskriven"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def load_manifest(target_dir: str) -> Dict[str, Dict]:
+    """Läser exportmanifestet, tomt om det saknas eller är trasigt"""
+    try:
+        with open(os.path.join(target_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(target_dir: str, manifest: Dict[str, Dict]):
+    """Sparar exportmanifestet atomiskt"""
+    data = json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True).encode('utf-8')
+    write_atomic(os.path.join(target_dir, MANIFEST_FILE), data)
+
+def scan_labels(source_dir: str) -> Dict[str, Tuple[int, int]]:
+    """Hittar alla .nlbl-filer i en genomgång
+    
+    Returns:
+        Relativ sökväg -> (ändringstid i ns, storlek)
+    """
+    found = {}
+    stack = [source_dir]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.nlbl') and entry.is_file():
+                    stat = entry.stat()
+                    found[os.path.relpath(entry.path, source_dir)] = (stat.st_mtime_ns, stat.st_size)
+    return found
+
+def _export_one(source_file: str, target_file: str, known_digest: Optional[str],
+                reader: Callable) -> Tuple[str, str, Optional[str], int]:
+    """Exporterar en etikett i en arbetsprocess
+    
+    Returns:
+        (status, innehållshash, felmeddelande, skrivna byte) där status är
+        'exported', 'unchanged' eller 'failed'
+    """
+    try:
+        digest = file_digest(source_file)
+        if digest == known_digest and os.path.exists(target_file):
+            return 'unchanged', digest, None, 0
+            
+        preview = reader(source_file)
+        if not preview:
+            return 'failed', digest, "Ingen förhandsgranskning", 0
+            
+        os.makedirs(os.path.dirname(target_file), exist_ok=True)
+        write_atomic(target_file, preview)
+        return 'exported', digest, None, len(preview)
+        
+    except Exception as e:
+        return 'failed', None, str(e), 0
+
+def _target_for(target_dir: str, relative: str) -> str:
+    return os.path.join(target_dir, os.path.splitext(relative)[0] + '.png')
+
+def export_labels(source_dir: str, target_dir: str, logger: logging.Logger,
+                  workers: Optional[int] = None, force: bool = False, prune: bool = False,
+                  reader: Callable = read_preview) -> Dict[str, int]:
+    """Exporterar alla .nlbl-filer som PNG-bilder
+    
+    Filer vars ändringstid och storlek stämmer med manifestet hoppas över
+    direkt. Har de ändrats jämförs innehållshashen i arbetsprocessen, så
+    en fil som bara fått ny tidsstämpel inte exporteras om.
     
     Args:
         source_dir: Källmapp med .nlbl filer
         target_dir: Målmapp för PNG-filer
         logger: Logger för att spåra framsteg
+        workers: Antal processer, None för antal kärnor
+        force: Exportera alla filer oavsett manifest
+        prune: Ta bort PNG-filer vars källfil försvunnit
+        reader: Funktion som ger PNG-data för en .nlbl-fil, måste gå att pickla
+        
+    Returns:
+        Antal exporterade, oförändrade, misslyckade och borttagna filer
     """
-    nlm = NiceLabelManager()
+    os.makedirs(target_dir, exist_ok=True)
+    manifest = {} if force else load_manifest(target_dir)
+    sources = scan_labels(source_dir)
+    counts = {'exported': 0, 'unchanged': 0, 'failed': 0, 'removed': 0}
     
-    # Räkna totalt antal filer för framstegsindikator
-    total_files = sum(1 for root, _, files in os.walk(source_dir) 
-                     for f in files if f.endswith('.nlbl'))
-    processed_files = 0
+    pending = []
+    for relative, (mtime, size) in sorted(sources.items()):
+        entry = manifest.get(relative)
+        target_file = _target_for(target_dir, relative)
+        if entry and entry['mtime'] == mtime and entry['size'] == size and os.path.exists(target_file):
+            counts['unchanged'] += 1
+            continue
+        pending.append((relative, mtime, size, (entry or {}).get('digest')))
+        
+    for relative in set(manifest) - set(sources):
+        if prune:
+            try:
+                os.remove(_target_for(target_dir, relative))
+                counts['removed'] += 1
+            except OSError:
+                pass
+        del manifest[relative]
+        
+    logger.info(f"{len(sources)} etiketter, {len(pending)} att kontrollera")
     
-    for root, _, files in os.walk(source_dir):
-        for file in files:
-            if file.endswith('.nlbl'):
-                # Skapa samma mappstruktur i målmappen
-                rel_path = os.path.relpath(root, source_dir)
-                target_path = os.path.join(target_dir, rel_path)
-                os.makedirs(target_path, exist_ok=True)
-                
-                # Generera sökvägar
-                source_file = os.path.join(root, file)
-                target_file = os.path.join(
-                    target_path,
-                    os.path.splitext(file)[0] + '.png'
-                )
-                
-                try:
-                    # Exportera etiketten som PNG
-                    preview = nlm.read_label_preview(source_file)
-                    if preview:
-                        with open(target_file, 'wb') as f:
-                            f.write(preview)
-                        logger.info(f"Exporterade: {target_file}")
-                    else:
-                        logger.error(f"Kunde inte exportera: {source_file}")
-                except Exception as e:
-                    logger.error(f"Fel vid export av {source_file}: {str(e)}")
+    start = time.monotonic()
+    written = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_export_one, os.path.join(source_dir, relative),
+                            _target_for(target_dir, relative), digest, reader): (relative, mtime, size)
+                for relative, mtime, size, digest in pending
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                relative, mtime, size = futures[future]
+                status, digest, error, size_written = future.result()
+                counts[status] += 1
+                written += size_written
                 
+                if status == 'failed':
+                    logger.error(f"Fel vid export av {relative}: {error}")
+                    manifest.pop(relative, None)
+                else:
+                    manifest[relative] = {'mtime': mtime, 'size': size, 'digest': digest}
+                    if status == 'exported':
+                        logger.debug(f"Exporterade: {relative}")
+                        
+                if done % SAVE_EVERY == 0:
+                    save_manifest(target_dir, manifest)
+                    
                 # Uppdatera framsteg
-                processed_files += 1
-                progress = (processed_files / total_files) * 100
-                print(f"\rFramsteg: {progress:.1f}% ({processed_files}/{total_files})", 
+                elapsed = max(time.monotonic() - start, 1e-6)
+                rate = done / elapsed
+                eta = (len(pending) - done) / rate
+                print(f"\rFramsteg: {done / len(pending) * 100:.1f}% ({done}/{len(pending)}) "
+                      f"{rate:.1f} filer/s, {written / elapsed / 1e6:.1f} MB/s, kvar {eta:.0f} s",
                       end='', flush=True)
-    
-    print("\nExport klar!")
+        print()
+        
+    save_manifest(target_dir, manifest)
+    elapsed = time.monotonic() - start
+    logger.info(f"Export klar på {elapsed:.1f} s: {counts}")
+    return counts
 
 def main():
-    logger = setup_logging()
+    parser = argparse.ArgumentParser(description="Exporterar .nlbl-etiketter som PNG-referenser")
+    parser.add_argument('--source', default="Labels", help="Källmapp med .nlbl-filer")
+    parser.add_argument('--target', default="References", help="Målmapp för PNG-filer")
+    parser.add_argument('--workers', type=int, default=None, help="Antal processer")
+    parser.add_argument('--force', action='store_true', help="Exportera allt oavsett manifest")
+    parser.add_argument('--prune', action='store_true', help="Ta bort PNG-filer utan källfil")
+    args = parser.parse_args()
     
-    # Definiera sökvägar
-    label_dir = "Labels"
-    reference_dir = "References"
-    
-    # Skapa målmappen om den inte finns
-    os.makedirs(reference_dir, exist_ok=True)
-    
-    logger.info(f"Startar export från {label_dir} till {reference_dir}")
-    export_labels(label_dir, reference_dir, logger)
+    logger = setup_logging()
+    logger.info(f"Startar export från {args.source} till {args.target}")
+    counts = export_labels(args.source, args.target, logger, args.workers, args.force, args.prune)
     logger.info("Export slutförd")
+    return 1 if counts['failed'] else 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
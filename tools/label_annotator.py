@@ -1,24 +1,141 @@
-"""Verktyg för att annotera etikettbilder för YOLO-träning"""
+"""Verktyg för att annotera etikettbilder för YOLO-träning
+
+Nästa och föregående bilder avkodas och skalas om i förväg i en
+bakgrundstråd, så bläddring väntar inte på avkodning. Boxarna som redan
+finns ritas en gång till ett baslager; den aktiva boxen ritas ovanpå och
+vid musrörelse återställs bara kanterna på den förra, inte hela bilden.
+"""
 
 import cv2
 import numpy as np
 import os
+import sys
+import threading
+from collections import OrderedDict
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
+
+# Gör projektroten importerbar när skriptet körs direkt (python tools/...)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from utils.dataset_shards import label_path_for, read_yolo_labels
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Samma klasser som i dataset/data.yaml från train_yolo.py
+CLASS_NAMES = {0: 'label', 1: 'barcode', 2: 'text'}
+CLASS_COLORS = [(0, 255, 0), (0, 165, 255), (255, 0, 255), (255, 255, 0), (0, 255, 255), (128, 0, 255)]
+
+# Boxar ritas med denna linjetjocklek
+LINE_WIDTH = 2
+
+Loaded = Tuple[np.ndarray, np.ndarray, float]
+
+class ImagePrefetcher:
+    """Avkodar och skalar bilder i förväg i en bakgrundstråd
+    
+    Bilderna runt den aktuella hålls i en liten LRU-cache. get() väntar
+    bara om bilden varken finns i cachen eller håller på att laddas.
+    """
+    
+    def __init__(self, files: List[Path], load: Callable[[Path], Optional[Loaded]],
+                 radius: int = 2):
+        self.files = files
+        self.load = load
+        self.radius = radius
+        self._cache: "OrderedDict[int, Optional[Loaded]]" = OrderedDict()
+        self._wanted: List[int] = []
+        self._loading: Optional[int] = None
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="ImagePrefetcher", daemon=True)
+        self._thread.start()
+        
+    def get(self, index: int) -> Optional[Loaded]:
+        """Hämtar bild index och börjar förladda grannarna"""
+        with self._condition:
+            while self._loading == index:
+                self._condition.wait()
+            cached = index in self._cache
+            if cached:
+                self._cache.move_to_end(index)
+                result = self._cache[index]
+            else:
+                self._wanted = [i for i in self._wanted if i != index]
+        if not cached:
+            result = self.load(self.files[index])
+            self._store(index, result)
+        self.prefetch(index)
+        return result
+        
+    def prefetch(self, index: int):
+        """Köar grannarna till index, närmast först"""
+        neighbours = []
+        for distance in range(1, self.radius + 1):
+            neighbours += [index + distance, index - distance]
+        with self._condition:
+            self._wanted = [i for i in neighbours if 0 <= i < len(self.files) and i not in self._cache]
+            self._condition.notify_all()
+            
+    def stop(self):
+        """Stoppar bakgrundstråden"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join(timeout=1.0)
+        
+    def _store(self, index: int, result: Optional[Loaded]):
+        with self._condition:
+            self._cache[index] = result
+            self._cache.move_to_end(index)
+            while len(self._cache) > 2 * self.radius + 2:
+                self._cache.popitem(last=False)
+                
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._wanted and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                index = self._wanted.pop(0)
+                if index in self._cache:
+                    continue
+                self._loading = index
+            try:
+                result = self.load(self.files[index])
+            except Exception:
+                result = None
+            self._store(index, result)
+            with self._condition:
+                self._loading = None
+                self._condition.notify_all()
+
+def find_images(directory: str) -> List[Path]:
+    """Alla bilder i en mapp som kan annoteras, sorterade"""
+    return sorted(p for p in Path(directory).iterdir()
+                  if p.suffix.lower() in IMAGE_EXTENSIONS and p.is_file())
 
 class LabelAnnotator:
-    def __init__(self):
+    def __init__(self, class_names: Optional[Dict[int, str]] = None):
         self.current_image_index = 0
         self.image_files: List[Path] = []
         self.current_image: Optional[np.ndarray] = None
         self.display_image: Optional[np.ndarray] = None
         self.scale_factor = 1.0
         self.drawing = False
-        self.boxes: List[Tuple[int, int, int, int]] = []  # x1,y1,x2,y2
+        self.boxes: List[Tuple[int, int, int, int, int]] = []  # klass,x1,y1,x2,y2
         self.current_box: Optional[Tuple[int, int, int, int]] = None
+        self.current_class = 0
+        self.class_names = class_names or CLASS_NAMES
         self.window_name = "Label Annotator"
+        self.prefetcher: Optional[ImagePrefetcher] = None
+        
+        # Baslager med sparade boxar och bilden som visas
+        self.base_layer: Optional[np.ndarray] = None
+        self.frame: Optional[np.ndarray] = None
         
         # Skapa Tkinter root window
         self.root = tk.Tk()
@@ -31,16 +148,19 @@ class LabelAnnotator:
     def load_images(self, directory: str) -> bool:
         """Laddar alla bilder från en mapp"""
         try:
-            self.image_files = list(Path(directory).glob("*.jpg"))
+            self.image_files = find_images(directory)
             if not self.image_files:
                 messagebox.showerror("Fel", f"Inga bilder hittades i {directory}")
                 return False
             print(f"Hittade {len(self.image_files)} bilder")
+            if self.prefetcher is not None:
+                self.prefetcher.stop()
+            self.prefetcher = ImagePrefetcher(self.image_files, self.read_image)
             return True
         except Exception as e:
             messagebox.showerror("Fel", f"Kunde inte ladda bilder: {str(e)}")
             return False
-        
+            
     def resize_image(self, image: np.ndarray) -> Tuple[np.ndarray, float]:
         """Anpassar bildstorleken till skärmen"""
         max_width = self.screen_width - 100  # Lämna lite marginal
@@ -54,10 +174,19 @@ class LabelAnnotator:
         if scale < 1.0:
             new_width = int(width * scale)
             new_height = int(height * scale)
-            resized = cv2.resize(image, (new_width, new_height))
+            resized = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
             return resized, scale
         return image.copy(), 1.0
         
+    def read_image(self, image_path: Path) -> Optional[Loaded]:
+        """Avkodar och skalar en bild, körs även i förladdningstråden"""
+        # np.fromfile hanterar specialtecken i sökvägen
+        image = cv2.imdecode(np.fromfile(str(image_path), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        display, scale = self.resize_image(image)
+        return image, display, scale
+        
     def load_current_image(self) -> bool:
         """Laddar aktuell bild"""
         if self.current_image_index >= len(self.image_files):
@@ -65,37 +194,21 @@ class LabelAnnotator:
             
         try:
             image_path = self.image_files[self.current_image_index]
-            # Använd raw string för att hantera specialtecken
-            self.current_image = cv2.imdecode(
-                np.fromfile(str(image_path), dtype=np.uint8),
-                cv2.IMREAD_COLOR
-            )
-            if self.current_image is None:
+            loaded = self.prefetcher.get(self.current_image_index)
+            if loaded is None:
                 messagebox.showerror("Fel", f"Kunde inte ladda bild: {image_path}")
                 return False
-                
-            # Anpassa bildstorlek
-            self.display_image, self.scale_factor = self.resize_image(self.current_image)
-                
+            self.current_image, self.display_image, self.scale_factor = loaded
+            
             # Ladda eventuella existerande annoteringar
-            label_path = image_path.parent.parent / "labels" / (image_path.stem + ".txt")
+            h, w = self.current_image.shape[:2]
+            s = self.scale_factor
             self.boxes = []
-            if label_path.exists():
-                with open(label_path, 'r') as f:
-                    for line in f:
-                        class_id, x_center, y_center, width, height = map(float, line.strip().split())
-                        h, w = self.current_image.shape[:2]
-                        x1 = int((x_center - width/2) * w)
-                        y1 = int((y_center - height/2) * h)
-                        x2 = int((x_center + width/2) * w)
-                        y2 = int((y_center + height/2) * h)
-                        # Skala om koordinaterna
-                        x1 = int(x1 * self.scale_factor)
-                        y1 = int(y1 * self.scale_factor)
-                        x2 = int(x2 * self.scale_factor)
-                        y2 = int(y2 * self.scale_factor)
-                        self.boxes.append((x1, y1, x2, y2))
-                        
+            for class_id, x_center, y_center, width, height in read_yolo_labels(label_path_for(image_path)):
+                self.boxes.append((int(class_id),
+                                   int((x_center - width / 2) * w * s), int((y_center - height / 2) * h * s),
+                                   int((x_center + width / 2) * w * s), int((y_center + height / 2) * h * s)))
+                                   
             # Rita existerande boxar
             self.draw_boxes()
             return True
@@ -104,22 +217,49 @@ class LabelAnnotator:
             messagebox.showerror("Fel", f"Fel vid laddning av bild: {str(e)}")
             return False
             
+    def _color(self, class_id: int) -> Tuple[int, int, int]:
+        return CLASS_COLORS[class_id % len(CLASS_COLORS)]
+        
+    def _draw_status(self, image: np.ndarray):
+        """Visar aktiv klass och position i bildlistan"""
+        name = self.class_names.get(self.current_class, str(self.current_class))
+        text = f"{self.current_image_index + 1}/{len(self.image_files)}  klass {self.current_class}: {name}"
+        cv2.putText(image, text, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 4)
+        cv2.putText(image, text, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, self._color(self.current_class), 2)
+        
     def draw_boxes(self):
-        """Ritar alla boxar på bilden"""
+        """Ritar alla boxar till baslagret och visar bilden"""
         if self.display_image is None:
             return
             
-        img_copy = self.display_image.copy()
-        for box in self.boxes:
-            cv2.rectangle(img_copy,
-                        (box[0], box[1]),
-                        (box[2], box[3]),
-                        (0, 255, 0), 2)
-        cv2.imshow(self.window_name, img_copy)
+        self.base_layer = self.display_image.copy()
+        for class_id, x1, y1, x2, y2 in self.boxes:
+            cv2.rectangle(self.base_layer, (x1, y1), (x2, y2), self._color(class_id), LINE_WIDTH)
+            cv2.putText(self.base_layer, self.class_names.get(class_id, str(class_id)), (x1, max(12, y1 - 4)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, self._color(class_id), 1)
+        self._draw_status(self.base_layer)
+        self.frame = self.base_layer.copy()
+        cv2.imshow(self.window_name, self.frame)
         
+    def _restore_outline(self, box: Tuple[int, int, int, int]):
+        """Återställer bara kanterna av en box från baslagret"""
+        height, width = self.frame.shape[:2]
+        x1, x2 = sorted((box[0], box[2]))
+        y1, y2 = sorted((box[1], box[3]))
+        pad = LINE_WIDTH
+        left, right = max(0, x1 - pad), min(width, x2 + pad + 1)
+        top, bottom = max(0, y1 - pad), min(height, y2 + pad + 1)
+        for rows, cols in (
+            (slice(top, min(height, y1 + pad + 1)), slice(left, right)),
+            (slice(max(0, y2 - pad), bottom), slice(left, right)),
+            (slice(top, bottom), slice(left, min(width, x1 + pad + 1))),
+            (slice(top, bottom), slice(max(0, x2 - pad), right)),
+        ):
+            self.frame[rows, cols] = self.base_layer[rows, cols]
+            
     def mouse_callback(self, event, x, y, flags, param):
         """Hanterar musklick och dragning"""
-        if self.display_image is None:
+        if self.display_image is None or self.frame is None:
             return
             
         if event == cv2.EVENT_LBUTTONDOWN:
@@ -128,20 +268,14 @@ class LabelAnnotator:
             
         elif event == cv2.EVENT_MOUSEMOVE:
             if self.drawing:
-                img_copy = self.display_image.copy()
+                # Sudda den förra aktiva boxen och rita den nya ovanpå baslagret
+                self._restore_outline(self.current_box)
                 self.current_box = (self.current_box[0], self.current_box[1], x, y)
-                # Rita alla existerande boxar
-                for box in self.boxes:
-                    cv2.rectangle(img_copy,
-                                (box[0], box[1]),
-                                (box[2], box[3]),
-                                (0, 255, 0), 2)
-                # Rita den aktiva boxen
-                cv2.rectangle(img_copy,
-                            (self.current_box[0], self.current_box[1]),
-                            (self.current_box[2], self.current_box[3]),
-                            (255, 0, 0), 2)
-                cv2.imshow(self.window_name, img_copy)
+                cv2.rectangle(self.frame,
+                              (self.current_box[0], self.current_box[1]),
+                              (self.current_box[2], self.current_box[3]),
+                              self._color(self.current_class), LINE_WIDTH)
+                cv2.imshow(self.window_name, self.frame)
                 
         elif event == cv2.EVENT_LBUTTONUP:
             if self.drawing:
@@ -152,9 +286,17 @@ class LabelAnnotator:
                     x2 = max(self.current_box[0], self.current_box[2])
                     y1 = min(self.current_box[1], self.current_box[3])
                     y2 = max(self.current_box[1], self.current_box[3])
-                    self.boxes.append((x1, y1, x2, y2))
+                    if x2 > x1 and y2 > y1:
+                        self.boxes.append((self.current_class, x1, y1, x2, y2))
+                    self.current_box = None
                     self.draw_boxes()
-                
+                    
+    def set_class(self, class_id: int):
+        """Väljer klass för nya boxar"""
+        if class_id in self.class_names:
+            self.current_class = class_id
+            self.draw_boxes()
+            
     def save_annotations(self):
         """Sparar annoteringar i YOLO-format"""
         if not self.boxes or self.current_image is None:
@@ -162,16 +304,12 @@ class LabelAnnotator:
             
         try:
             # Konvertera till YOLO-format (normaliserade koordinater)
-            display_h, display_w = self.display_image.shape[:2]
             h, w = self.current_image.shape[:2]
             yolo_boxes = []
             
-            for box in self.boxes:
+            for class_id, *box in self.boxes:
                 # Konvertera tillbaka till originalbildens koordinater
-                x1 = int(box[0] / self.scale_factor)
-                y1 = int(box[1] / self.scale_factor)
-                x2 = int(box[2] / self.scale_factor)
-                y2 = int(box[3] / self.scale_factor)
+                x1, y1, x2, y2 = (v / self.scale_factor for v in box)
                 
                 # Normalisera koordinater
                 x_center = ((x1 + x2) / 2) / w
@@ -180,21 +318,21 @@ class LabelAnnotator:
                 height = abs(y2 - y1) / h
                 
                 # YOLO-format: <class> <x_center> <y_center> <width> <height>
-                yolo_boxes.append(f"0 {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}")
-            
-            # Spara till fil
+                yolo_boxes.append(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}")
+                
+            # Spara till fil, images/x.jpg -> labels/x.txt som vid träningen
             image_path = self.image_files[self.current_image_index]
-            label_path = image_path.parent.parent / "labels" / (image_path.stem + ".txt")
+            label_path = label_path_for(image_path)
             label_path.parent.mkdir(parents=True, exist_ok=True)
             
             with open(label_path, 'w') as f:
-                f.write('\n'.join(yolo_boxes))
+                f.write('\n'.join(yolo_boxes) + '\n')
                 
             print(f"Sparade annoteringar för: {image_path.name}")
             
         except Exception as e:
             messagebox.showerror("Fel", f"Kunde inte spara annoteringar: {str(e)}")
-        
+            
     def run(self):
         """Kör annoteringsverktyget"""
         try:
@@ -217,19 +355,24 @@ class LabelAnnotator:
             print("3. Tryck 's' för att spara och gå till nästa bild")
             print("4. Tryck 'b' för att gå tillbaka till föregående bild")
             print("5. Tryck 'q' för att avsluta")
-            
+            print("6. Tryck 0-9 för att välja klass: " +
+                  ", ".join(f"{i}={name}" for i, name in sorted(self.class_names.items())))
+                  
             while True:
                 if not self.load_current_image():
                     print("Inga fler bilder att annotera!")
                     break
                     
                 while True:
-                    key = cv2.waitKey(1) & 0xFF
+                    key = cv2.waitKey(20) & 0xFF
                     
                     if key == ord('q'):
                         cv2.destroyAllWindows()
                         return
                         
+                    elif ord('0') <= key <= ord('9'):
+                        self.set_class(key - ord('0'))
+                        
                     elif key == ord('r'):
                         if self.boxes:
                             self.boxes.pop()
@@ -246,12 +389,15 @@ class LabelAnnotator:
                             self.current_image_index -= 1
                             self.boxes = []
                             break
-            
+                            
             cv2.destroyAllWindows()
             
         except Exception as e:
             messagebox.showerror("Fel", f"Ett fel uppstod: {str(e)}")
             cv2.destroyAllWindows()
+        finally:
+            if self.prefetcher is not None:
+                self.prefetcher.stop()
 
 def main():
     annotator = LabelAnnotator()
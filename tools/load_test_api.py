@@ -0,0 +1,107 @@
+"""Lasttest för etikett-API:t
+
+Simulerar flera inspektionsstationer som startar samtidigt och hämtar
+kunder, etikettlistor och enskilda etiketter parallellt.
+
+    python -m tools.load_test_api --url http://localhost:5000/api --clients 32 --duration 30
+"""
+
+import argparse
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def _client(base_url: str, deadline: float, bulk: int, use_etag: bool) -> Dict:
+    """En station: hämtar katalogen och sedan etiketter i loop"""
+    session = requests.Session()
+    latencies = []
+    errors = 0
+    etags = {}
+
+    def get(path, **kwargs):
+        nonlocal errors
+        headers = {}
+        if use_etag and path in etags:
+            headers['If-None-Match'] = etags[path]
+        start = time.perf_counter()
+        try:
+            response = session.get(f"{base_url}{path}", headers=headers, timeout=10, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+                return None
+            if 'ETag' in response.headers:
+                etags[path] = response.headers['ETag']
+            return response.json() if response.status_code == 200 else None
+        except requests.exceptions.RequestException:
+            errors += 1
+            return None
+
+    customers = get("/customers") or []
+    label_ids = []
+    for customer in customers:
+        for label in get(f"/customers/{customer['id']}/labels") or []:
+            label_ids.append(label['id'])
+
+    while time.time() < deadline and label_ids:
+        if bulk > 1:
+            ids = random.sample(label_ids, min(bulk, len(label_ids)))
+            get("/labels", params={'ids': ','.join(ids)})
+        else:
+            get(f"/labels/{random.choice(label_ids)}")
+
+    session.close()
+    return {'latencies': latencies, 'errors': errors}
+
+
+def run(base_url: str, clients: int, duration: float, bulk: int = 1, use_etag: bool = True) -> Dict:
+    """Kör lasttestet och returnera sammanfattning"""
+    deadline = time.time() + duration
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: _client(base_url, deadline, bulk, use_etag), range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [l for r in results for l in r['latencies']]
+    return {
+        'requests': len(latencies),
+        'errors': sum(r['errors'] for r in results),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest för etikett-API:t")
+    parser.add_argument('--url', default='http://localhost:5000/api')
+    parser.add_argument('--clients', type=int, default=16, help="Antal samtidiga stationer")
+    parser.add_argument('--duration', type=float, default=10.0, help="Sekunder")
+    parser.add_argument('--bulk', type=int, default=1, help="Etiketter per anrop (1 = enskilda anrop)")
+    parser.add_argument('--no-etag', action='store_true', help="Skicka inte If-None-Match")
+    args = parser.parse_args()
+
+    summary = run(args.url, args.clients, args.duration, args.bulk, not args.no_etag)
+    print(f"Förfrågningar: {summary['requests']}  Fel: {summary['errors']}")
+    print(f"Genomströmning: {summary['throughput']:.1f} req/s")
+    print(f"Latens ms: medel {summary['mean_ms']:.1f}  p50 {summary['p50_ms']:.1f}  "
+          f"p95 {summary['p95_ms']:.1f}  p99 {summary['p99_ms']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,10 @@
 """Träna en YOLO-modell för textdetektering"""
 
+import argparse
 import logging
 from pathlib import Path
 from ultralytics import YOLO
+from utils.packed_yolo import PackedDetectionTrainer, packed_data_yaml
 
 # Konfigurera logging
 logging.basicConfig(
@@ -11,7 +13,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def train_model():
+def train_model(packed: bool = True):
+    """Tränar textdetektorn, från minnesmappade shards om packed är satt"""
     try:
         # Sökvägar
         data_yaml = Path(r"c:\Users\tarek.ziyad\Downloads\WordsDetector_V1.v1i.yolov11\data.yaml")
@@ -22,6 +25,12 @@ def train_model():
         if not data_yaml.exists():
             raise FileNotFoundError(f"Kunde inte hitta {data_yaml}")
             
+        # Packa bilder och annoteringar, byggs bara om när datasetet ändrats
+        extra = {}
+        if packed:
+            data_yaml = packed_data_yaml(data_yaml, imgsz=640, output_dir=output_dir / "shards")
+            extra['trainer'] = PackedDetectionTrainer
+            
         # Ladda en liten modell för snabbare träning
         model = YOLO('yolov8n.pt')
         
@@ -59,6 +68,7 @@ def train_model():
             box=7.5,  # Box loss gain
             cls=0.5,  # Cls loss gain (lägre eftersom vi bara har en klass)
             dfl=1.5,  # DFL loss gain
+            **extra
         )
         
         # Spara den tränade modellen
@@ -70,4 +80,6 @@ def train_model():
         raise
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Tränar en YOLO-modell för textdetektering")
+    parser.add_argument('--unpacked', action='store_true', help="Läs enskilda bildfiler i stället för shards")
+    train_model(packed=not parser.parse_args().unpacked)
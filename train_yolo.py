@@ -1,10 +1,14 @@
 """Script för att träna YOLO-modellen på etikettdata"""
 
+import argparse
 import os
 import cv2
 import yaml
 from ultralytics import YOLO
 from pathlib import Path
+from utils.packed_yolo import PackedDetectionTrainer, packed_data_yaml
+
+IMGSZ = 640
 
 def create_dataset_structure():
     """Skapar mappar för dataset"""
@@ -42,23 +46,35 @@ def prepare_training():
     # 3. Konvertera annoteringar till YOLO-format
     # 4. Dela upp i tränings- och valideringsset
     
-def train_model():
-    """Tränar YOLO-modellen"""
+def train_model(packed: bool = True):
+    """Tränar YOLO-modellen
+    
+    Args:
+        packed: Träna från minnesmappade shards i stället för enskilda bildfiler
+    """
     print("Startar träning...")
     
     # Ladda en förtränad modell
     model = YOLO('yolov8n.pt')
     
+    # Packa bilder och annoteringar, byggs bara om när datasetet ändrats
+    data = 'dataset/data.yaml'
+    extra = {}
+    if packed:
+        data = str(packed_data_yaml(data, imgsz=IMGSZ))
+        extra['trainer'] = PackedDetectionTrainer
+        
     # Träna modellen
     results = model.train(
-        data='dataset/data.yaml',
+        data=data,
         epochs=100,
-        imgsz=640,
+        imgsz=IMGSZ,
         batch=16,
         name='label_detection',
         patience=20,
         save=True,
-        device='cpu'  # Ändra till 'cuda' om GPU finns
+        device='cpu',  # Ändra till 'cuda' om GPU finns
+        **extra
     )
     
     print("Träning slutförd!")
@@ -66,8 +82,12 @@ def train_model():
     
 def main():
     """Huvudfunktion"""
+    parser = argparse.ArgumentParser(description="Tränar YOLO-modellen på etikettdata")
+    parser.add_argument('--unpacked', action='store_true', help="Läs enskilda bildfiler i stället för shards")
+    args = parser.parse_args()
+    
     prepare_training()
-    train_model()
+    train_model(packed=not args.unpacked)
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,268 @@
+"""Packade dataset-shards
+
+En shard är en enda stor datafil där posterna ligger efter varandra, plus
+ett JSON-index (<shard>.index.json) med namn, offset och längd för varje
+post. Det ersätter tusentals små filer med en fil som kan läsas
+sekventiellt eller minnesmappas. Posterna läggs på 64-bytegränser så att
+de kan visas direkt som numpy-arrayer.
+
+Träningsshards (pack_training_split) innehåller bilder förskalade till
+imgsz och deras YOLO-annoteringar, och läses minnesmappat med
+PackedDataset.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import cv2
+import numpy as np
+
+ALIGNMENT = 64
+INDEX_SUFFIX = '.index.json'
+FORMAT_VERSION = 1
+
+def index_path(path: Union[str, Path]) -> Path:
+    """Sökväg till indexet för en shard"""
+    path = Path(path)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+class ShardWriter:
+    """Skriver poster till en shard
+    
+    Allt skrivs till temporärfiler som ersätter den gamla sharden först
+    vid close(), så en läsare ser aldrig en halvskriven shard.
+    """
+    
+    def __init__(self, path: Union[str, Path], meta: Optional[Dict] = None):
+        self.path = Path(path)
+        self.meta = dict(meta or {})
+        self.records: List[Dict] = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        self._file = open(self._tmp, 'wb')
+        self._offset = 0
+        
+    def add(self, name: str, data: Union[bytes, memoryview, np.ndarray], **info):
+        """Lägger till en post
+        
+        Args:
+            name: Postens unika namn
+            data: Postens innehåll
+            info: Extra fält som sparas i indexet
+        """
+        if isinstance(data, np.ndarray):
+            data = np.ascontiguousarray(data).data
+        padding = -self._offset % ALIGNMENT
+        if padding:
+            self._file.write(b'\0' * padding)
+            self._offset += padding
+        length = self._file.write(data)
+        self.records.append({'name': name, 'offset': self._offset, 'length': length, **info})
+        self._offset += length
+        
+    def close(self):
+        """Avslutar sharden och ersätter en eventuell tidigare version"""
+        if self._file.closed:
+            return
+        self._file.close()
+        os.replace(self._tmp, self.path)
+        index = {'version': FORMAT_VERSION, 'meta': self.meta, 'records': self.records}
+        tmp = index_path(self.path).with_suffix('.tmp')
+        tmp.write_text(json.dumps(index, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, index_path(self.path))
+        
+    def discard(self):
+        """Avbryter skrivningen och lämnar den gamla sharden orörd"""
+        if not self._file.closed:
+            self._file.close()
+        self._tmp.unlink(missing_ok=True)
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+class ShardReader:
+    """Läser en shard minnesmappad"""
+    
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        index = json.loads(index_path(self.path).read_text(encoding='utf-8'))
+        if index.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Okänd shardversion i {self.path}: {index.get('version')}")
+        self.meta: Dict = index.get('meta', {})
+        self.records: List[Dict] = index['records']
+        self._names = {record['name']: i for i, record in enumerate(self.records)}
+        self._data = (np.memmap(self.path, dtype=np.uint8, mode='r')
+                      if self.path.stat().st_size else np.empty(0, np.uint8))
+                      
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        """Finns både shard och index"""
+        return Path(path).is_file() and index_path(path).is_file()
+        
+    def __len__(self) -> int:
+        return len(self.records)
+        
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+        
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.records)
+        
+    def find(self, name: str) -> Optional[int]:
+        """Postens position, None om den saknas"""
+        return self._names.get(name)
+        
+    def raw(self, item: Union[int, str]) -> np.ndarray:
+        """Postens byte som en vy in i den minnesmappade filen"""
+        record = self.records[self._names[item] if isinstance(item, str) else item]
+        return self._data[record['offset']:record['offset'] + record['length']]
+        
+    def close(self):
+        """Släpper minnesmappningen, krävs innan filen kan ersättas på Windows
+        
+        Mappningen stängs när sista vyn från raw() försvinner.
+        """
+        self._data = np.empty(0, np.uint8)
+
+TRAINING_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+def label_path_for(image_path: Union[str, Path]) -> Path:
+    """YOLO-konventionen: .../images/x.jpg har annoteringen .../labels/x.txt"""
+    parts = list(Path(image_path).parts)
+    if 'images' in parts:
+        index = len(parts) - 1 - parts[::-1].index('images')
+        parts[index] = 'labels'
+    return Path(*parts).with_suffix('.txt')
+
+def read_yolo_labels(path: Union[str, Path]) -> np.ndarray:
+    """Läser en YOLO-annotering som (n, 5) float32 med klass, x, y, b, h
+    
+    Segmentrader (klass följd av polygonpunkter) görs om till sin omskrivna
+    box och en sjätte kolumn med konfidens ignoreras. Saknas filen finns
+    inga objekt i bilden.
+    """
+    rows = []
+    try:
+        text = Path(path).read_text(encoding='utf-8')
+    except OSError:
+        return np.zeros((0, 5), np.float32)
+    for line in text.splitlines():
+        values = [float(v) for v in line.split()]
+        if len(values) in (5, 6):
+            rows.append(values[:5])
+        elif len(values) > 6:
+            points = np.array(values[1:1 + (len(values) - 1) // 2 * 2]).reshape(-1, 2)
+            (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+            rows.append([values[0], (x0 + x1) / 2, (y0 + y1) / 2, x1 - x0, y1 - y0])
+    return np.array(rows, np.float32).reshape(-1, 5)
+
+def _training_sources(images_dir: Path) -> List[Path]:
+    return sorted(p for p in images_dir.rglob('*') if p.suffix.lower() in TRAINING_EXTENSIONS and p.is_file())
+
+def _source_signature(images: List[Path]) -> str:
+    """Hash av namn, ändringstid och storlek för bilder och annoteringar"""
+    digest = hashlib.blake2b(digest_size=16)
+    for image in images:
+        for path in (image, label_path_for(image)):
+            try:
+                stat = path.stat()
+                digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}\n".encode('utf-8'))
+            except OSError:
+                digest.update(f"{path}:-\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def _load_resized(path: str, imgsz: int) -> Tuple[Optional[np.ndarray], Tuple[int, int]]:
+    """Avkodar en bild och skalar längsta sidan till imgsz, körs i en arbetsprocess"""
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None, (0, 0)
+    h0, w0 = img.shape[:2]
+    scale = imgsz / max(h0, w0)
+    if scale != 1:
+        size = (min(imgsz, max(1, round(w0 * scale))), min(imgsz, max(1, round(h0 * scale))))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    return img, (h0, w0)
+
+def pack_training_split(images_dir: Union[str, Path], shard_path: Union[str, Path], imgsz: int = 640,
+                        workers: Optional[int] = None, force: bool = False) -> bool:
+    """Packar ett YOLO-set (bilder och annoteringar) till en träningsshard
+    
+    Bilderna avkodas och skalas till imgsz en gång, parallellt, och lagras
+    okomprimerade så att träningen bara behöver kopiera pixlar ur
+    sidcachen. Annoteringarna lagras i indexet. Sharden byggs bara om när
+    någon bild eller annotering ändrats.
+    
+    Args:
+        images_dir: Mapp med bilder, annoteringarna hittas enligt label_path_for
+        shard_path: Sharden som skrivs
+        imgsz: Längsta sida efter omskalning, samma som vid träningen
+        workers: Antal processer, None för antal kärnor
+        force: Bygg om även om inget ändrats
+        
+    Returns:
+        True om sharden byggdes om
+    """
+    images_dir = Path(images_dir)
+    images = _training_sources(images_dir)
+    signature = _source_signature(images)
+    if not force and ShardReader.exists(shard_path):
+        try:
+            meta = ShardReader(shard_path).meta
+            if meta.get('signature') == signature and meta.get('imgsz') == imgsz:
+                return False
+        except (OSError, ValueError, KeyError):
+            pass
+            
+    meta = {'imgsz': imgsz, 'signature': signature, 'source': str(images_dir)}
+    with ShardWriter(shard_path, meta) as writer, ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_load_resized, [str(p) for p in images], [imgsz] * len(images), chunksize=8)
+        for image, (img, original) in zip(images, results):
+            if img is None:
+                continue
+            writer.add(image.relative_to(images_dir).as_posix(), img,
+                       shape=list(img.shape), original=list(original),
+                       labels=read_yolo_labels(label_path_for(image)).tolist())
+    return True
+
+class PackedDataset:
+    """Minnesmappad läsare för träningsshards från pack_training_split
+    
+    Bilderna returneras som vyer in i sharden utan avkodning; kopiera dem
+    innan de ändras på plats.
+    """
+    
+    def __init__(self, path: Union[str, Path]):
+        self.shard = ShardReader(path)
+        self.imgsz: int = self.shard.meta.get('imgsz', 0)
+        self._labels = [np.array(record['labels'], np.float32).reshape(-1, 5) for record in self.shard]
+        
+    def __len__(self) -> int:
+        return len(self.shard)
+        
+    @property
+    def names(self) -> List[str]:
+        return [record['name'] for record in self.shard]
+        
+    def image(self, i: int) -> np.ndarray:
+        """Bild i som (höjd, bredd, 3) uint8"""
+        return self.shard.raw(i).reshape(self.shard.records[i]['shape'])
+        
+    def labels(self, i: int) -> np.ndarray:
+        """Annoteringar för bild i som (n, 5) med klass, x, y, b, h normaliserat"""
+        return self._labels[i]
+        
+    def original_shape(self, i: int) -> Tuple[int, int]:
+        """Bildens (höjd, bredd) innan omskalning"""
+        return tuple(self.shard.records[i]['original'])
+        
+    def __getitem__(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.image(i), self.labels(i)
@@ -0,0 +1,135 @@
+"""Träning av YOLO från packade shards
+
+packed_data_yaml() packar train/val-seten i en data.yaml till
+träningsshards och skriver en ny data.yaml som pekar på dem.
+PackedDetectionTrainer läser sedan bilder och annoteringar minnesmappat ur
+sharden i stället för att öppna och avkoda tusentals små filer per epok:
+
+    data = packed_data_yaml('dataset/data.yaml', imgsz=640)
+    model.train(data=str(data), imgsz=640, trainer=PackedDetectionTrainer)
+"""
+
+import logging
+from pathlib import Path
+from typing import Optional, Union
+import cv2
+import numpy as np
+import yaml
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils.torch_utils import de_parallel
+from utils.dataset_shards import PackedDataset, pack_training_split
+
+logger = logging.getLogger(__name__)
+
+SHARD_SPLITS = ('train', 'val')
+
+def _resolve_split(base: Path, entry: str) -> Path:
+    """Sökväg till ett set i data.yaml, med samma reservregel som ultralytics för '../'"""
+    path = Path(entry)
+    if not path.is_absolute():
+        path = (base / path).resolve()
+        if not path.exists() and entry.startswith('../'):
+            path = (base / entry[3:]).resolve()
+    return path
+
+def packed_data_yaml(data_yaml: Union[str, Path], imgsz: int = 640, output_dir: Optional[Union[str, Path]] = None,
+                     workers: Optional[int] = None) -> Path:
+    """Packar train/val i data.yaml och skriver en data.yaml för sharden
+    
+    Args:
+        data_yaml: Ursprunglig data.yaml med mappar för bilder
+        imgsz: Bildstorlek vid träningen
+        output_dir: Mapp för shards, standard är shards/ bredvid data.yaml
+        workers: Antal processer vid packning
+        
+    Returns:
+        Sökväg till den nya data.yaml
+    """
+    data_yaml = Path(data_yaml)
+    data = yaml.safe_load(data_yaml.read_text(encoding='utf-8'))
+    base = Path(data.get('path') or data_yaml.parent)
+    if not base.is_absolute() and not base.exists():
+        base = data_yaml.parent / base
+    output_dir = Path(output_dir) if output_dir else data_yaml.parent / "shards"
+    
+    packed = {key: value for key, value in data.items() if key not in ('path', 'test', *SHARD_SPLITS)}
+    packed['path'] = str(output_dir.resolve())
+    for split in SHARD_SPLITS:
+        images_dir = _resolve_split(base, data[split])
+        shard = output_dir / f"{split}.{imgsz}.shard"
+        if pack_training_split(images_dir, shard, imgsz, workers):
+            logger.info(f"Packade {images_dir} till {shard}")
+        else:
+            logger.info(f"{shard} är aktuell")
+        packed[split] = shard.name
+        
+    target = output_dir / f"data.{imgsz}.yaml"
+    target.write_text(yaml.safe_dump(packed, allow_unicode=True), encoding='utf-8')
+    return target
+
+class PackedYOLODataset(YOLODataset):
+    """YOLODataset som läser bilder och annoteringar ur en träningsshard"""
+    
+    def get_img_files(self, img_path):
+        self.packed = PackedDataset(img_path)
+        if self.packed.imgsz != self.imgsz:
+            logger.warning(f"Sharden {img_path} är packad för imgsz {self.packed.imgsz}, träningen använder {self.imgsz}")
+        im_files = [str(Path(img_path) / name) for name in self.packed.names]
+        # set_rectangle sorterar om im_files och labels, posten i sharden slås därför upp via filnamnet
+        self.records = {im_file: i for i, im_file in enumerate(im_files)}
+        return im_files
+        
+    def get_labels(self):
+        labels = []
+        for im_file in self.im_files:
+            record = self.records[im_file]
+            boxes = self.packed.labels(record)
+            labels.append({
+                'im_file': im_file,
+                'shape': self.packed.original_shape(record),
+                'cls': boxes[:, 0:1].copy(),
+                'bboxes': boxes[:, 1:].copy(),
+                'segments': [],
+                'keypoints': None,
+                'normalized': True,
+                'bbox_format': 'xywh',
+            })
+        return labels
+        
+    def load_image(self, i, rect_mode=True):
+        # Kopian görs ur sidcachen, ingen avkodning eller omskalning behövs
+        record = self.records[self.im_files[i]]
+        im = np.array(self.packed.image(record))
+        if not rect_mode and im.shape[:2] != (self.imgsz, self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+            
+        # Mosaic väljer grannbilder ur bufferten
+        if self.augment:
+            self.buffer.append(i)
+            if len(self.buffer) > self.max_buffer_length:
+                self.buffer.pop(0)
+        return im, self.packed.original_shape(record), im.shape[:2]
+
+class PackedDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer som bygger train/val från träningsshards"""
+    
+    def build_dataset(self, img_path, mode="train", batch=None):
+        stride = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        return PackedYOLODataset(
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=self.args,
+            rect=self.args.rect or mode == "val",
+            cache=False,
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=f"{mode}: ",
+            task=self.args.task,
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction if mode == "train" else 1.0,
+        )
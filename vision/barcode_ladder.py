@@ -0,0 +1,164 @@
+"""Stege av avkodningsförsök för streckkoder med inlärd ordning"""
+
+import cv2
+import numpy as np
+import logging
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Avkodat resultat med punkter i indatabildens koordinater
+Point = namedtuple('Point', 'x y')
+Rect = namedtuple('Rect', 'left top width height')
+Decoded = namedtuple('Decoded', 'data type rect polygon variant')
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def _raw(gray):
+    return gray, 1.0, 0
+
+def _otsu(gray):
+    _, binary = cv2.threshold(cv2.GaussianBlur(gray, (3, 3), 0), 0, 255,
+                              cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary, 1.0, 0
+
+def _adaptive(gray):
+    binary = cv2.adaptiveThreshold(cv2.GaussianBlur(gray, (5, 5), 0), 255,
+                                   cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    return cv2.morphologyEx(binary, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8)), 1.0, 0
+
+def _upscaled(gray):
+    return cv2.resize(gray, None, fx=2.0, fy=2.0, interpolation=cv2.INTER_CUBIC), 2.0, 0
+
+def _sharpened(gray):
+    blurred = cv2.GaussianBlur(gray, (0, 0), 2.0)
+    return cv2.addWeighted(gray, 1.8, blurred, -0.8, 0), 1.0, 0
+
+def _rotated(gray):
+    return cv2.rotate(gray, cv2.ROTATE_90_CLOCKWISE), 1.0, 90
+
+# Varianter i standardordning: (namn, funktion som ger (bild, skala, rotation))
+VARIANTS = [
+    ('raw', _raw),
+    ('otsu', _otsu),
+    ('adaptive', _adaptive),
+    ('upscaled', _upscaled),
+    ('sharpened', _sharpened),
+    ('rotated', _rotated),
+]
+
+class DecodeLadder:
+    """Provar förbehandlingar i tur och ordning tills en streckkod avkodas
+    
+    Varje etikettyp får en egen ordning som lärs in: den variant som
+    oftast lyckas provas först. Billiga varianter står först från början,
+    och en tidsbudget per bild gör att dyra varianter hoppas över när
+    bilden ändå inte går att läsa.
+    """
+    
+    def __init__(self, decode: Callable, budget_ms: float = 30.0,
+                 variants: Optional[List[Tuple[str, Callable]]] = None):
+        """Initierar stegen
+        
+        Args:
+            decode: Avkodare som tar en gråskalebild, t.ex. pyzbar.decode
+            budget_ms: Standardbudget per bild i millisekunder
+            variants: Egna varianter, None för VARIANTS
+        """
+        self.decode = decode
+        self.budget_ms = budget_ms
+        self.variants = list(variants or VARIANTS)
+        self._functions = dict(self.variants)
+        # etikettyp -> variant -> [lyckade, försök]
+        self._stats: Dict[str, Dict[str, List[int]]] = {}
+        self._lock = threading.Lock()
+        
+    def order(self, label_type: Optional[str] = None) -> List[str]:
+        """Varianternas ordning för en etikettyp, mest framgångsrik först"""
+        default = [name for name, _ in self.variants]
+        with self._lock:
+            stats = dict(self._stats.get(label_type or '', {}))
+        if not stats:
+            return default
+            
+        def rate(name):
+            successes, attempts = stats.get(name, (0, 0))
+            # Laplace-utjämning så att oprövade varianter inte hamnar sist
+            return (successes + 1.0) / (attempts + 2.0)
+            
+        return sorted(default, key=lambda name: (-rate(name), default.index(name)))
+        
+    def record(self, label_type: Optional[str], variant: str, success: bool):
+        """Registrera utfallet av ett försök"""
+        with self._lock:
+            counts = self._stats.setdefault(label_type or '', {}).setdefault(variant, [0, 0])
+            counts[1] += 1
+            if success:
+                counts[0] += 1
+                
+    def stats(self) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        """Lyckade och totala försök per etikettyp och variant"""
+        with self._lock:
+            return {
+                label_type: {name: tuple(counts) for name, counts in variants.items()}
+                for label_type, variants in self._stats.items()
+            }
+            
+    def load_stats(self, stats: Dict[str, Dict[str, Tuple[int, int]]]):
+        """Återställ sparad statistik, t.ex. från föregående skift"""
+        with self._lock:
+            self._stats = {
+                label_type: {name: list(counts) for name, counts in variants.items() if name in self._functions}
+                for label_type, variants in stats.items()
+            }
+            
+    def __call__(self, image: np.ndarray, label_type: Optional[str] = None,
+                 deadline: Optional[float] = None) -> List[Decoded]:
+        """Avkoda en bild med stegen
+        
+        Args:
+            image: BGR- eller gråskalebild, gärna ett lokaliserat utsnitt
+            label_type: Etikettyp som ordningen lärs in per
+            deadline: time.perf_counter()-tid då försöken avbryts, None för budget_ms
+            
+        Returns:
+            Avkodade streckkoder med punkter i indatabildens koordinater
+        """
+        if deadline is None:
+            deadline = time.perf_counter() + self.budget_ms / 1000.0
+        gray = _gray(image)
+        height = gray.shape[0]
+        
+        for name in self.order(label_type):
+            if time.perf_counter() >= deadline:
+                break
+            variant, scale, rotation = self._functions[name](gray)
+            found = self.decode(variant)
+            self.record(label_type, name, bool(found))
+            if found:
+                return [self._to_input(barcode, name, scale, rotation, height) for barcode in found]
+                
+        return []
+        
+    @staticmethod
+    def _to_input(barcode, variant: str, scale: float, rotation: int, height: int) -> Decoded:
+        """Översätt ett resultat från en variant till indatabildens koordinater"""
+        points = []
+        for p in barcode.polygon:
+            x, y = p.x / scale, p.y / scale
+            if rotation == 90:
+                # Medurs rotation: (x, y) -> (h - 1 - y, x)
+                x, y = y, height - 1 - x
+            points.append(Point(int(round(x)), int(round(y))))
+            
+        if points:
+            xs = [p.x for p in points]
+            ys = [p.y for p in points]
+            rect = Rect(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+        else:
+            rect = Rect(*barcode.rect)
+        return Decoded(barcode.data, barcode.type, rect, points, variant)
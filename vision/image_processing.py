@@ -6,6 +6,9 @@ import logging
 from typing import Optional, Tuple, List
 import pytesseract
 from PIL import Image
+from pyzbar import pyzbar
+from vision.barcode_localizer import BarcodeLocalizer, decode_localized
+from vision.rectification import LabelRectifier
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +18,8 @@ class ImageProcessor:
     def __init__(self):
         self.last_error = None
         self.debug_mode = False
+        self.barcode_localizer = BarcodeLocalizer()
+        self.rectifier = LabelRectifier()
         
     def preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """Förbehandla bild för bättre OCR-resultat"""
@@ -98,8 +103,17 @@ class ImageProcessor:
             return ""
             
     def detect_barcode(self, image: np.ndarray) -> Optional[str]:
-        """Detektera och avkoda streckkod"""
+        """Detektera och avkoda streckkod
+        
+        Streckkoden lokaliseras först och bara ett upprätt utsnitt avkodas.
+        Ger det inget provas en Otsu-trösklad version av hela bilden.
+        """
         try:
+            found = decode_localized(image, pyzbar.decode, self.barcode_localizer,
+                                     fallback_full_image=False)
+            if found:
+                return found[0]['data']
+                
             # Förbehandla bild
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             
@@ -114,9 +128,10 @@ class ImageProcessor:
                 cv2.THRESH_BINARY + cv2.THRESH_OTSU
             )
             
-            # Hitta och avkoda streckkod med zbar
-            # Implementera streckkodssökning här
-            
+            barcodes = pyzbar.decode(binary)
+            if barcodes:
+                return barcodes[0].data.decode('utf-8')
+                
             return None
             
         except Exception as e:
@@ -165,61 +180,26 @@ class ImageProcessor:
             logger.error(f"Error analyzing image quality: {str(e)}")
             return {}
             
-    def correct_perspective(self, image: np.ndarray) -> np.ndarray:
-        """Korrigera perspektiv"""
+    def correct_perspective(self, image: np.ndarray, box: Optional[Tuple[int, int, int, int]] = None,
+                            label_type: str = "", track_id=None) -> np.ndarray:
+        """Korrigera perspektiv
+        
+        Hörnen tas från detektorns ruta och förfinas med konturen runt den,
+        och bara etiketten räknas om till en fast storlek per etikettyp.
+        Transformen återanvänds så länge spåret står still.
+        
+        Args:
+            image: Kamerabild
+            box: Etikettens ruta (x1, y1, x2, y2), None för att söka i hela bilden
+            label_type: Etikettyp, avgör utdatastorleken
+            track_id: Id för den spårade etiketten
+            
+        Returns:
+            Upprätad etikett, eller originalbilden om ingen etikett hittades
+        """
         try:
-            # Hitta kanter och konturer
-            edges, contours = self.detect_edges(image)
-            
-            if not contours:
-                return image
-                
-            # Hitta största konturen
-            largest_contour = contours[0]
-            
-            # Approximera polygon
-            epsilon = 0.02 * cv2.arcLength(largest_contour, True)
-            approx = cv2.approxPolyDP(largest_contour, epsilon, True)
-            
-            if len(approx) == 4:
-                # Sortera hörn
-                pts = np.float32(approx.reshape(4, 2))
-                rect = np.zeros((4, 2), dtype=np.float32)
-                
-                s = pts.sum(axis=1)
-                rect[0] = pts[np.argmin(s)]  # Övre vänstra
-                rect[2] = pts[np.argmax(s)]  # Nedre högra
-                
-                diff = np.diff(pts, axis=1)
-                rect[1] = pts[np.argmin(diff)]  # Övre högra
-                rect[3] = pts[np.argmax(diff)]  # Nedre vänstra
-                
-                # Beräkna ny bredd och höjd
-                width = int(max(
-                    np.linalg.norm(rect[0] - rect[1]),
-                    np.linalg.norm(rect[2] - rect[3])
-                ))
-                height = int(max(
-                    np.linalg.norm(rect[0] - rect[3]),
-                    np.linalg.norm(rect[1] - rect[2])
-                ))
-                
-                dst = np.array([
-                    [0, 0],
-                    [width-1, 0],
-                    [width-1, height-1],
-                    [0, height-1]
-                ], dtype=np.float32)
-                
-                # Beräkna transformationsmatris
-                matrix = cv2.getPerspectiveTransform(rect, dst)
-                
-                # Applicera transformation
-                warped = cv2.warpPerspective(image, matrix, (width, height))
-                
-                return warped
-                
-            return image
+            warped = self.rectifier.warp(image, box, label_type, track_id)
+            return warped if warped is not None else image
             
         except Exception as e:
             self.last_error = str(e)
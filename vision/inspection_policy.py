@@ -0,0 +1,101 @@
+"""Beslutsregler för inspektion: streckkod först, OCR vid behov"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from vision.text_similarity import text_similarity
+
+# Datum som kräver textkontroll, t.ex. "Bäst före: 2024-12-31"
+_DATE_RE = re.compile(r'\b\d{4}-\d{2}-\d{2}\b|\b\d{2}[./]\d{2}[./]\d{2,4}\b')
+
+# GS1 Application Identifier (01) följt av GTIN-14, med eller utan parentes
+_GS1_GTIN_RE = re.compile(r'^(?:\]C1|\]d2|\]Q3)?\(?01\)?(\d{14})')
+
+def contains_date(text: str) -> bool:
+    """Innehåller texten ett datum"""
+    return bool(_DATE_RE.search(text or ''))
+
+def gtin_is_valid(code: str) -> bool:
+    """Kontrollera kontrollsiffran i en GTIN-8/12/13/14"""
+    if not code.isdigit() or len(code) not in (8, 12, 13, 14):
+        return False
+    digits = [int(c) for c in code]
+    total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits[:-1])))
+    return (10 - total % 10) % 10 == digits[-1]
+
+def normalize_gtin(data: str) -> Optional[str]:
+    """Plocka ut GTIN ur en avläst streckkod och normalisera till 14 siffror
+    
+    Klarar EAN-8, UPC-A, EAN-13, ITF-14 och GS1-128/DataMatrix med AI (01).
+    
+    Returns:
+        GTIN-14, eller None om datan inte innehåller ett giltigt GTIN
+    """
+    data = (data or '').strip()
+    match = _GS1_GTIN_RE.match(data)
+    code = match.group(1) if match else data
+    if not gtin_is_valid(code):
+        return None
+    return code.zfill(14)
+
+@dataclass
+class BarcodeDecision:
+    """Vad streckkoden ensam säger om en etikett"""
+    readable: bool = False
+    matches: Optional[bool] = None
+    needs_ocr: bool = True
+    gtin: str = ""
+    reason: str = ""
+
+class InspectionPolicy:
+    """Bestämmer när streckkoden räcker och när OCR måste köras
+    
+    En avläst streckkod med giltig kontrollsiffra som stämmer mot
+    referensen godkänner etiketten direkt, och en som inte stämmer
+    underkänner den direkt. OCR körs bara om streckkoden saknas eller är
+    oläslig, om referensen saknar streckkod, eller om referensen kräver
+    textkontroll (t.ex. bäst före-datum).
+    """
+    
+    def __init__(self, check_dates: bool = True, text_threshold: float = 0.8):
+        """Initiera policyn
+        
+        Args:
+            check_dates: Kräv OCR när referenstexten innehåller datum
+            text_threshold: Lägsta textlikhet mot referensen för godkänt
+        """
+        self.check_dates = check_dates
+        self.text_threshold = text_threshold
+        
+    def requires_text(self, reference: Optional[Dict]) -> bool:
+        """Kräver referensen att texten kontrolleras även när streckkoden stämmer"""
+        if not reference:
+            return False
+        if 'require_text' in reference:
+            return bool(reference['require_text'])
+        return self.check_dates and contains_date(reference.get('text'))
+        
+    def evaluate_barcode(self, data: str, reference: Optional[Dict]) -> BarcodeDecision:
+        """Bedöm en avläst streckkod mot referensen"""
+        if not data:
+            return BarcodeDecision(reason="Ingen streckkod")
+            
+        expected = (reference or {}).get('barcode') or ''
+        # Koder som inte är GTIN jämförs som rå data
+        gtin = normalize_gtin(data) or data
+        
+        if not expected:
+            return BarcodeDecision(True, None, True, gtin, "Referens saknar streckkod")
+            
+        matches = gtin == (normalize_gtin(expected) or expected) or data == expected
+        if not matches:
+            return BarcodeDecision(True, False, False, gtin, "Streckkod stämmer inte")
+        return BarcodeDecision(True, True, self.requires_text(reference), gtin, "Streckkod stämmer")
+        
+    def text_score(self, text: str, reference: Optional[Dict]) -> Optional[float]:
+        """Likhet mellan OCR-text och referenstext, None om referenstext saknas"""
+        expected = (reference or {}).get('text')
+        if not expected:
+            return None
+        return text_similarity(text, expected)
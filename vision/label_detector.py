@@ -5,6 +5,7 @@ import logging
 from ultralytics import YOLO
 from typing import Optional, Tuple, List, Dict
 import os
+from vision.text_similarity import text_similarity
 
 class LabelDetector:
     def __init__(self):
@@ -161,6 +162,4 @@ class LabelDetector:
         Returns:
             Likhetspoäng mellan 0 och 1
         """
-        # Implementera lämplig likhetsberäkning här
-        # Till exempel Levenshtein-avstånd eller annan metrik
-        return 0.0  # Placeholder
+        return text_similarity(text1, text2)
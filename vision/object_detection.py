@@ -6,7 +6,8 @@ import logging
 from typing import List, Dict, Optional, Tuple
 from ultralytics import YOLO
 from pyzbar import pyzbar
-from datetime import datetime
+from database.image_store import ImageStore
+from vision.barcode_localizer import BarcodeLocalizer, decode_localized
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +19,8 @@ class ObjectDetector:
         self.model = None
         self.last_error = None
         self.confidence_threshold = 0.5
+        self._image_stores: Dict[str, ImageStore] = {}
+        self.barcode_localizer = BarcodeLocalizer()
         
         if model_path:
             self.load_model(model_path)
@@ -63,29 +66,34 @@ class ObjectDetector:
             logger.error(f"Error detecting objects: {str(e)}")
             return []
             
-    def read_barcodes(self, image: np.ndarray) -> List[Dict]:
-        """Läs streckkoder och QR-koder"""
+    def read_barcodes(self, image: np.ndarray, detections: Optional[List[Dict]] = None) -> List[Dict]:
+        """Läs streckkoder och QR-koder
+        
+        Streckkoderna lokaliseras först och bara upprätta utsnitt avkodas.
+        Finns YOLO-detektioner av klassen 'barcode' används de som kandidater.
+        
+        Args:
+            image: BGR-bild
+            detections: Detektioner från detect_objects, om de redan finns
+        """
         try:
-            # Konvertera till gråskala
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Läs streckkoder
-            barcodes = pyzbar.decode(gray)
             results = []
-            
-            for barcode in barcodes:
-                # Extrahera information
-                (x, y, w, h) = barcode.rect
-                barcode_type = barcode.type
-                barcode_data = barcode.data.decode("utf-8")
-                
-                result = {
-                    'box': (x, y, x + w, y + h),
-                    'type': barcode_type,
-                    'data': barcode_data,
-                    'points': barcode.polygon
-                }
-                results.append(result)
+            if detections:
+                for candidate in self.barcode_localizer.from_detections(image, detections):
+                    crop = cv2.cvtColor(candidate.crop, cv2.COLOR_BGR2GRAY)
+                    for barcode in pyzbar.decode(crop):
+                        results.append({
+                            'box': candidate.box,
+                            'type': barcode.type,
+                            'data': barcode.data.decode("utf-8"),
+                            'points': candidate.map_points([(p.x, p.y) for p in barcode.polygon])
+                        })
+                        
+            if not results:
+                results = [
+                    {key: barcode[key] for key in ('box', 'type', 'data', 'points')}
+                    for barcode in decode_localized(image, pyzbar.decode, self.barcode_localizer)
+                ]
                 
             return results
             
@@ -141,26 +149,34 @@ class ObjectDetector:
             logger.error(f"Error drawing detections: {str(e)}")
             return image
             
-    def save_detection(self, image: np.ndarray, detection: Dict, save_dir: str) -> Optional[str]:
-        """Spara detekterad region"""
+    def save_detection(self, image: np.ndarray, detection: Dict, save_dir: str,
+                       tier: Optional[str] = None) -> Optional[str]:
+        """Spara detekterad region
+        
+        Regionen lagras innehållsadresserat i save_dir, så identiska utsnitt
+        sparas bara en gång och filnamn kan inte krocka. Hashen läggs i
+        detection['image_hash'] så att den kan refereras från databasen.
+        
+        Returns:
+            Regionens hash, läses med ImageStore.get även sedan den packats
+        """
         try:
             if 'box' not in detection:
                 return None
                 
-            # Extrahera region
-            x1, y1, x2, y2 = detection['box']
-            roi = image[y1:y2, x1:x2]
-            
-            # Skapa filnamn
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            det_type = detection.get('class', detection.get('type', 'unknown'))
-            filename = f"{save_dir}/detection_{det_type}_{timestamp}.jpg"
-            
-            # Spara bild
-            cv2.imwrite(filename, roi)
-            logger.info(f"Saved detection to {filename}")
+            store = self._image_stores.get(save_dir)
+            if store is None:
+                store = self._image_stores[save_dir] = ImageStore(save_dir)
+                
+            # Spara utsnittet
+            digest = store.put(image, roi=detection['box'], tier=tier)
+            if digest is None:
+                return None
+                
+            detection['image_hash'] = digest
+            logger.info(f"Saved detection as {digest} in {save_dir}")
             
-            return filename
+            return digest
             
         except Exception as e:
             self.last_error = str(e)
@@ -0,0 +1,226 @@
+"""Orienteringsbestämning för etiketter, en gång per etikett i stället för per textregion"""
+
+import cv2
+import numpy as np
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Orientation:
+    """Rotation som gör etikettens text vågrät och rättvänd
+    
+    angle följer OpenCV:s konvention: positiv vinkel roterar moturs.
+    """
+    angle: float = 0.0
+    confidence: float = 0.0
+    source: str = "none"
+    
+    def transform(self, shape: Tuple[int, ...]) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Rotationsmatris och utdatastorlek för en bild med given form"""
+        return rotation_transform(shape, self.angle)
+        
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        """Rotera en bild, hela innehållet behålls"""
+        if abs(self.angle) < 0.05:
+            return image
+        matrix, size = self.transform(image.shape)
+        return cv2.warpAffine(image, matrix, size, flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REPLICATE)
+                              
+    def map_box(self, shape: Tuple[int, ...], box: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+        """Översätt en ruta i originalbilden till den roterade bilden"""
+        if abs(self.angle) < 0.05:
+            return box
+        matrix, (width, height) = self.transform(shape)
+        x1, y1, x2, y2 = box
+        corners = np.array([[x1, y1, 1], [x2, y1, 1], [x2, y2, 1], [x1, y2, 1]], dtype=np.float64)
+        mapped = corners @ matrix.T
+        (mx1, my1), (mx2, my2) = mapped.min(axis=0), mapped.max(axis=0)
+        return (max(0, int(mx1)), max(0, int(my1)),
+                min(width, int(np.ceil(mx2))), min(height, int(np.ceil(my2))))
+
+def rotation_transform(shape: Tuple[int, ...], angle: float) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Rotationsmatris runt bildens mitt med utökad yta så att inget klipps bort"""
+    height, width = shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2.0, height / 2.0), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    out_w = int(round(height * sin + width * cos))
+    out_h = int(round(height * cos + width * sin))
+    matrix[0, 2] += out_w / 2.0 - width / 2.0
+    matrix[1, 2] += out_h / 2.0 - height / 2.0
+    return matrix, (out_w, out_h)
+
+def _normalize(angle: float) -> float:
+    """Vinkel i intervallet (-180, 180]"""
+    angle = (angle + 180.0) % 360.0 - 180.0
+    return 180.0 if angle == -180.0 else angle
+
+def estimate_skew(image: np.ndarray, work_width: int = 640) -> Tuple[float, float]:
+    """Geometrisk uppskattning av textradernas riktning
+    
+    Tecknen slås ihop till ordblock med en stängning vars storlek följer
+    teckenhöjden. Varje blocks minAreaRect ger radens riktning längs den
+    långa sidan, och riktningarna viktas med blockens area.
+    
+    Args:
+        image: BGR- eller gråskalebild av etiketten
+        work_width: Bredd som bilden skalas ned till för analysen
+        
+    Returns:
+        (vinkel, konfidens): vinkel i (-90, 90] som gör raderna vågräta,
+        konfidens 0-1 som andelen block som håller med
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    scale = min(1.0, work_width / float(gray.shape[1]))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if cv2.countNonZero(binary) > binary.size // 2:
+        # Ljus text på mörk bakgrund
+        binary = cv2.bitwise_not(binary)
+        
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    # Teckenstora komponenter: inte brus, inte ramar eller streckkodsblock
+    chars = (areas >= 8) & (heights < gray.shape[0] / 4) & (widths < gray.shape[1] / 4)
+    if chars.sum() < 3:
+        return 0.0, 0.0
+        
+    char_size = float(np.median(np.sqrt(heights[chars] * widths[chars])))
+    size = max(3, int(round(char_size * 0.6)) | 1)
+    blobs = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size)))
+    
+    contours, _ = cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    angles = []
+    weights = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area < char_size * char_size:
+            continue
+        points = cv2.boxPoints(cv2.minAreaRect(contour))
+        first, second = points[1] - points[0], points[2] - points[1]
+        first_len, second_len = np.hypot(*first), np.hypot(*second)
+        # Bara avlånga block säger något om riktningen
+        if max(first_len, second_len) < 1.5 * min(first_len, second_len):
+            continue
+        dx, dy = first if first_len > second_len else second
+        angles.append(np.degrees(np.arctan2(dy, dx)) % 180.0)
+        weights.append(area)
+        
+    if not angles:
+        return 0.0, 0.0
+        
+    # Viktat histogram över riktningar modulo 180, toppen förfinas med medelvärde
+    angles = np.asarray(angles)
+    weights = np.asarray(weights, dtype=np.float64)
+    histogram = np.bincount(np.round(angles).astype(int) % 180, weights, minlength=180)
+    smoothed = histogram + np.roll(histogram, 1) + np.roll(histogram, -1)
+    peak = float(np.argmax(smoothed))
+    offset = (angles - peak + 90.0) % 180.0 - 90.0
+    near = np.abs(offset) <= 3.0
+    direction = peak + float(np.average(offset[near], weights=weights[near]))
+    confidence = float(weights[near].sum() / weights.sum())
+    
+    angle = (direction + 90.0) % 180.0 - 90.0
+    return (90.0 if angle == -90.0 else angle), confidence
+
+def tesseract_osd(image: np.ndarray) -> float:
+    """Rotation enligt Tesseracts OSD, i grader medurs som Tesseract anger den"""
+    import pytesseract
+    osd = pytesseract.image_to_osd(image)
+    return float(osd.split('\nRotate: ')[1].split('\n')[0])
+
+class OrientationEstimator:
+    """Bestämmer orienteringen en gång per spårad etikett
+    
+    Den geometriska uppskattningen används i första hand. OSD körs bara
+    när den är osäker, eller när raderna står lodrätt och det inte går att
+    avgöra geometriskt vilket håll som är upp. Resultatet sparas per
+    spår-id så följande bilder av samma etikett inte räknar om något.
+    """
+    
+    def __init__(self, osd: Optional[Callable] = None, min_confidence: float = 0.6,
+                 max_age: float = 5.0, max_entries: int = 64):
+        """Initierar uppskattaren
+        
+        Args:
+            osd: Reservmetod som ger rotation i grader medurs, t.ex. tesseract_osd
+            min_confidence: Lägsta geometriska konfidens för att hoppa över OSD
+            max_age: Sekunder ett cachat resultat gäller
+            max_entries: Max antal spårade etiketter i cachen
+        """
+        self.osd = osd
+        self.min_confidence = min_confidence
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[Hashable, Tuple[Orientation, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def estimate(self, image: np.ndarray, track_id: Optional[Hashable] = None) -> Orientation:
+        """Orienteringen för en etikett, från cachen om spåret redan är känt
+        
+        Args:
+            image: Etikettens bild
+            track_id: Id för den spårade etiketten, None för ingen cache
+        """
+        if track_id is not None:
+            cached = self._cached(track_id)
+            if cached is not None:
+                return cached
+                
+        orientation = self._estimate(image)
+        
+        if track_id is not None:
+            with self._lock:
+                self._cache[track_id] = (orientation, time.monotonic())
+                self._cache.move_to_end(track_id)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return orientation
+        
+    def invalidate(self, track_id: Optional[Hashable] = None):
+        """Glöm ett spår, eller alla spår om track_id är None"""
+        with self._lock:
+            if track_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(track_id, None)
+                
+    def _cached(self, track_id: Hashable) -> Optional[Orientation]:
+        with self._lock:
+            entry = self._cache.get(track_id)
+            if entry is None:
+                return None
+            orientation, stamp = entry
+            if time.monotonic() - stamp > self.max_age:
+                del self._cache[track_id]
+                return None
+            self._cache.move_to_end(track_id)
+            return orientation
+            
+    def _estimate(self, image: np.ndarray) -> Orientation:
+        skew, confidence = estimate_skew(image)
+        confident = confidence >= self.min_confidence
+        if confident and abs(skew) <= 45.0:
+            return Orientation(skew, confidence, "geometry")
+        if self.osd is None:
+            return Orientation(skew if confident else 0.0, confidence, "geometry")
+            
+        try:
+            if confident:
+                # Lodräta rader: räta upp dem och låt OSD avgöra om texten står på huvudet
+                upright = Orientation(skew).apply(image)
+                return Orientation(_normalize(skew - self.osd(upright)), confidence, "geometry+osd")
+            return Orientation(_normalize(-self.osd(image)), confidence, "osd")
+        except Exception as e:
+            logger.warning(f"OSD misslyckades, använder geometrisk orientering: {str(e)}")
+            return Orientation(skew if confident else 0.0, confidence, "geometry")
@@ -0,0 +1,236 @@
+"""Upprätning av etiketter till en fast storlek per etikettyp"""
+
+import cv2
+import numpy as np
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Rectification:
+    """Perspektivtransform från kamerabilden till en upprätad etikett"""
+    corners: np.ndarray
+    matrix: np.ndarray
+    size: Tuple[int, int]
+    label_type: str = ""
+    refined: bool = False
+    
+    def warp(self, image: np.ndarray) -> np.ndarray:
+        """Räta upp etiketten, bara utdatabildens pixlar beräknas"""
+        return cv2.warpPerspective(image, self.matrix, self.size, flags=cv2.INTER_LINEAR,
+                                   borderMode=cv2.BORDER_REPLICATE)
+                                   
+    def to_image(self, points: Sequence[Tuple[float, float]]) -> np.ndarray:
+        """Översätt punkter i den upprätade etiketten till kamerabilden"""
+        pts = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(pts, np.linalg.inv(self.matrix)).reshape(-1, 2)
+
+def order_corners(points: np.ndarray) -> np.ndarray:
+    """Sortera fyra hörn som övre vänster, övre höger, nedre höger, nedre vänster"""
+    pts = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    s = pts.sum(axis=1)
+    diff = pts[:, 1] - pts[:, 0]
+    return np.array([
+        pts[np.argmin(s)],
+        pts[np.argmin(diff)],
+        pts[np.argmax(s)],
+        pts[np.argmax(diff)]
+    ], dtype=np.float32)
+
+def box_corners(box: Tuple[int, int, int, int]) -> np.ndarray:
+    """Hörnen för en axelparallell ruta (x1, y1, x2, y2)"""
+    x1, y1, x2, y2 = box
+    return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+
+def refine_corners(image: np.ndarray, box: Optional[Tuple[int, int, int, int]] = None,
+                   margin: float = 0.1, work_width: int = 480,
+                   min_fill: Optional[float] = None) -> Optional[np.ndarray]:
+    """Hitta etikettens fyra hörn inom och runt en ruta
+    
+    Bara området runt rutan analyseras, nedskalat. Konturen approximeras
+    till en fyrhörning; går det inte (rundade eller skymda hörn) används
+    konturens minsta omslutande rektangel.
+    
+    Args:
+        image: Kamerabild
+        box: Detektorns ruta (x1, y1, x2, y2), None för hela bilden
+        margin: Marginal runt rutan som andel av dess storlek
+        work_width: Bredd som området skalas ned till
+        min_fill: Minsta andel av området som konturen måste täcka, None för
+            0.3 inom en ruta och 0.1 i hela bilden
+        
+    Returns:
+        Hörn i bildkoordinater ordnade med order_corners, eller None
+    """
+    height, width = image.shape[:2]
+    if min_fill is None:
+        min_fill = 0.3 if box is not None else 0.1
+    if box is None:
+        box = (0, 0, width, height)
+    x1, y1, x2, y2 = box
+    mx, my = int((x2 - x1) * margin), int((y2 - y1) * margin)
+    x1, y1 = max(0, x1 - mx), max(0, y1 - my)
+    x2, y2 = min(width, x2 + mx), min(height, y2 + my)
+    roi = image[y1:y2, x1:x2]
+    if roi.size == 0:
+        return None
+        
+    gray = roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    scale = min(1.0, work_width / float(gray.shape[1]))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 30, 100)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+        
+    contour = max(contours, key=cv2.contourArea)
+    hull = cv2.convexHull(contour)
+    if cv2.contourArea(hull) < min_fill * gray.shape[0] * gray.shape[1]:
+        return None
+        
+    perimeter = cv2.arcLength(hull, True)
+    quad = None
+    for epsilon in (0.02, 0.03, 0.05):
+        approx = cv2.approxPolyDP(hull, epsilon * perimeter, True)
+        if len(approx) == 4:
+            quad = approx.reshape(4, 2).astype(np.float32)
+            break
+    if quad is None:
+        quad = cv2.boxPoints(cv2.minAreaRect(hull))
+        
+    return order_corners(quad / scale + np.array([x1, y1], dtype=np.float32))
+
+class LabelRectifier:
+    """Rätar upp etiketter till en fast storlek per etikettyp
+    
+    Hörnen tas från detektorns ruta och förfinas med konturen runt den.
+    Transformen sparas per spår och återanvänds så länge rutan står still,
+    så en etikett som ligger kvar under kameran bara mäts in en gång.
+    Storleken per etikettyp kan anges; annars bestäms den av den första
+    etiketten av typen, så att OCR alltid ser bilder i samma skala. Utan
+    etikettyp sparas ingen storlek, etiketten behåller sina mätta
+    proportioner.
+    """
+    
+    def __init__(self, canonical_sizes: Optional[Dict[str, Tuple[int, int]]] = None,
+                 long_side: int = 1000, stable_shift: float = 0.02, max_age: float = 10.0,
+                 max_entries: int = 64):
+        """Initierar upprätningen
+        
+        Args:
+            canonical_sizes: Utdatastorlek (bredd, höjd) per etikettyp
+            long_side: Längsta sida när storleken bestäms från etiketten
+            stable_shift: Största förflyttning av rutan, som andel av dess
+                diagonal, för att den sparade transformen ska återanvändas
+            max_age: Sekunder en sparad transform gäller
+            max_entries: Max antal spår i cachen, det äldst använda släpps först
+        """
+        self.canonical_sizes = dict(canonical_sizes or {})
+        self.long_side = long_side
+        self.stable_shift = stable_shift
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._tracks: "OrderedDict[Hashable, Tuple[Tuple[int, int, int, int], Rectification, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def canonical_size(self, label_type: str, corners: np.ndarray) -> Tuple[int, int]:
+        """Utdatastorlek för en etikettyp, bestäms första gången typen ses
+        
+        En tom etikettyp är okänd: storleken tas då från hörnen varje gång
+        och sparas inte, så att en okänd etikett inte låser storleken för
+        alla följande.
+        """
+        with self._lock:
+            size = self.canonical_sizes.get(label_type) if label_type else None
+            if size is None:
+                tl, tr, br, bl = corners
+                width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+                height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+                factor = self.long_side / max(width, height, 1.0)
+                size = (max(1, int(round(width * factor))), max(1, int(round(height * factor))))
+                if label_type:
+                    self.canonical_sizes[label_type] = size
+            return size
+            
+    def rectify(self, image: np.ndarray, box: Optional[Tuple[int, int, int, int]] = None,
+                label_type: str = "", track_id: Optional[Hashable] = None,
+                refine: bool = True) -> Optional[Rectification]:
+        """Beräkna transformen för en etikett
+        
+        Args:
+            image: Kamerabild
+            box: Detektorns ruta (x1, y1, x2, y2), None för hela bilden
+            label_type: Etikettyp, avgör utdatastorleken
+            track_id: Id för den spårade etiketten, None för ingen cache
+            refine: Förfina hörnen med konturen runt rutan
+            
+        Returns:
+            Rectification, eller None om varken ruta eller kontur finns
+        """
+        if box is not None and track_id is not None:
+            cached = self._cached(track_id, box, label_type)
+            if cached is not None:
+                return cached
+                
+        corners = refine_corners(image, box) if refine else None
+        refined = corners is not None
+        if corners is None:
+            if box is None:
+                return None
+            corners = box_corners(box)
+            
+        width, height = self.canonical_size(label_type, corners)
+        target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+        rectification = Rectification(
+            corners=corners,
+            matrix=cv2.getPerspectiveTransform(corners, target),
+            size=(width, height),
+            label_type=label_type,
+            refined=refined
+        )
+        
+        if box is not None and track_id is not None:
+            with self._lock:
+                self._tracks[track_id] = (tuple(box), rectification, time.monotonic())
+                self._tracks.move_to_end(track_id)
+                while len(self._tracks) > self.max_entries:
+                    self._tracks.popitem(last=False)
+        return rectification
+        
+    def warp(self, image: np.ndarray, box: Optional[Tuple[int, int, int, int]] = None,
+             label_type: str = "", track_id: Optional[Hashable] = None) -> Optional[np.ndarray]:
+        """Räta upp en etikett, None om den inte kunde hittas"""
+        rectification = self.rectify(image, box, label_type, track_id)
+        return rectification.warp(image) if rectification is not None else None
+        
+    def forget(self, track_id: Optional[Hashable] = None):
+        """Glöm ett spår, eller alla spår om track_id är None"""
+        with self._lock:
+            if track_id is None:
+                self._tracks.clear()
+            else:
+                self._tracks.pop(track_id, None)
+                
+    def _cached(self, track_id: Hashable, box: Tuple[int, int, int, int],
+                label_type: str) -> Optional[Rectification]:
+        with self._lock:
+            entry = self._tracks.get(track_id)
+            if entry is None:
+                return None
+            cached_box, rectification, stamp = entry
+            x1, y1, x2, y2 = cached_box
+            tolerance = self.stable_shift * np.hypot(x2 - x1, y2 - y1)
+            stable = max(abs(a - b) for a, b in zip(cached_box, box)) <= tolerance
+            if not stable or rectification.label_type != label_type or time.monotonic() - stamp > self.max_age:
+                del self._tracks[track_id]
+                return None
+            self._tracks.move_to_end(track_id)
+            return rectification
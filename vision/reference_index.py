@@ -0,0 +1,135 @@
+"""Index för att identifiera vilken produkt en etikett tillhör utifrån OCR-text"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from vision.text_similarity import normalize_text, text_similarity, tokenize
+
+
+def char_ngrams(text: str, n: int = 3) -> Set[str]:
+    """Tecken-n-gram per ord, med ordgränser markerade
+
+    N-gram tål enstaka OCR-fel (ett felläst tecken påverkar bara n gram)
+    och gram per ord gör indexet okänsligt för ordföljd.
+    """
+    grams = set()
+    for token in tokenize(normalize_text(text)):
+        padded = f" {token} "
+        if len(padded) <= n:
+            grams.add(padded)
+            continue
+        for i in range(len(padded) - n + 1):
+            grams.add(padded[i:i + n])
+    return grams
+
+
+class ReferenceIndex:
+    """Inverterat n-gram-index över referenstexter
+
+    En sökning läser bara posting-listorna för de n-gram som finns i
+    OCR-texten, så kostnaden växer med frågans längd och inte med
+    katalogens storlek. De bästa kandidaterna räknas sedan om med
+    text_similarity för att få en exakt poäng. Där ger en delvis avläsning
+    full poäng, så poängen säger vilken etikett det är och inte att den är
+    korrekt; valideringen görs mot referensen efteråt.
+    """
+
+    def __init__(self, n: int = 3, max_candidates: int = 50, max_document_frequency: float = 0.5):
+        """Initiera indexet
+
+        Args:
+            n: Längd på n-gram
+            max_candidates: Antal kandidater som räknas om exakt
+            max_document_frequency: N-gram som finns i en större andel av
+                referenserna än så hoppas över vid sökning
+        """
+        self.n = n
+        self.max_candidates = max_candidates
+        self.max_document_frequency = max_document_frequency
+
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self._gram_counts: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._idf: Dict[str, float] = {}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, reference_id: str, text: str):
+        """Lägg till en referenstext"""
+        grams = char_ngrams(text, self.n)
+        if not grams:
+            return
+        doc = len(self.ids)
+        self.ids.append(reference_id)
+        self.texts.append(text)
+        self._gram_counts.append(len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(doc)
+        self._dirty = True
+
+    def add_many(self, references: Iterable[Tuple[str, str]]):
+        """Lägg till flera (id, text)"""
+        for reference_id, text in references:
+            self.add(reference_id, text)
+
+    def _update_idf(self):
+        total = len(self.ids)
+        self._idf = {
+            gram: math.log(1.0 + total / len(docs))
+            for gram, docs in self._postings.items()
+        }
+        self._dirty = False
+
+    def candidates(self, text: str, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Referenser som delar flest (viktade) n-gram med texten
+
+        Returns:
+            Lista med (dokumentindex, grov poäng), bäst först
+        """
+        if self._dirty:
+            self._update_idf()
+
+        grams = char_ngrams(text, self.n)
+        if not grams or not self.ids:
+            return []
+
+        max_docs = max(1, int(len(self.ids) * self.max_document_frequency))
+        scores: Dict[int, float] = {}
+        for gram in grams:
+            docs = self._postings.get(gram)
+            if docs is None or (len(docs) > max_docs and len(self.ids) > 10):
+                continue
+            weight = self._idf[gram]
+            for doc in docs:
+                scores[doc] = scores.get(doc, 0.0) + weight
+
+        query_size = len(grams)
+        ranked = sorted(
+            ((doc, score / math.sqrt(query_size * self._gram_counts[doc])) for doc, score in scores.items()),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return ranked[:limit or self.max_candidates]
+
+    def search(self, text: str, top_k: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """Hitta de referenser som bäst matchar en OCR-text
+
+        Args:
+            text: OCR-text från en okänd etikett
+            top_k: Antal kandidater att returnera
+            min_score: Lägsta likhet för att en kandidat ska tas med
+
+        Returns:
+            Lista med (referens-id, likhet 0.0-1.0), bäst först
+        """
+        results = []
+        for doc, _ in self.candidates(text):
+            score = text_similarity(text, self.texts[doc], min_score, partial=True)
+            if score >= min_score and score > 0.0:
+                results.append((self.ids[doc], score))
+
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:top_k]
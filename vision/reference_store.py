@@ -0,0 +1,361 @@
+"""Förberäknade särdrag för referensetiketter, lagrade som minnesmappade filer"""
+
+import cv2
+import numpy as np
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from vision.registration import Template, TemplateRegistration, Zone, load_zones
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Antal registreringsmallar som hålls i minnet, så att referensbilden inte läses per bild
+TEMPLATE_CACHE_SIZE = 16
+
+@dataclass
+class StoredReference:
+    """En referens i lagret, deskriptorerna ligger i [offset, offset + count)"""
+    label_id: str
+    path: str
+    signature: List[int]
+    digest: str
+    offset: int
+    count: int
+    width: int
+    height: int
+    phash: str
+    text: str = ""
+    zones: List[Dict] = field(default_factory=list)
+
+def perceptual_hash(image: np.ndarray) -> int:
+    """64-bitars perceptuell hash (DCT av en 32x32-nedskalning)"""
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Hammingavstånd från value till varje hash i en uint64-vektor"""
+    xor = np.bitwise_xor(hashes.astype(np.uint64), np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def discover_references(roots: Iterable[str]) -> List[Tuple[str, str]]:
+    """Hitta referensbilder under en eller flera kataloger
+    
+    Returns:
+        Lista med (etikett-id, sökväg), id är sökvägen relativt roten utan filändelse
+    """
+    found = {}
+    for root in roots:
+        root = Path(root)
+        if not root.is_dir():
+            continue
+        for path in sorted(root.rglob('*')):
+            if path.suffix.lower() in IMAGE_EXTENSIONS and path.is_file():
+                label_id = path.relative_to(root).with_suffix('').as_posix()
+                found.setdefault(label_id, str(path))
+    return sorted(found.items())
+
+def _sidecars(path: Path) -> Tuple[Path, Path]:
+    """Zonfil och textfil som hör till en referensbild"""
+    return path.with_suffix('.zones.json'), path.with_suffix('.txt')
+
+def _signature(path: Path) -> List[int]:
+    """Ändringstid och storlek för bilden och dess sidofiler"""
+    signature = []
+    for file in (path,) + _sidecars(path):
+        try:
+            stat = file.stat()
+            signature += [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            signature += [0, 0]
+    return signature
+
+class ReferenceStore:
+    """Lager med ORB-deskriptorer, perceptuella hashar, zoner och förväntad text
+    
+    Alla deskriptorer ligger i en gemensam matris som minnesmappas vid
+    start, så uppstarten kostar bara inläsning av manifestet oavsett antal
+    artiklar. Uppslag görs med ett LSH-index (FLANN) över alla deskriptorer
+    och röstning per referens; den perceptuella hashen ger en snabb
+    förgallring. Ombyggnad är inkrementell: bara referenser vars bild eller
+    sidofiler ändrats räknas om, övriga kopieras från föregående version.
+    """
+    
+    MANIFEST = 'manifest.json'
+    
+    def __init__(self, directory: str, registration: Optional[TemplateRegistration] = None):
+        """Initierar lagret
+        
+        Args:
+            directory: Katalog där lagret sparas
+            registration: Registrering som ger ORB-särdragen, None för 500 punkter per referens
+        """
+        self.directory = Path(directory)
+        self.registration = registration or TemplateRegistration(features=500)
+        self.generation = 0
+        self.references: List[StoredReference] = []
+        self._by_id: Dict[str, int] = {}
+        self.descriptors = np.zeros((0, 32), np.uint8)
+        self.points = np.zeros((0, 2), np.float32)
+        self.owners = np.zeros(0, np.int32)
+        self.phashes = np.zeros(0, np.uint64)
+        self._matcher = None
+        self._templates: "OrderedDict[str, Template]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+    # Laddning och lagring
+    
+    def _file(self, name: str, generation: Optional[int] = None) -> Path:
+        return self.directory / f"{name}.{self.generation if generation is None else generation}.npy"
+        
+    def load(self) -> bool:
+        """Läs manifestet och minnesmappa matriserna, False om lagret saknas"""
+        manifest = self.directory / self.MANIFEST
+        if not manifest.exists():
+            return False
+        with open(manifest, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.generation = data['generation']
+        references = [StoredReference(**r) for r in data['references']]
+        arrays = {name: np.load(self._file(name), mmap_mode='r')
+                  for name in ('descriptors', 'points', 'owners', 'phashes')}
+        self._install(references, arrays)
+        return True
+        
+    def _install(self, references: List[StoredReference], arrays: Dict[str, np.ndarray]):
+        with self._lock:
+            self.references = references
+            self._by_id = {r.label_id: i for i, r in enumerate(references)}
+            self.descriptors = arrays['descriptors']
+            self.points = arrays['points']
+            self.owners = arrays['owners']
+            self.phashes = arrays['phashes']
+            self._matcher = None
+            self._templates.clear()
+            
+    def build(self, sources: Iterable[Tuple[str, str]]) -> Dict[str, int]:
+        """Bygg om lagret inkrementellt
+        
+        Args:
+            sources: (etikett-id, sökväg till referensbild), t.ex. från discover_references
+            
+        Returns:
+            Antal tillagda, uppdaterade, oförändrade och borttagna referenser
+        """
+        self.load()
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+        previous = {r.label_id: r for r in self.references}
+        references, descriptors, points = [], [], []
+        offset = 0
+        
+        for label_id, path in sources:
+            path = Path(path)
+            signature = _signature(path)
+            old = previous.pop(label_id, None)
+            if old is not None and old.signature == signature and old.path == str(path):
+                reference = StoredReference(**{**asdict(old), 'offset': offset})
+                desc = np.asarray(self.descriptors[old.offset:old.offset + old.count])
+                pts = np.asarray(self.points[old.offset:old.offset + old.count])
+                counts['unchanged'] += 1
+            else:
+                computed = self._compute(label_id, path, signature, offset, old)
+                if computed is None:
+                    continue
+                reference, desc, pts = computed
+                counts['updated' if old is not None else 'added'] += 1
+            references.append(reference)
+            descriptors.append(desc)
+            points.append(pts)
+            offset += reference.count
+            
+        counts['removed'] = len(previous)
+        self._write(references, descriptors, points)
+        logger.info(f"Referenslager byggt: {counts}")
+        return counts
+        
+    def _compute(self, label_id: str, path: Path, signature: List[int], offset: int,
+                 old: Optional[StoredReference]):
+        """Beräkna särdrag för en ny eller ändrad referens"""
+        try:
+            data = path.read_bytes()
+        except OSError as e:
+            logger.error(f"Kunde inte läsa referens {path}: {str(e)}")
+            return None
+            
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        zones_path, text_path = _sidecars(path)
+        zones = [asdict(z) for z in load_zones(zones_path)] if zones_path.exists() else []
+        text = text_path.read_text(encoding='utf-8').strip() if text_path.exists() else ""
+        if not text:
+            text = "\n".join(z['expected'] for z in zones if z.get('expected'))
+            
+        if old is not None and old.digest == digest and old.path == str(path):
+            # Bara sidofiler eller tidsstämpel har ändrats, särdragen kan återanvändas
+            desc = np.asarray(self.descriptors[old.offset:old.offset + old.count])
+            pts = np.asarray(self.points[old.offset:old.offset + old.count])
+            return StoredReference(label_id, str(path), signature, digest, offset, old.count,
+                                   old.width, old.height, old.phash, text, zones), desc, pts
+                                   
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            logger.error(f"Kunde inte avkoda referensbild: {path}")
+            return None
+        pts, desc = self.registration.features(image)
+        if desc is None:
+            desc = np.zeros((0, 32), np.uint8)
+            pts = np.zeros((0, 2), np.float32)
+        reference = StoredReference(label_id, str(path), signature, digest, offset, len(desc),
+                                    image.shape[1], image.shape[0], f"{perceptual_hash(image):016x}",
+                                    text, zones)
+        return reference, desc, pts
+        
+    def _write(self, references: List[StoredReference], descriptors: List[np.ndarray],
+               points: List[np.ndarray]):
+        """Skriv en ny generation och byt till den när manifestet är på plats
+        
+        Gamla generationer tas bort efteråt. Filer som fortfarande är
+        minnesmappade av en annan process lämnas kvar till nästa ombyggnad.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        generation = self.generation + 1
+        arrays = {
+            'descriptors': np.concatenate(descriptors) if descriptors else np.zeros((0, 32), np.uint8),
+            'points': np.concatenate(points).astype(np.float32) if points else np.zeros((0, 2), np.float32),
+            'owners': np.repeat(np.arange(len(references), dtype=np.int32), [r.count for r in references]),
+            'phashes': np.array([int(r.phash, 16) for r in references], dtype=np.uint64)
+        }
+        for name, array in arrays.items():
+            np.save(self._file(name, generation), array)
+            
+        manifest = self.directory / self.MANIFEST
+        tmp = manifest.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'generation': generation, 'references': [asdict(r) for r in references]},
+                      f, ensure_ascii=False)
+        os.replace(tmp, manifest)
+        self.load()
+        for old in self.directory.glob('*.npy'):
+            if not old.name.endswith(f".{generation}.npy"):
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+                    
+    # Uppslag
+    
+    def __len__(self) -> int:
+        return len(self.references)
+        
+    def get(self, label_id: str) -> Optional[StoredReference]:
+        """Hämta en referens på id"""
+        index = self._by_id.get(label_id)
+        return self.references[index] if index is not None else None
+        
+    def nearest_by_hash(self, image: np.ndarray, top_k: int = 10) -> List[Tuple[str, int]]:
+        """Referenser med närmast perceptuell hash, som (id, hammingavstånd)"""
+        if not self.references:
+            return []
+        distances = hamming_distances(np.asarray(self.phashes), perceptual_hash(image))
+        order = np.argsort(distances, kind='stable')[:top_k]
+        return [(self.references[i].label_id, int(distances[i])) for i in order]
+        
+    def _get_matcher(self):
+        """LSH-index över alla deskriptorer, byggs vid första uppslaget"""
+        with self._lock:
+            if self._matcher is None:
+                matcher = cv2.FlannBasedMatcher(
+                    dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1),
+                    dict(checks=50)
+                )
+                matcher.add([np.ascontiguousarray(self.descriptors)])
+                matcher.train()
+                self._matcher = matcher
+            return self._matcher
+            
+    def lookup(self, image: np.ndarray, top_k: int = 5, ratio: float = 0.75) -> List[Tuple[str, int]]:
+        """Identifiera referensen för en fångad etikett med deskriptorröstning
+        
+        Returns:
+            Lista med (etikett-id, antal röster), flest röster först
+        """
+        if len(self.descriptors) < 2:
+            return []
+        _, query = self.registration.features(image)
+        if query is None:
+            return []
+            
+        votes = np.zeros(len(self.references), np.int64)
+        owners = np.asarray(self.owners)
+        for pair in self._get_matcher().knnMatch(query, k=2):
+            if len(pair) == 2 and pair[0].distance < ratio * pair[1].distance:
+                votes[owners[pair[0].trainIdx]] += 1
+            elif len(pair) == 1:
+                votes[owners[pair[0].trainIdx]] += 1
+                
+        order = np.argsort(-votes, kind='stable')[:top_k]
+        return [(self.references[i].label_id, int(votes[i])) for i in order if votes[i] > 0]
+        
+    def identify(self, image: np.ndarray, min_votes: int = 20, min_margin: float = 1.5) -> Optional[str]:
+        """Id för referensen som bäst matchar en fångad etikett
+        
+        Returns:
+            Etikett-id, eller None om bästa referensen har färre än min_votes
+            röster eller inte min_margin gånger fler än den näst bästa
+        """
+        matches = self.lookup(image, top_k=2)
+        if not matches or matches[0][1] < min_votes:
+            return None
+        if len(matches) > 1 and matches[0][1] < min_margin * matches[1][1]:
+            return None
+        return matches[0][0]
+        
+    def template(self, label_id: str) -> Optional[Template]:
+        """Registreringsmall med lagrade särdrag, bara bilden läses från disk
+        
+        De senast använda mallarna hålls i minnet.
+        """
+        with self._lock:
+            template = self._templates.get(label_id)
+            if template is not None:
+                self._templates.move_to_end(label_id)
+                return template
+                
+        reference = self.get(label_id)
+        if reference is None:
+            return None
+        image = cv2.imread(reference.path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            logger.error(f"Kunde inte läsa referensbild: {reference.path}")
+            return None
+        start, end = reference.offset, reference.offset + reference.count
+        zones = [Zone(z['name'], tuple(z['box']), z['kind'], z.get('expected', '')) for z in reference.zones]
+        template = Template(label_id, image, np.asarray(self.points[start:end]),
+                            np.asarray(self.descriptors[start:end]), zones)
+                            
+        with self._lock:
+            self._templates[label_id] = template
+            while len(self._templates) > TEMPLATE_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        return template
+        
+    def zone_mask(self, label_id: str) -> Optional[np.ndarray]:
+        """Mask över referensens variabla zoner"""
+        reference = self.get(label_id)
+        if reference is None:
+            return None
+        mask = np.zeros((reference.height, reference.width), np.uint8)
+        for zone in reference.zones:
+            x1, y1, x2, y2 = zone['box']
+            mask[y1:y2, x1:x2] = 255
+        return mask
@@ -0,0 +1,259 @@
+"""Inspektion genom registrering mot renderade referensetiketter"""
+
+import cv2
+import numpy as np
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from vision.inspection_policy import contains_date, normalize_gtin
+from vision.text_similarity import text_similarity
+
+logger = logging.getLogger(__name__)
+
+# Zontyper som läses av i stället för att jämföras mot referensbilden
+ZONE_KINDS = ('text', 'date', 'batch', 'barcode')
+
+@dataclass
+class Zone:
+    """Ett variabelt fält på etiketten, i referensbildens koordinater"""
+    name: str
+    box: Tuple[int, int, int, int]
+    kind: str = 'text'
+    expected: str = ""
+
+@dataclass
+class Template:
+    """Referensetikett med förberäknade särdrag
+    
+    Punkterna sparas som en (N, 2)-matris i stället för cv2.KeyPoint så att
+    mallen kan lagras och läsas utan att räkna om något.
+    """
+    label_id: str
+    image: np.ndarray
+    points: np.ndarray
+    descriptors: np.ndarray
+    zones: List[Zone] = field(default_factory=list)
+    
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.shape[1], self.image.shape[0]
+        
+    def static_mask(self, padding: int = 4) -> np.ndarray:
+        """Mask över den statiska layouten, allt utom de variabla zonerna"""
+        mask = np.full(self.image.shape[:2], 255, np.uint8)
+        height, width = mask.shape
+        for zone in self.zones:
+            x1, y1, x2, y2 = zone.box
+            mask[max(0, y1 - padding):min(height, y2 + padding),
+                 max(0, x1 - padding):min(width, x2 + padding)] = 0
+        return mask
+
+@dataclass
+class ZoneReading:
+    """Avläsning av en zon"""
+    name: str
+    kind: str
+    value: str = ""
+    passed: bool = False
+    score: float = 0.0
+
+@dataclass
+class RegistrationResult:
+    """Resultat av registrering och zonkontroll"""
+    registered: bool = False
+    inliers: int = 0
+    homography: Optional[np.ndarray] = None
+    static_diff: float = 1.0
+    static_ok: bool = False
+    zones: List[ZoneReading] = field(default_factory=list)
+    error: str = ""
+    
+    @property
+    def passed(self) -> bool:
+        return self.registered and self.static_ok and all(z.passed for z in self.zones)
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def load_zones(path: Path) -> List[Zone]:
+    """Läs zoner från en JSON-fil bredvid referensbilden
+    
+    Formatet är en lista, eller {"zones": lista}, med
+    {"name", "box": [x1, y1, x2, y2], "kind", "expected"}.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    items = data.get('zones', []) if isinstance(data, dict) else data
+    zones = []
+    for item in items:
+        kind = item.get('kind', 'text')
+        if kind not in ZONE_KINDS:
+            raise ValueError(f"Okänd zontyp: {kind}")
+        zones.append(Zone(item['name'], tuple(int(v) for v in item['box']), kind, item.get('expected', '')))
+    return zones
+
+class TemplateRegistration:
+    """Registrerar fångade etiketter mot referensbilder och kontrollerar bara zonerna
+    
+    Den fångade etiketten läggs över referensen med ORB-särdrag och en
+    homografi. Statisk layout jämförs med en snabb bilddiff, och OCR eller
+    streckkodsläsning körs bara på de små variabla zonerna.
+    """
+    
+    def __init__(self, features: int = 1500, ratio: float = 0.75, min_inliers: int = 25,
+                 diff_threshold: float = 1.5, max_static_diff: float = 0.003,
+                 text_threshold: float = 0.8):
+        """Initierar registreringen
+        
+        Args:
+            features: Antal ORB-punkter per bild
+            ratio: Kvotgräns i Lowes test för matchningar
+            min_inliers: Minsta antal RANSAC-inliers för en godkänd registrering
+            diff_threshold: Avvikelse i standardavvikelser för att en pixel räknas som ändrad
+            max_static_diff: Största andel ändrade pixlar i den statiska layouten
+            text_threshold: Lägsta textlikhet för zoner med förväntad text
+        """
+        self.orb = cv2.ORB_create(nfeatures=features)
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+        self.ratio = ratio
+        self.min_inliers = min_inliers
+        self.diff_threshold = diff_threshold
+        self.max_static_diff = max_static_diff
+        self.text_threshold = text_threshold
+        
+    def features(self, image: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """ORB-punkter som (N, 2)-matris och deskriptorer"""
+        keypoints, descriptors = self.orb.detectAndCompute(_gray(image), None)
+        points = np.array([kp.pt for kp in keypoints], dtype=np.float32).reshape(-1, 2)
+        return points, descriptors
+        
+    def template(self, label_id: str, image: np.ndarray, zones: Optional[List[Zone]] = None) -> Template:
+        """Skapa en mall från en referensbild"""
+        gray = _gray(image)
+        points, descriptors = self.features(gray)
+        return Template(label_id, gray, points, descriptors, list(zones or []))
+        
+    def load_template(self, path: str, label_id: Optional[str] = None) -> Template:
+        """Läs en exporterad referens-PNG och dess zonfil (<namn>.zones.json)"""
+        path = Path(path)
+        image = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise ValueError(f"Kunde inte läsa referensbild: {path}")
+        zones_path = path.with_suffix('.zones.json')
+        zones = load_zones(zones_path) if zones_path.exists() else []
+        return self.template(label_id or path.stem, image, zones)
+        
+    def register(self, image: np.ndarray, template: Template) -> Tuple[Optional[np.ndarray], int]:
+        """Homografi från den fångade bilden till referensens koordinater
+        
+        Returns:
+            (homografi, antal inliers), homografin är None om registreringen misslyckades
+        """
+        points, descriptors = self.features(image)
+        if descriptors is None or template.descriptors is None or len(points) < 4:
+            return None, 0
+            
+        pairs = self.matcher.knnMatch(descriptors, template.descriptors, k=2)
+        good = [m[0] for m in pairs if len(m) == 2 and m[0].distance < self.ratio * m[1].distance]
+        if len(good) < 4:
+            return None, len(good)
+            
+        source = points[[m.queryIdx for m in good]]
+        target = template.points[[m.trainIdx for m in good]]
+        homography, inliers = cv2.findHomography(source, target, cv2.RANSAC, 4.0)
+        count = int(inliers.sum()) if inliers is not None else 0
+        if homography is None or count < self.min_inliers:
+            return None, count
+        return homography, count
+        
+    def static_difference(self, warped: np.ndarray, template: Template) -> Tuple[float, np.ndarray]:
+        """Andel ändrade pixlar i den statiska layouten
+        
+        Båda bilderna normaliseras till medelvärde 0 och standardavvikelse 1
+        inom masken så att belysningsskillnader inte räknas som fel. Små
+        avvikelser längs kanter från registreringen tas bort med en öppning.
+        """
+        mask = template.static_mask() > 0
+        ours = cv2.GaussianBlur(_gray(warped), (9, 9), 0).astype(np.float32)
+        theirs = cv2.GaussianBlur(template.image, (9, 9), 0).astype(np.float32)
+        
+        def normalized(values):
+            inside = values[mask]
+            return (values - inside.mean()) / (inside.std() + 1e-6)
+            
+        changed = (np.abs(normalized(ours) - normalized(theirs)) > self.diff_threshold) & mask
+        changed = cv2.morphologyEx(changed.astype(np.uint8) * 255, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+        return float(np.count_nonzero(changed)) / max(1, int(mask.sum())), changed
+        
+    def read_zones(self, warped: np.ndarray, template: Template,
+                   read_text: Optional[Callable] = None,
+                   read_barcode: Optional[Callable] = None) -> List[ZoneReading]:
+        """Läs av och bedöm varje variabel zon
+        
+        Args:
+            warped: Fångad etikett i referensens koordinater
+            template: Referensmall med zoner
+            read_text: OCR för ett utsnitt, ger text
+            read_barcode: Streckkodsläsning för ett utsnitt, ger data eller ""
+        """
+        readings = []
+        for zone in template.zones:
+            x1, y1, x2, y2 = zone.box
+            crop = warped[y1:y2, x1:x2]
+            reader = read_barcode if zone.kind == 'barcode' else read_text
+            value = (reader(crop) or "") if reader is not None and crop.size else ""
+            readings.append(self._judge(zone, value))
+        return readings
+        
+    def _judge(self, zone: Zone, value: str) -> ZoneReading:
+        reading = ZoneReading(zone.name, zone.kind, value)
+        if zone.kind == 'barcode':
+            if zone.expected:
+                reading.passed = (normalize_gtin(value) or value) == (normalize_gtin(zone.expected) or zone.expected)
+            else:
+                reading.passed = bool(value)
+        elif zone.expected:
+            reading.score = text_similarity(value, zone.expected)
+            reading.passed = reading.score >= self.text_threshold
+        elif zone.kind == 'date':
+            reading.passed = contains_date(value)
+        else:
+            reading.passed = bool(value.strip())
+        if reading.passed and not reading.score:
+            reading.score = 1.0
+        return reading
+        
+    def inspect(self, image: np.ndarray, template: Template,
+                read_text: Optional[Callable] = None,
+                read_barcode: Optional[Callable] = None) -> RegistrationResult:
+        """Registrera en fångad etikett och kontrollera layout och zoner"""
+        result = RegistrationResult()
+        try:
+            homography, result.inliers = self.register(image, template)
+            if homography is None:
+                result.error = "Kunde inte registrera etiketten mot referensen"
+                return result
+                
+            result.registered = True
+            result.homography = homography
+            warped = cv2.warpPerspective(image, homography, template.size, flags=cv2.INTER_LINEAR,
+                                         borderMode=cv2.BORDER_REPLICATE)
+                                         
+            result.static_diff, _ = self.static_difference(warped, template)
+            result.static_ok = result.static_diff <= self.max_static_diff
+            if not result.static_ok:
+                result.error = "Etikettens layout skiljer sig från referensen"
+                
+            result.zones = self.read_zones(warped, template, read_text, read_barcode)
+            failed = [z.name for z in result.zones if not z.passed]
+            if failed and not result.error:
+                result.error = f"Fel i fält: {', '.join(failed)}"
+            return result
+            
+        except Exception as e:
+            logger.error(f"Fel vid registrering mot referens: {str(e)}")
+            result.error = str(e)
+            return result
@@ -6,6 +6,7 @@ import logging
 from ultralytics import YOLO
 import pytesseract
 from pathlib import Path
+from vision.orientation import OrientationEstimator, rotation_transform, tesseract_osd
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,9 @@ class TextDetector:
             self.model = YOLO(str(model_path))
             logger.info(f"Laddade YOLO-modell: {model_path}")
             
+            # Orientering bestäms en gång per etikett, OSD bara som reserv
+            self.orientation = OrientationEstimator(osd=tesseract_osd)
+            
             # Debug-läge
             self.debug_mode = False
             
@@ -116,30 +120,34 @@ class TextDetector:
             logger.error(f"Fel vid textdetektering: {e}")
             return []
             
-    def get_text_orientation(self, image):
-        """Avgör textens orientering"""
-        try:
-            # Kör OCR med orientation och script detection
-            osd = pytesseract.image_to_osd(image)
-            angle = int(osd.split('\nRotate: ')[1].split('\n')[0])
-            return angle
-        except:
-            return 0
-            
+    def get_text_orientation(self, image, track_id=None):
+        """Avgör textens orientering
+        
+        Vinkeln följer OpenCV:s konvention (cv2.getRotationMatrix2D): positiv
+        vinkel roterar moturs. Tesseracts OSD anger i stället medurs, så en
+        etikett som OSD säger ska vridas 90 grader ger -90 här. Vinkeln kan
+        skickas oförändrad till rotate_image.
+        
+        Args:
+            image: Bild av etiketten
+            track_id: Id för den spårade etiketten, resultatet cachas per id
+            
+        Returns:
+            Vinkel i grader moturs, i (-180, 180], som gör texten vågrät och rättvänd
+        """
+        return self.orientation.estimate(image, track_id).angle
+        
     def rotate_image(self, image, angle):
-        """Rotera bilden till rätt orientering"""
+        """Rotera bilden moturs med angle grader, hela innehållet behålls"""
         if angle == 0:
             return image
             
         try:
-            height, width = image.shape[:2]
-            center = (width // 2, height // 2)
-            
-            # Skapa rotationsmatris
-            matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+            # Skapa rotationsmatris med plats för hela den roterade bilden
+            matrix, size = rotation_transform(image.shape, angle)
             
             # Utför rotation
-            rotated = cv2.warpAffine(image, matrix, (width, height),
+            rotated = cv2.warpAffine(image, matrix, size,
                                    flags=cv2.INTER_CUBIC,
                                    borderMode=cv2.BORDER_REPLICATE)
             
@@ -148,32 +156,38 @@ class TextDetector:
             logger.error(f"Fel vid bildrotering: {e}")
             return image
             
-    def extract_text(self, image, boxes):
-        """Extrahera text från detekterade regioner"""
+    def extract_text(self, image, boxes, track_id=None):
+        """Extrahera text från detekterade regioner
+        
+        Orienteringen bestäms en gång för hela etiketten och bilden roteras
+        en gång, alla regioner klipps sedan ut ur den upprätade bilden.
+        
+        Args:
+            image: Bild av etiketten
+            boxes: Textregioner från detect_text_regions
+            track_id: Id för den spårade etiketten, orienteringen cachas per id
+        """
         try:
             texts = []
-            enhanced_image = self.enhance_image(image)
+            orientation = self.orientation.estimate(image, track_id)
+            enhanced_image = orientation.apply(self.enhance_image(image))
+            angle = orientation.angle
             
             for box in boxes:
-                x1, y1, x2, y2 = box['bbox']
+                x1, y1, x2, y2 = orientation.map_box(image.shape, box['bbox'])
                 
                 # Lägg till padding runt regionen
                 padding = 5
                 x1 = max(0, x1 - padding)
                 y1 = max(0, y1 - padding)
-                x2 = min(image.shape[1], x2 + padding)
-                y2 = min(image.shape[0], y2 + padding)
+                x2 = min(enhanced_image.shape[1], x2 + padding)
+                y2 = min(enhanced_image.shape[0], y2 + padding)
                 
                 # Extrahera region
                 region = enhanced_image[y1:y2, x1:x2]
                 if region.size == 0:
                     continue
                     
-                # Kontrollera orientering och rotera vid behov
-                angle = self.get_text_orientation(region)
-                if angle != 0:
-                    region = self.rotate_image(region, angle)
-                
                 # OCR på regionen
                 text = pytesseract.image_to_string(
                     region,
@@ -204,14 +218,19 @@ class TextDetector:
             logger.error(f"Fel vid textextraktion: {e}")
             return []
             
-    def detect_and_read(self, image):
-        """Detektera och läs all text i bilden"""
+    def detect_and_read(self, image, track_id=None):
+        """Detektera och läs all text i bilden
+        
+        Args:
+            image: Bild av etiketten
+            track_id: Id för den spårade etiketten, orienteringen cachas per id
+        """
         try:
             # Detektera textregioner
             boxes = self.detect_text_regions(image)
             
             # Extrahera text från regionerna
-            texts = self.extract_text(image, boxes)
+            texts = self.extract_text(image, boxes, track_id)
             
             # Sortera texterna baserat på y-position (uppifrån och ner)
             texts.sort(key=lambda x: x['bbox'][1])
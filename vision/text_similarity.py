@@ -0,0 +1,246 @@
+"""Snabb textlikhet mellan OCR-resultat och referenstexter"""
+
+import re
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from rapidfuzz.distance import Levenshtein as _rf_levenshtein
+except ImportError:
+    _rf_levenshtein = None
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize_text(text: str) -> str:
+    """Normalisera text inför jämförelse
+
+    Unicode normaliseras (NFKC), versaler görs om till gemener och all
+    whitespace slås ihop till enkla mellanslag.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKC', text).lower()
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    """Dela normaliserad text i ord"""
+    return _TOKEN_RE.findall(text)
+
+
+def _pattern_masks(pattern: str) -> Dict[str, int]:
+    """Bitmasker per tecken för Myers algoritm"""
+    masks: Dict[str, int] = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def _myers_distance(masks: Dict[str, int], m: int, text: str, max_distance: int) -> int:
+    """Levenshtein-avstånd med Myers bitparallella algoritm
+
+    Hela DP-kolumnen hålls i ett heltal, så varje tecken i text kostar ett
+    fåtal bitoperationer oavsett mönstrets längd. Avbryter när avståndet
+    inte längre kan hamna under max_distance.
+    """
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    vp = full
+    vn = 0
+    score = m
+    remaining = len(text)
+
+    for char in text:
+        eq = masks.get(char, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | (~(xh | vp) & full)
+        hn = vp & xh
+
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+
+        hp = ((hp << 1) | 1) & full
+        hn = (hn << 1) & full
+        vp = hn | (~(xv | hp) & full)
+        vn = hp & xv
+
+        remaining -= 1
+        # Avståndet kan minska med högst ett per återstående tecken
+        if score - remaining > max_distance:
+            return max_distance + 1
+
+    return score
+
+
+def levenshtein(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """Levenshtein-avstånd mellan två strängar
+
+    Args:
+        a: Första strängen
+        b: Andra strängen
+        max_distance: Övre gräns, större avstånd rapporteras som max_distance + 1
+
+    Returns:
+        Antal redigeringar
+    """
+    if max_distance is None:
+        max_distance = max(len(a), len(b))
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if not a or not b:
+        return max(len(a), len(b))
+
+    if _rf_levenshtein is not None:
+        return _rf_levenshtein.distance(a, b, score_cutoff=max_distance)
+
+    # Kortare sträng som mönster ger mindre heltal
+    if len(a) > len(b):
+        a, b = b, a
+    return _myers_distance(_pattern_masks(a), len(a), b, max_distance)
+
+
+def _ratio_bound(length: int, min_score: float) -> int:
+    """Största avstånd som fortfarande ger minst min_score"""
+    return int(length * (1.0 - min_score))
+
+
+def levenshtein_ratio(a: str, b: str, min_score: float = 0.0) -> float:
+    """Normaliserad likhet 1 - avstånd / längsta längd
+
+    Resultat under min_score returneras som 0.0, vilket gör att
+    beräkningen kan avbrytas tidigt.
+    """
+    longest = max(len(a), len(b))
+    if longest == 0:
+        return 1.0
+    bound = _ratio_bound(longest, min_score)
+    distance = levenshtein(a, b, bound)
+    if distance > bound:
+        return 0.0
+    return 1.0 - distance / longest
+
+
+def token_set_ratio(a: str, b: str, min_score: float = 0.0, partial: bool = False) -> float:
+    """Likhet mellan ordmängder
+
+    Orden sorteras före jämförelsen, så ordningen spelar ingen roll. Ord som
+    bara finns i den ena texten räknas fullt ut, så en avläsning som bara
+    täcker en del av referensen får inte full poäng.
+
+    Args:
+        partial: Jämför även de gemensamma orden mot vardera texten, så att en
+            delmängd får full poäng. Bara för identifiering, aldrig validering.
+    """
+    return _token_set_score(set(tokenize(a)), set(tokenize(b)), min_score, partial)
+
+
+def _token_set_score(tokens_a: set, tokens_b: set, min_score: float, partial: bool = False) -> float:
+    if not tokens_a or not tokens_b:
+        return 0.0
+
+    common = ' '.join(sorted(tokens_a & tokens_b))
+    only_a = ' '.join(sorted(tokens_a - tokens_b))
+    only_b = ' '.join(sorted(tokens_b - tokens_a))
+    with_a = f"{common} {only_a}".strip()
+    with_b = f"{common} {only_b}".strip()
+
+    best = levenshtein_ratio(with_a, with_b, min_score)
+    if partial and common:
+        for other in (with_a, with_b):
+            best = max(best, levenshtein_ratio(common, other, max(min_score, best)))
+    return best
+
+
+def text_similarity(text1: str, text2: str, min_score: float = 0.0, partial: bool = False) -> float:
+    """Likhet mellan två texter, 0.0-1.0
+
+    Högsta värdet av normaliserad Levenshtein och ordmängdslikhet.
+    Ord i fel ordning eller radbrytningar på andra ställen i OCR-resultatet
+    ger alltså inget straff, men ord som saknas eller tillkommit gör det.
+    Med partial=True får en delmängd av orden full poäng, vilket passar för
+    att hitta kandidater men inte för att godkänna en etikett.
+    """
+    a = normalize_text(text1)
+    b = normalize_text(text2)
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    char_score = levenshtein_ratio(a, b, min_score)
+    if char_score >= 1.0:
+        return 1.0
+    return max(char_score, token_set_ratio(a, b, max(min_score, char_score), partial))
+
+
+class ReferenceMatcher:
+    """Jämför en OCR-text mot många referenstexter
+
+    Referenserna normaliseras en gång. Vid jämförelse byggs bitmaskerna för
+    OCR-texten en gång och återanvänds mot alla referenser, och referenser
+    vars längd redan utesluter min_score hoppas över direkt.
+    """
+
+    def __init__(self, references: Sequence[str]):
+        self.references = list(references)
+        self._normalized = [normalize_text(r) for r in self.references]
+        self._tokens = [set(tokenize(r)) for r in self._normalized]
+        self._lengths = np.array([len(r) for r in self._normalized], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.references)
+
+    def scores(self, text: str, min_score: float = 0.0) -> np.ndarray:
+        """Likhet mot varje referens i samma ordning som references"""
+        query = normalize_text(text)
+        scores = np.zeros(len(self.references), dtype=np.float64)
+        if not self.references:
+            return scores
+
+        m = len(query)
+        longest = np.maximum(self._lengths, m)
+        # Längdskillnaden ensam ger en övre gräns för likheten
+        upper = np.where(longest > 0, 1.0 - np.abs(self._lengths - m) / np.maximum(longest, 1), 1.0)
+        masks = _pattern_masks(query) if m and _rf_levenshtein is None else None
+        query_tokens = set(tokenize(query))
+
+        for i, reference in enumerate(self._normalized):
+            if not reference or not query:
+                scores[i] = 1.0 if reference == query else 0.0
+                continue
+
+            if upper[i] >= min_score:
+                bound = _ratio_bound(int(longest[i]), min_score)
+                if masks is not None:
+                    distance = _myers_distance(masks, m, reference, bound)
+                else:
+                    distance = levenshtein(query, reference, bound)
+                if distance <= bound:
+                    scores[i] = 1.0 - distance / longest[i]
+
+            if scores[i] < 1.0:
+                token_score = _token_set_score(query_tokens, self._tokens[i], max(min_score, scores[i]))
+                scores[i] = max(scores[i], token_score)
+
+        return scores
+
+    def best(self, text: str, min_score: float = 0.0) -> Tuple[int, float]:
+        """Index och poäng för bästa referensen, (-1, 0.0) om ingen når min_score"""
+        scores = self.scores(text, min_score)
+        if not len(scores):
+            return -1, 0.0
+        index = int(np.argmax(scores))
+        if scores[index] < min_score or scores[index] == 0.0:
+            return -1, 0.0
+        return index, float(scores[index])
+
+
+def score_many(text: str, references: Sequence[str], min_score: float = 0.0) -> np.ndarray:
+    """Likhet mellan en text och en lista referenser"""
+    return ReferenceMatcher(references).scores(text, min_score)
@@ -3,13 +3,24 @@
 import cv2
 import numpy as np
 from dataclasses import dataclass
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, Hashable, List, Tuple
 import pytesseract
 from pyzbar.pyzbar import decode
 from ultralytics import YOLO
 import os
 import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
 from datetime import datetime
+from pathlib import Path
+from vision.barcode_ladder import DecodeLadder
+from vision.barcode_localizer import decode_localized
+from vision.inspection_policy import InspectionPolicy
+from vision.orientation import OrientationEstimator, tesseract_osd
+from vision.rectification import LabelRectifier
+from vision.registration import TemplateRegistration
 from labelvision.camera.camera_manager import CameraManager
 from labelvision.utils.test_image_generator import create_test_label
 
@@ -28,11 +39,25 @@ class InspectionResult:
 class VisionSystem:
     """Hanterar bildanalys och inspektion"""
     
-    def __init__(self, use_test_image: bool = False):
-        """Initierar vision-systemet"""
+    def __init__(self, use_test_image: bool = False, validations=None, outbox=None,
+                 reference_store=None, catalog=None):
+        """Initierar vision-systemet
+        
+        Args:
+            use_test_image: Använd testbild i stället för kamera
+            validations: DatabaseManager där underkända inspektioner sparas, None för ingen
+            outbox: InspectionOutbox som rapporterar inspektionerna till NiceLabel, None för ingen
+            reference_store: Laddat ReferenceStore som ger registreringsmallar, None för ingen
+            catalog: LabelCatalog som ger referens från streckkoden när ingen etikett är vald
+        """
         self.logger = logging.getLogger(__name__)
+        self.validations = validations
+        self.outbox = outbox
+        self.reference_store = reference_store
         self.total_inspections = 0
         self.passed_inspections = 0
+        self.failed_inspections = 0
+        self._stats_lock = threading.Lock()
         self.use_test_image = use_test_image
         
         # Initiera kamera
@@ -65,6 +90,22 @@ class VisionSystem:
             print(f"Varning: Kunde inte ladda YOLO-modell: {e}")
             self.model_available = False
         
+        # Referens för aktuell etikett och regler för när OCR behövs
+        self.current_label = None
+        self.catalog = catalog
+        self.policy = InspectionPolicy()
+        self.barcode_ladder = DecodeLadder(decode, budget_ms=30.0)
+        self.rectifier = LabelRectifier()
+        
+        # Textens orientering bestäms en gång per uppräthet etikett och spår
+        self.orientation = OrientationEstimator(osd=tesseract_osd)
+        self._track_rectifications = OrderedDict()
+        self._track_lock = threading.Lock()
+        
+        # Registreringsläge: med en referensmall kontrolleras bara de variabla fälten
+        self.registration = TemplateRegistration()
+        self.template = None
+        
         # Bildbehandlingsparametrar
         self.min_confidence = 30.0
         self.blur_kernel = (5, 5)
@@ -105,13 +146,18 @@ class VisionSystem:
         
     def detect_objects(self, image: np.ndarray) -> List[Dict]:
         """Detekterar objekt i bilden med YOLO"""
-        if not self.model_available:
-            return []
+        return self.detect_objects_batch([image])[0]
         
-        results = self.model(image)
-        detected_objects = []
+    def detect_objects_batch(self, images: List[np.ndarray]) -> List[List[Dict]]:
+        """Detekterar objekt i flera bilder med ett YOLO-anrop"""
+        if not self.model_available or not images:
+            return [[] for _ in images]
+            
+        results = self.model(images, verbose=False)
+        batch_objects = []
         
         for r in results:
+            detected_objects = []
             for box in r.boxes:
                 cls = int(box.cls[0])
                 conf = float(box.conf[0])
@@ -122,8 +168,9 @@ class VisionSystem:
                         'confidence': conf * 100,
                         'box': (int(x1), int(y1), int(x2-x1), int(y2-y1))
                     })
-                    
-        return detected_objects
+            batch_objects.append(detected_objects)
+            
+        return batch_objects
         
     def find_label_position(self, image: np.ndarray) -> Tuple[bool, Tuple[int, int, int, int]]:
         """Hittar etikettens position i bilden"""
@@ -150,13 +197,19 @@ class VisionSystem:
             
         return False, (0, 0, 0, 0)
         
-    def detect_text(self, image: np.ndarray) -> str:
-        """Förbättrad OCR-funktion med optimerade inställningar"""
+    def detect_text(self, image: np.ndarray, track_id: Optional[Hashable] = None) -> str:
+        """Förbättrad OCR-funktion med optimerade inställningar
+        
+        Args:
+            image: Uppräthet etikett
+            track_id: Id för den spårade etiketten, orienteringen cachas per id
+        """
         if not self.tesseract_available:
             return ""
             
-        # Förbehandla bilden
-        processed_image = self.preprocess_image(image)
+        # Vrid texten rättvänd och förbehandla bilden
+        upright = self.orientation.estimate(image, track_id).apply(image)
+        processed_image = self.preprocess_image(upright)
         
         try:
             # Utför OCR
@@ -177,13 +230,76 @@ class VisionSystem:
             self.logger.error(f"Fel vid hämtning av kamerabild: {str(e)}")
             return None
             
-    def inspect_image(self, image: np.ndarray) -> InspectionResult:
-        """Inspekterar en bild och returnerar resultat"""
+    def inspect_image(self, image: np.ndarray,
+                      objects: Optional[List[Dict]] = None,
+                      track_id: Optional[Hashable] = None) -> InspectionResult:
+        """Inspekterar en bild och returnerar resultat
+        
+        Underkända inspektioner sparas med bild om systemet har en
+        databashanterare för valideringar, och varje inspektion köas för
+        rapportering om systemet har en utkorg.
+        
+        Args:
+            image: Bild att inspektera
+            objects: Färdiga YOLO-detektioner, t.ex. från en batch. None kör detekteringen här.
+            track_id: Id för kameran eller stationen bilden kommer från. Upprätningen
+                återanvänds bara inom samma id; None räknar om den varje gång.
+        """
+        result = self._inspect_image(image, objects, track_id)
+        if not result.success and self.validations is not None:
+            self.save_failed_validation(image, result)
+        if self.outbox is not None:
+            self.report_inspection(result)
+        return result
+        
+    def report_inspection(self, result: InspectionResult) -> Optional[str]:
+        """Köar en inspektionsrapport i utkorgen, blockerar aldrig på nätverket
+        
+        Returns:
+            Rapportens idempotensnyckel, None om utkorgen är full
+        """
+        current = self.current_label or {}
+        return self.outbox.enqueue({
+            'label_id': current.get('label_id', ''),
+            'customer_id': current.get('customer_id', ''),
+            'status': 'OK' if result.success else 'FAIL',
+            'confidence': result.confidence,
+            'text': result.text,
+            'barcode': result.barcode,
+            'error': result.error,
+            'label_type': result.label_type,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    def save_failed_validation(self, image: np.ndarray, result: InspectionResult) -> Optional[int]:
+        """Sparar en underkänd inspektion; etikettens utsnitt hamnar i bildlagringen"""
+        current = self.current_label or {}
+        x, y, w, h = result.position
+        try:
+            return self.validations.save_validation_result({
+                'timestamp': datetime.now(),
+                'label_name': current.get('label_id') or current.get('name') or result.label_type,
+                'customer_id': current.get('customer_id', ''),
+                'expected_text': current.get('text', ''),
+                'detected_text': result.text,
+                'valid': False,
+                'confidence': result.confidence,
+                'error': result.error,
+                'metadata': {'barcode': result.barcode},
+                'image': image,
+                'roi': (x, y, x + w, y + h) if w and h else None
+            })
+        except Exception as e:
+            self.logger.error(f"Kunde inte spara underkänd validering: {str(e)}")
+            return None
+            
+    def _inspect_image(self, image: np.ndarray, objects: Optional[List[Dict]],
+                       track_id: Optional[Hashable]) -> InspectionResult:
         try:
             result = InspectionResult()
             
             # Hitta objekt med YOLO
-            result.objects = self.detect_objects(image)
+            result.objects = objects if objects is not None else self.detect_objects(image)
             
             # Hitta etikettens position
             found, position = self.find_label_position(image)
@@ -195,23 +311,51 @@ class VisionSystem:
             result.position = position
             x, y, w, h = position
             
-            # Extrahera etikettområdet
-            label_roi = image[y:y+h, x:x+w]
+            # Räta upp etikettområdet till etikettypens fasta storlek. Transformen
+            # återanvänds så länge etiketten ligger still under samma kamera.
+            current = self.current_label or {}
+            label_type = current.get('label_type') or current.get('type') or ""
+            rectification = self.rectifier.rectify(image, (x, y, x + w, y + h), label_type, track_id)
+            label_roi = rectification.warp(image) if rectification is not None else None
+            if label_roi is None:
+                label_roi = image[y:y+h, x:x+w]
+            self._track_label(track_id, rectification)
+                
+            template = self.template or self.identify_template(label_roi)
+            if template is not None:
+                return self._inspect_registered(label_roi, result, template)
             
+            # Streckkodsavläsning först, den avgör oftast etiketten utan OCR.
+            # Stegen av förbehandlingar delar en tidsbudget för hela bilden.
+            deadline = time.perf_counter() + self.barcode_ladder.budget_ms / 1000.0
+            barcodes = decode_localized(label_roi, lambda crop: self.barcode_ladder(crop, label_type, deadline))
+            if barcodes:
+                result.barcode = barcodes[0]['data']
+                
+            reference = self.get_reference(result.barcode)
+            decision = self.policy.evaluate_barcode(result.barcode, reference)
+            if decision.readable and not decision.needs_ocr:
+                result.success = bool(decision.matches)
+                result.confidence = 100.0 if decision.matches else 0.0
+                if not decision.matches:
+                    result.error = decision.reason
+                self.update_statistics(result.success)
+                return result
+                
             # OCR-analys
-            result.text = self.detect_text(label_roi)
+            result.text = self.detect_text(label_roi, track_id)
+            
+            # Utan vald etikett och streckkodsträff identifieras etiketten på texten
+            if reference is None and result.text:
+                reference = self.get_reference(result.barcode, result.text)
+                if reference is not None:
+                    decision = self.policy.evaluate_barcode(result.barcode, reference)
             
             # Beräkna OCR-konfidens
             if result.text:
                 result.confidence = self.calculate_confidence(result.text)
                 
-            # Streckkodsavläsning
-            barcodes = decode(label_roi)
-            if barcodes:
-                result.barcode = barcodes[0].data.decode('utf-8')
-                barcode_confidence = 100.0
-            else:
-                barcode_confidence = 0.0
+            barcode_confidence = 100.0 if result.barcode else 0.0
                 
             # Beräkna total konfidens
             if result.text and result.barcode:
@@ -224,6 +368,17 @@ class VisionSystem:
             # Bestäm om inspektionen lyckades
             result.success = bool(result.text or result.barcode) and result.confidence >= self.min_confidence
             
+            # Finns referenstext måste texten stämma med den
+            text_score = self.policy.text_score(result.text, reference)
+            if text_score is not None:
+                result.confidence = text_score * 100.0
+                if text_score < self.policy.text_threshold:
+                    result.success = False
+                    result.error = "Texten stämmer inte med referensen"
+            if decision.matches is False:
+                result.success = False
+                result.error = decision.reason
+                
             # Uppdatera statistik
             self.update_statistics(result.success)
             
@@ -238,13 +393,106 @@ class VisionSystem:
             self.update_statistics(False)
             return result
             
+    def _track_label(self, track_id: Optional[Hashable], rectification):
+        """Glöm spårets orientering när upprätningen räknats om
+        
+        En ny transform betyder att etiketten flyttats eller bytts ut, så
+        den cachade orienteringen gäller inte längre.
+        """
+        if track_id is None:
+            return
+        with self._track_lock:
+            if self._track_rectifications.get(track_id) is not rectification:
+                self._track_rectifications[track_id] = rectification
+                self.orientation.invalidate(track_id)
+            self._track_rectifications.move_to_end(track_id)
+            while len(self._track_rectifications) > self.rectifier.max_entries:
+                self._track_rectifications.popitem(last=False)
+                
+    def identify_template(self, label_roi: np.ndarray):
+        """Mall för referensen som känns igen i referenslagret när ingen etikett är vald"""
+        if self.reference_store is None or self.current_label is not None:
+            return None
+        label_id = self.reference_store.identify(label_roi)
+        return self.reference_store.template(label_id) if label_id is not None else None
+        
+    def _inspect_registered(self, label_roi: np.ndarray, result: InspectionResult,
+                            template) -> InspectionResult:
+        """Inspektera mot referensmallen: layouten med bilddiff, bara fälten med OCR"""
+        def read_barcode(crop):
+            found = self.barcode_ladder(crop, template.label_id)
+            return found[0].data.decode('utf-8') if found else ""
+            
+        registered = self.registration.inspect(label_roi, template, self.detect_text, read_barcode)
+        result.success = registered.passed
+        result.error = registered.error
+        result.text = "\n".join(z.value for z in registered.zones if z.kind != 'barcode' and z.value)
+        result.barcode = next((z.value for z in registered.zones if z.kind == 'barcode'), "")
+        if registered.zones:
+            result.confidence = 100.0 * sum(z.score for z in registered.zones) / len(registered.zones)
+        else:
+            result.confidence = 100.0 if registered.passed else 0.0
+        self.update_statistics(result.success)
+        return result
+        
+    def set_template(self, template):
+        """Anger referensmall för registreringsläget, None för vanlig inspektion"""
+        self.template = template
+        
+    def set_current_label(self, label_info: Optional[Dict]):
+        """Anger referensdata (text, streckkod) för etiketten som inspekteras
+        
+        Finns en referensbild för etiketten laddas dess mall, så att
+        etiketten inspekteras i registreringsläget.
+        """
+        self.current_label = label_info
+        self.set_template(self.load_template(label_info) if label_info else None)
+        
+    def load_template(self, label_info: Dict):
+        """Referensmall för en etikett, None om den saknar referensbild
+        
+        Mallen tas i första hand från referenslagret, på etikettens id eller
+        på sökvägen till etikettfilen (Labels/Kund/123.nlbl finns i lagret
+        som Kund/123). Annars läses en exporterad referensbild direkt.
+        """
+        label_id = str(label_info.get('label_id') or '')
+        path = label_info.get('path') or ''
+        if self.reference_store is not None:
+            parts = Path(path).with_suffix('').parts if path else ()
+            candidates = [label_id] + ['/'.join(parts[i:]) for i in range(len(parts))]
+            for candidate in candidates:
+                if candidate and self.reference_store.get(candidate) is not None:
+                    return self.reference_store.template(candidate)
+                    
+        if Path(path).suffix.lower() in ('.png', '.jpg', '.jpeg') and os.path.exists(path):
+            try:
+                return self.registration.load_template(path, label_id or None)
+            except ValueError as e:
+                self.logger.warning(f"Kunde inte läsa referensmall: {str(e)}")
+        return None
+        
+    def get_reference(self, barcode: str = "", text: str = "") -> Optional[Dict]:
+        """Referens för inspektionen
+        
+        Vald etikett i första hand, annars katalogens träff på streckkoden
+        och sist den etikett vars text bäst liknar OCR-texten.
+        """
+        if self.current_label is not None:
+            return self.current_label
+        if self.catalog is not None:
+            label = self.catalog.find_reference(barcode, text)
+            if label is not None:
+                return asdict(label)
+        return None
+        
     def update_statistics(self, success: bool):
         """Uppdaterar inspektionsstatistik"""
-        self.total_inspections += 1
-        if success:
-            self.passed_inspections += 1
-        else:
-            self.failed_inspections += 1
+        with self._stats_lock:
+            self.total_inspections += 1
+            if success:
+                self.passed_inspections += 1
+            else:
+                self.failed_inspections += 1
             
     def get_statistics(self) -> Dict:
         """Returnerar inspektionsstatistik"""